@@ -0,0 +1,124 @@
+# coding=utf8
+
+import threading
+import unittest
+
+from uvent.loop import UVLoop
+
+
+class AsyncTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = UVLoop(default=False)
+        if self.loop._signal_checker is not None:
+            # Only the watchers under test keep the loop alive
+            self.loop._signal_checker.unref()
+
+    def tearDown(self):
+        self.loop.destroy()
+
+    def test_threads(self):
+        # Every watcher is sent through the loop's single Async handle
+        watchers = [self.loop.async() for _ in range(100)]
+        called = []
+
+        def callback(watcher):
+            called.append(watcher)
+            watcher.stop()
+        for watcher in watchers:
+            watcher.start(callback, watcher)
+        threads = [threading.Thread(target=watcher.send) for watcher in watchers]
+        for thread in threads:
+            thread.start()
+        self.loop.run()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(called), sorted(watchers))
+
+    def test_batched(self):
+        # Watchers sent before the loop wakes up all run from the same Async callback
+        watchers = [self.loop.async() for _ in range(20)]
+        iterations = []
+        for watcher in watchers:
+            watcher.start(lambda watcher: iterations.append(watcher.stop() or self.loop.iteration), watcher)
+            watcher.send()
+        self.loop.run()
+        self.assertEqual(len(iterations), 20)
+        self.assertEqual(len(set(iterations)), 1)
+
+    def test_coalesced(self):
+        watcher = self.loop.async()
+        called = []
+        watcher.start(lambda: called.append(watcher.stop()))
+        for _ in range(10):
+            watcher.send()
+        self.loop.run()
+        self.assertEqual(len(called), 1)
+
+    def test_sent_by_callback(self):
+        # A watcher sent again by its callback runs in the next iteration
+        watcher = self.loop.async()
+        iterations = []
+
+        def callback():
+            iterations.append(self.loop.iteration)
+            if len(iterations) < 3:
+                watcher.send()
+            else:
+                watcher.stop()
+        watcher.start(callback)
+        self.loop.stats()
+        watcher.send()
+        self.loop.run()
+        self.assertEqual(len(set(iterations)), 3)
+
+    def test_sent_while_stopped(self):
+        watcher = self.loop.async()
+        called = []
+        watcher.send()
+        watcher.start(lambda: called.append(True))
+        watcher.stop()
+        watcher.send()
+        self.loop.run()
+        self.assertEqual(called, [])
+
+    def test_ref(self):
+        watcher = self.loop.async(ref=False)
+        watcher.start(lambda: None)
+        # Only referenced watchers keep the loop alive
+        self.loop.run()
+        watcher.ref = True
+        threading.Timer(0.01, watcher.send).start()
+        watcher.start(watcher.stop)
+        self.loop.run()
+        self.assertFalse(watcher.active)
+
+    def test_run_callback_threadsafe(self):
+        results = []
+        keepalive = self.loop.async()
+        keepalive.start(lambda: None)
+
+        def callback(i):
+            results.append(i)
+            if len(results) == 50:
+                keepalive.stop()
+        threads = [threading.Thread(target=self.loop.run_callback_threadsafe, args=(callback, i)) for i in range(50)]
+        for thread in threads:
+            thread.start()
+        self.loop.run()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(results), range(50))
+
+    def test_destroyed_loop(self):
+        watcher = self.loop.async()
+        watcher.start(lambda: None)
+        self.loop.destroy()
+        # As with libev, sending to the watcher of a destroyed loop does nothing
+        watcher.send()
+        self.assertRaises(RuntimeError, self.loop.run_callback_threadsafe, lambda: None)
+        self.loop = UVLoop(default=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+# coding=utf8
+
+import errno
+import os
+import shutil
+import tempfile
+import unittest
+
+import gevent
+
+import uvent
+
+
+class FileObjectTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        uvent.install()
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'file')
+        self.data = b''.join(b'line %d\n' % i for i in range(20000))
+        with open(self.path, 'wb') as f:
+            f.write(self.data)
+        self.timeout = gevent.Timeout.start_new(10)
+
+    def tearDown(self):
+        self.timeout.cancel()
+        shutil.rmtree(self.dir)
+
+    def open(self, *args, **kwargs):
+        from uvent.fileobject import FileObject
+        return FileObject(*args, **kwargs)
+
+    def test_read(self):
+        with self.open(self.path, 'rb') as f:
+            self.assertEqual(f.read(10), self.data[:10])
+            self.assertEqual(f.read(100000), self.data[10:100010])
+            self.assertEqual(f.tell(), 100010)
+            self.assertEqual(f.read(), self.data[100010:])
+            self.assertEqual(f.read(), b'')
+
+    def test_split_requests(self):
+        with self.open(self.path, 'rb', bufsize=0) as f:
+            f.max_request_size = 4096
+            self.assertEqual(f.read(), self.data)
+        with self.open(self.path, 'rb', bufsize=0) as f:
+            f.max_request_size = 4096
+            self.assertEqual(f.read(50000), self.data[:50000])
+
+    def test_readline(self):
+        with self.open(self.path, 'rb', bufsize=100) as f:
+            self.assertEqual(f.readline(), b'line 0\n')
+            self.assertEqual(f.readline(3), b'lin')
+            self.assertEqual(f.readline(), b'e 1\n')
+            self.assertEqual(list(f), self.data.splitlines(True)[2:])
+
+    def test_readinto(self):
+        buf = bytearray(100000)
+        with self.open(self.path, 'rb') as f:
+            self.assertEqual(f.read(5), self.data[:5])
+            self.assertEqual(f.readinto(buf), len(buf))
+            self.assertEqual(bytes(buf), self.data[5:100005])
+            self.assertEqual(f.read(5), self.data[100005:100010])
+
+    def test_seek(self):
+        with self.open(self.path, 'rb') as f:
+            f.read(10)
+            f.seek(-5, os.SEEK_CUR)
+            self.assertEqual(f.read(5), self.data[5:10])
+            f.seek(-7, os.SEEK_END)
+            self.assertEqual(f.read(), self.data[-7:])
+            f.seek(100)
+            self.assertEqual(f.tell(), 100)
+            self.assertEqual(f.read(3), self.data[100:103])
+
+    def test_write(self):
+        path = os.path.join(self.dir, 'written')
+        with self.open(path, 'wb', bufsize=16) as f:
+            f.write(b'short')
+            self.assertEqual(f.tell(), 5)
+            f.write(self.data)
+            f.writelines([b'a', b'b'])
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'short' + self.data + b'ab')
+
+    def test_write_after_read(self):
+        # Writing starts at the logical position, not after what was read ahead
+        with self.open(self.path, 'r+b') as f:
+            self.assertEqual(f.read(5), self.data[:5])
+            f.write(b'XY')
+            self.assertEqual(f.read(3), self.data[7:10])
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(10), self.data[:5] + b'XY' + self.data[7:10])
+
+    def test_append(self):
+        with self.open(self.path, 'ab') as f:
+            f.write(b'end')
+            f.flush()
+            self.assertEqual(f.tell(), len(self.data) + 3)
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), self.data + b'end')
+
+    def test_truncate(self):
+        with self.open(self.path, 'r+b') as f:
+            f.seek(10)
+            f.truncate()
+            self.assertEqual(f.stat().st_size, 10)
+        self.assertEqual(os.path.getsize(self.path), 10)
+
+    def test_pipe(self):
+        r, w = os.pipe()
+        writer = self.open(w, 'wb', bufsize=0)
+        reader = self.open(r, 'rb')
+        writer.write(b'through the pipe')
+        writer.close()
+        self.assertEqual(reader.read(), b'through the pipe')
+        reader.close()
+
+    def test_file_object(self):
+        fobj = open(self.path, 'rb')
+        with self.open(fobj, close=False) as f:
+            self.assertEqual(f.read(4), self.data[:4])
+        self.assertFalse(fobj.closed)
+        self.assertEqual(fobj.tell(), 4)
+        fobj.close()
+
+    def test_errors(self):
+        with self.assertRaises(IOError) as cm:
+            self.open(os.path.join(self.dir, 'missing'))
+        self.assertEqual(cm.exception.errno, errno.ENOENT)
+        f = self.open(self.path, 'rb')
+        self.assertRaises(IOError, f.write, b'x')
+        f.close()
+        self.assertRaises(ValueError, f.read)
+
+    def test_close(self):
+        # Each close used to drop a reference to the pyuv loop, until it was freed
+        for _ in range(300):
+            self.open(self.path).close()
+        fd = os.open(self.path, os.O_RDONLY)
+        f = self.open(fd)
+        os.close(fd)
+        with self.assertRaises(IOError) as cm:
+            f.close()
+        self.assertEqual(cm.exception.errno, errno.EBADF)
+        self.assertTrue(f.closed)
+
+    def test_cooperative(self):
+        ticks = []
+        ticker = gevent.spawn(lambda: [ticks.append(gevent.sleep(0)) for _ in range(5)])
+        with self.open(self.path, 'rb', bufsize=0) as f:
+            f.max_request_size = 4096
+            f.read()
+        ticker.join()
+        self.assertEqual(len(ticks), 5)
+
+    def test_patch(self):
+        import gevent.fileobject
+        from uvent.fileobject import FileObject
+        saved = gevent.fileobject.FileObject
+        try:
+            uvent.patch_fileobject()
+            self.assertIs(gevent.fileobject.FileObject, FileObject)
+        finally:
+            gevent.fileobject.FileObject = saved
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+# coding=utf8
+
+import unittest
+
+import pyuv
+
+from uvent.loop import UVLoop
+from uvent.util import SharedTimer
+
+
+class HandlePoolTest(unittest.TestCase):
+
+    loop_class = UVLoop
+    timer_type = pyuv.Timer
+
+    def setUp(self):
+        self.loop = self.loop_class(default=False)
+        if self.loop._signal_checker is not None:
+            # Only the handles under test keep the loop alive
+            self.loop._signal_checker.unref()
+
+    def tearDown(self):
+        self.loop.destroy()
+
+    def alive(self):
+        return self.loop._loop.run(pyuv.UV_RUN_NOWAIT)
+
+    def test_reuse(self):
+        timer = self.loop.timer(5)
+        timer.start(lambda: None)
+        handle = timer._handle
+        self.assertTrue(isinstance(handle, self.timer_type))
+        timer.stop()
+        self.assertTrue(timer._handle is None)
+        self.assertFalse(handle.active)
+        other = self.loop.timer(1)
+        other.start(lambda: None)
+        self.assertTrue(other._handle is handle)
+        self.assertTrue(handle.watcher is other)
+        other.stop()
+        stats = self.loop.stats()
+        self.assertEqual((stats['handle_pool_hits'], stats['handle_pool_misses']), (1, 1))
+        self.assertEqual(stats['pooled_handles'], 1)
+
+    def test_pooled_handles_are_referenced(self):
+        self.assertFalse(self.alive())
+        timer = self.loop.timer(5, ref=False)
+        timer.start(lambda: None)
+        self.assertFalse(self.alive())
+        timer.stop()
+        other = self.loop.timer(5)
+        other.start(lambda: None)
+        self.assertTrue(other._handle is not None and self.loop.stats()['handle_pool_hits'] == 1)
+        self.assertTrue(self.alive())
+        other.stop()
+        self.assertFalse(self.alive())
+
+    def test_ref_while_started(self):
+        timer = self.loop.timer(5)
+        timer.start(lambda: None)
+        timer.ref = False
+        self.assertFalse(self.alive())
+        timer.ref = True
+        self.assertTrue(self.alive())
+        timer.stop()
+
+    def test_callback_after_reuse(self):
+        fired = []
+        timer = self.loop.timer(0)
+        timer.start(fired.append, 1)
+        timer.stop()
+        other = self.loop.timer(0)
+        other.start(fired.append, 2)
+        while not fired:
+            self.loop.run(once=True)
+        self.assertEqual(fired, [2])
+        self.assertFalse(other.active)
+
+    def test_pool_size(self):
+        self.loop.handle_pool_size = 3
+        timers = [self.loop.timer(1) for i in xrange(10)]
+        for timer in timers:
+            timer.start(lambda: None)
+        for timer in timers:
+            timer.stop()
+        self.assertEqual(self.loop.stats()['pooled_handles'], 3)
+        self.loop.handle_pool_size = 0
+        timer = self.loop.timer(1)
+        timer.start(lambda: None)
+        handle = timer._handle
+        timer.stop()
+        self.assertTrue(handle.closed)
+        self.assertEqual(self.loop.stats()['pooled_handles'], 2)
+
+    def test_other_watchers(self):
+        for factory in (self.loop.prepare, self.loop.idle, self.loop.check):
+            fired = []
+            watcher = factory()
+            watcher.start(lambda: (fired.append(1), watcher.stop()))
+            handle = watcher._handle
+            self.loop.run(nowait=True)
+            self.assertEqual(fired, [1])
+            self.assertFalse(watcher.active)
+            watcher.start(lambda: None)
+            self.assertTrue(watcher._handle is handle)
+            watcher.stop()
+
+
+class WheelLoop(UVLoop):
+    timer_resolution = 0.001
+
+
+class SharedTimerPoolTest(HandlePoolTest):
+
+    loop_class = WheelLoop
+    timer_type = SharedTimer
+
+
+if __name__ == '__main__':
+    unittest.main()
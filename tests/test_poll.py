@@ -0,0 +1,201 @@
+# coding=utf8
+
+import gc
+import socket
+import unittest
+
+import pyuv
+
+from uvent.loop import UVLoop
+
+
+class CountingPoll(object):
+    """Wraps the pyuv.Poll handle of a dispatcher and counts the calls changing its events."""
+
+    def __init__(self, poll):
+        self.poll = poll
+        self.calls = []
+
+    def start(self, events, callback):
+        self.calls.append(events)
+        self.poll.start(events, callback)
+
+    def stop(self):
+        self.calls.append(0)
+        self.poll.stop()
+
+    def __getattr__(self, name):
+        return getattr(self.poll, name)
+
+
+class PollDispatcherTest(unittest.TestCase):
+
+    loop_class = UVLoop
+
+    def setUp(self):
+        self.loop = self.loop_class(default=False)
+        if self.loop._signal_checker is not None:
+            # Only the watchers under test keep the loop alive
+            self.loop._signal_checker.unref()
+        self.a, self.b = socket.socketpair()
+        self.fd = self.a.fileno()
+
+    def tearDown(self):
+        self.loop.destroy()
+        self.a.close()
+        self.b.close()
+
+    def watch(self, events, called, stop=True):
+        watcher = self.loop.io(self.fd, events)
+
+        def callback():
+            called.append(watcher)
+            if stop:
+                watcher.stop()
+        watcher.start(callback)
+        return watcher
+
+    def dispatcher(self):
+        return self.loop._loop._poll_handles[self.fd]
+
+    def test_readers_and_writers(self):
+        called = []
+        readers = [self.watch(1, called) for _ in range(3)]
+        writer = self.watch(2, called)
+        dispatcher = self.dispatcher()
+        self.assertEqual(len(self.loop._loop._poll_handles), 1)
+        self.assertIsNone(dispatcher.reader)
+        self.assertIs(dispatcher.writer, writer._handle)
+        self.assertEqual(dispatcher.mask, pyuv.UV_READABLE | pyuv.UV_WRITABLE)
+        self.b.send(b'x')
+        self.loop.run()
+        self.assertEqual(sorted(called), sorted(readers + [writer]))
+        self.assertFalse(dispatcher.poll.active)
+
+    def test_single_reader(self):
+        called = []
+        readers = [self.watch(1, called, stop=False) for _ in range(2)]
+        dispatcher = self.dispatcher()
+        self.assertIsNone(dispatcher.reader)
+        readers[0].stop()
+        # The only reader is called without going through the set
+        self.assertIs(dispatcher.reader, readers[1]._handle)
+        self.b.send(b'x')
+        self.loop.run(once=True)
+        self.assertEqual(called, [readers[1]])
+        readers[1].stop()
+        self.assertIsNone(dispatcher.reader)
+
+    def test_mask_unchanged(self):
+        called = []
+        first = self.watch(1, called, stop=False)
+        dispatcher = self.dispatcher()
+        poll = dispatcher.poll = CountingPoll(dispatcher.poll)
+        # Watchers of events which are already polled for don't touch the handle
+        others = [self.watch(1, called, stop=False) for _ in range(10)]
+        for watcher in others:
+            watcher.stop()
+        self.assertEqual(poll.calls, [])
+        writer = self.watch(2, called)
+        first.stop()
+        self.assertEqual(poll.calls, [pyuv.UV_READABLE | pyuv.UV_WRITABLE, pyuv.UV_WRITABLE])
+        writer.stop()
+        self.assertEqual(poll.calls[-1], 0)
+
+    def test_callback_stops_other(self):
+        called = []
+        first = self.loop.io(self.fd, 1)
+        second = self.loop.io(self.fd, 1)
+
+        def callback(watcher, other):
+            called.append(watcher)
+            watcher.stop()
+            other.stop()
+        first.start(callback, first, second)
+        second.start(callback, second, first)
+        self.b.send(b'x')
+        self.loop.run()
+        self.assertEqual(len(called), 1)
+
+    def test_close(self):
+        called = []
+        reader = self.watch(1, called)
+        writer = self.loop.io(self.fd, 2)
+        handle = writer._handle
+        dispatcher = self.dispatcher()
+        handle.close()
+        self.assertEqual(handle.fileno, -1)
+        self.assertRaises(pyuv.error.HandleError, handle.start, pyuv.UV_WRITABLE, lambda: None)
+        del writer, handle
+        gc.collect()
+        # Closing an instance again (as __del__ does) doesn't close the handle the others use
+        self.assertEqual(dispatcher.count, 1)
+        self.assertIs(self.dispatcher(), dispatcher)
+        self.b.send(b'x')
+        self.loop.run()
+        self.assertEqual(called, [reader])
+        reader._handle.close()
+        self.assertEqual(self.loop._loop._poll_handles, {})
+        self.assertIsNone(dispatcher.poll)
+
+
+
+class BatchingLoop(UVLoop):
+    deferred_poll_updates = True
+
+
+class PollBatcherTest(PollDispatcherTest):
+
+    loop_class = BatchingLoop
+
+    def test_mask_unchanged(self):
+        called = []
+        first = self.watch(1, called, stop=False)
+        dispatcher = self.dispatcher()
+        poll = dispatcher.poll = CountingPoll(dispatcher.poll)
+        self.loop.run(nowait=True)
+        self.assertEqual(poll.calls, [pyuv.UV_READABLE])
+        # Only the mask at the end of the iteration is applied
+        writer = self.watch(2, called, stop=False)
+        first.stop()
+        writer.stop()
+        first.start(lambda: None)
+        self.assertEqual(poll.calls, [pyuv.UV_READABLE])
+        self.loop.run(nowait=True)
+        self.assertEqual(poll.calls, [pyuv.UV_READABLE])
+        writer.start(lambda: None)
+        self.loop.run(nowait=True)
+        self.assertEqual(poll.calls, [pyuv.UV_READABLE, pyuv.UV_READABLE | pyuv.UV_WRITABLE])
+        first.stop()
+        writer.stop()
+
+    def test_saved(self):
+        called = []
+        batcher = self.loop._loop._poll_batcher
+        watchers = [self.watch(1, called, stop=False) for _ in range(5)]
+        self.assertEqual(batcher.saved, 0)
+        # Would block on recv, then on send, then recv again
+        for _ in range(3):
+            watchers[0].events = 2
+            watchers[0].events = 1
+        self.loop.run(nowait=True)
+        self.assertEqual(batcher.updates, 1)
+        self.assertEqual(batcher.saved, batcher.changes - 1)
+        self.assertEqual(self.loop.stats()['poll_updates_saved'], batcher.saved)
+        for watcher in watchers:
+            watcher.stop()
+
+    def test_keeps_loop_alive(self):
+        # A pending change keeps the loop running until it's applied
+        batcher = self.loop._loop._poll_batcher
+        called = []
+        reader = self.watch(1, called, stop=False)
+        reader.stop()
+        self.assertTrue(batcher._dirty)
+        self.loop.run()
+        self.assertFalse(batcher._dirty)
+        self.assertEqual(called, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
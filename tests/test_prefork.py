@@ -0,0 +1,207 @@
+# coding=utf8
+
+import os
+import signal
+import socket
+import time
+import unittest
+
+import gevent
+import gevent.socket
+
+import uvent
+
+
+def reap(pid):
+    try:
+        os.waitpid(pid, 0)
+    except OSError:
+        # Reaped by libuv, once the hub's loop spawned a process
+        pass
+
+
+def run_forked(func):
+    """Run func in a child process forked from the running hub and return the repr of its result."""
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(r)
+            result = repr(func())
+        except BaseException as e:
+            result = 'raised %r' % (e, )
+        os.write(w, result)
+        os._exit(0)
+    os.close(w)
+    chunks = []
+    while True:
+        chunk = os.read(r, 65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    os.close(r)
+    reap(pid)
+    return b''.join(chunks)
+
+
+class ReinitTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        uvent.install()
+
+    def setUp(self):
+        self.timeout = gevent.Timeout.start_new(10)
+
+    def tearDown(self):
+        self.timeout.cancel()
+
+    def test_same_process(self):
+        loop = gevent.get_hub().loop
+        pyuv_loop = loop._loop
+        gevent.reinit()
+        self.assertIs(loop._loop, pyuv_loop)
+
+    def test_python_signal_handlers(self):
+        # Signals with a Python handler wake up the loop every time, not just the first one
+        import gevent.event
+        event = gevent.event.Event()
+        old_handler = signal.signal(signal.SIGUSR2, lambda signum, frame: event.set())
+        try:
+            for _ in range(3):
+                event.clear()
+                pid = os.fork()
+                if pid == 0:
+                    time.sleep(0.05)
+                    os.kill(os.getppid(), signal.SIGUSR2)
+                    os._exit(0)
+                self.assertTrue(event.wait(2))
+                reap(pid)
+            self.assertTrue(gevent.get_hub().loop._signal_checker.active)
+        finally:
+            signal.signal(signal.SIGUSR2, old_handler)
+
+    def test_watchers_in_child(self):
+        loop = gevent.get_hub().loop
+        forked = []
+        fork_watcher = loop.fork(ref=False)
+        fork_watcher.start(lambda: forked.append(os.getpid()))
+        timer = gevent.spawn_later(0.1, lambda: 'timer')
+        a, b = gevent.socket.socketpair()
+        reader = gevent.spawn(a.recv, 10)
+        gevent.sleep(0.01)
+
+        def child():
+            gevent.reinit()
+            b.send(b'child')
+            results = [reader.get(), timer.get()]
+            gevent.sleep(0.01)
+            results.append(forked == [os.getpid()])
+            signalled = []
+            watcher = loop.signal(signal.SIGUSR1)
+            watcher.start(lambda: signalled.append(True))
+            os.kill(os.getpid(), signal.SIGUSR1)
+            gevent.sleep(0.05)
+            results.append(signalled)
+            results.append(gevent.get_hub().threadpool.apply(lambda: 'threadpool'))
+            return results
+        self.assertEqual(run_forked(child), repr([b'child', 'timer', True, [True], 'threadpool']))
+        # The parent's loop is not affected by what the child did
+        self.assertFalse(forked)
+        self.assertFalse(reader.ready())
+        b.send(b'parent')
+        self.assertEqual(reader.get(), b'parent')
+        self.assertEqual(timer.get(), 'timer')
+        fork_watcher.stop()
+        a.close()
+        b.close()
+
+
+class PreforkTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        uvent.install()
+
+    def start(self, **kwargs):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        self.address = sock.getsockname()
+        sock.close()
+        pid = os.fork()
+        if pid == 0:
+            # The supervisor's signal handlers must not wake up this process through a shared signal pipe
+            gevent.reinit()
+            from gevent.server import StreamServer
+            from uvent import prefork
+
+            def handle(sock, address):
+                sock.sendall(b'%d' % os.getpid())
+                sock.close()
+
+            def worker(listener):
+                StreamServer(listener, handle).serve_forever()
+            try:
+                prefork.run(self.address, worker, **kwargs)
+            finally:
+                os._exit(0)
+        self.supervisor = pid
+        self.addCleanup(self.stop)
+
+    def stop(self):
+        if self.supervisor is not None:
+            os.kill(self.supervisor, signal.SIGTERM)
+            _, status = os.waitpid(self.supervisor, 0)
+            self.supervisor = None
+            return status
+
+    def request(self):
+        # Plain sockets and time.sleep: this process' loop doesn't run while the workers are asked
+        deadline = time.time() + 5
+        while True:
+            try:
+                sock = socket.create_connection(self.address)
+            except socket.error:
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.02)
+                continue
+            try:
+                return int(sock.recv(100))
+            finally:
+                sock.close()
+
+    def workers(self, requests=200):
+        return set(self.request() for _ in range(requests))
+
+    def test_reuse_port(self):
+        self.start(processes=3)
+        self.request()
+        time.sleep(0.2)
+        self.assertEqual(len(self.workers()), 3)
+        self.assertEqual(self.stop(), 0)
+
+    def test_shared_socket(self):
+        self.start(processes=2, reuse_port=False)
+        self.assertTrue(self.workers())
+        self.assertEqual(self.stop(), 0)
+
+    def test_respawn(self):
+        self.start(processes=1)
+        first = self.request()
+        os.kill(first, signal.SIGKILL)
+        deadline = time.time() + 5
+        while True:
+            try:
+                second = self.request()
+            except (socket.error, ValueError):
+                second = first
+            if second != first or time.time() > deadline:
+                break
+            time.sleep(0.05)
+        self.assertNotEqual(second, first)
+        self.assertEqual(self.stop(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
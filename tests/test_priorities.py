@@ -0,0 +1,80 @@
+# coding=utf8
+
+import os
+import unittest
+
+from uvent.loop import UVLoop
+
+
+class PriorityTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = UVLoop(default=False)
+        self.order = []
+        self.fds = []
+
+    def tearDown(self):
+        self.loop.destroy()
+        for fd in self.fds:
+            os.close(fd)
+
+    def run_loop(self):
+        for i in xrange(3):
+            self.loop.run(nowait=True)
+
+    def readable_fd(self):
+        rfd, wfd = os.pipe()
+        self.fds += [rfd, wfd]
+        os.write(wfd, b'x')
+        return rfd
+
+    def test_run_callback_priorities(self):
+        for priority in (0, -2, 2, 1, -1, 5, -5):
+            self.loop.run_callback(self.order.append, priority, priority=priority)
+        self.run_loop()
+        self.assertEqual(self.order, [2, 5, 1, 0, -1, -2, -5])
+
+    def test_run_callback_bad_keyword(self):
+        self.assertRaises(TypeError, self.loop.run_callback, self.order.append, 1, bogus=1)
+
+    def test_watchers_in_priority_order(self):
+        watchers = []
+        for priority in (-2, 0, 2, 1, -1):
+            watcher = self.loop.io(self.readable_fd(), 1, priority=priority)
+            watcher.start(self.fired, watcher, priority)
+            watchers.append(watcher)
+        self.assertEqual(self.loop._prioritized, 4)
+        self.run_loop()
+        self.assertEqual(self.order, [2, 1, 0, -1, -2])
+        self.assertEqual(self.loop._prioritized, 0)
+
+    def fired(self, watcher, priority):
+        watcher.stop()
+        self.order.append(priority)
+
+    def test_priority_setter(self):
+        watcher = self.loop.io(self.readable_fd(), 1)
+        watcher.start(self.fired, watcher, 0)
+        self.assertEqual(self.loop._prioritized, 0)
+        watcher.priority = 5
+        self.assertEqual(watcher.priority, UVLoop.MAXPRI)
+        self.assertEqual(self.loop._prioritized, 1)
+        watcher.priority = 0
+        self.assertEqual(self.loop._prioritized, 0)
+        watcher.priority = -1
+        watcher.stop()
+        self.assertEqual(self.loop._prioritized, 0)
+
+    def test_stop_cancels_pending(self):
+        low = self.loop.io(self.readable_fd(), 1, priority=-1)
+        high = self.loop.io(self.readable_fd(), 1, priority=1)
+        low.start(self.fired, low, 'low')
+        high.start(lambda: (high.stop(), low.stop(), self.order.append('high')))
+        self.run_loop()
+        self.assertEqual(self.order, ['high'])
+        self.assertFalse(low.pending)
+        self.assertEqual(self.loop._prioritized, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
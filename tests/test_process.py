@@ -0,0 +1,223 @@
+# coding=utf8
+
+import os
+import signal
+import subprocess
+import tempfile
+import unittest
+import warnings
+
+import gevent
+
+import uvent
+
+
+def run_forked(func):
+    """Run func in a child process with a reinitialised hub and return the repr of its result.
+
+    The child gets a loop on which no pyuv.Process was spawned, so libuv doesn't reap children there.
+    """
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(r)
+            gevent.reinit()
+            result = repr(func())
+        except BaseException as e:
+            result = 'raised %r' % (e, )
+        os.write(w, result)
+        os._exit(0)
+    os.close(w)
+    chunks = []
+    while True:
+        chunk = os.read(r, 65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    os.close(r)
+    try:
+        os.waitpid(pid, 0)
+    except OSError:
+        # Reaped by a SIGCHLD handler of this process
+        pass
+    return b''.join(chunks)
+
+
+def wait_for(condition, seconds=5):
+    with gevent.Timeout(seconds, False):
+        while not condition():
+            gevent.sleep(0.01)
+
+
+def reap_batch():
+    loop = gevent.get_hub().loop
+    pids = []
+    for i in range(50):
+        pid = os.fork()
+        if pid == 0:
+            os._exit(i % 7)
+        pids.append(pid)
+    statuses = {}
+
+    def exited(watcher):
+        statuses[watcher.rpid] = os.WEXITSTATUS(watcher.rstatus)
+        watcher.stop()
+    for pid in pids:
+        watcher = loop.child(pid)
+        watcher.start(exited, watcher)
+    wait_for(lambda: len(statuses) == len(pids))
+    return [statuses.get(pid) for pid in pids] == [i % 7 for i in range(50)]
+
+
+def reap_any():
+    loop = gevent.get_hub().loop
+    watcher = loop.child(0)
+    seen = []
+    watcher.start(lambda: seen.append(watcher.rpid))
+    pids = []
+    for _ in range(20):
+        pid = os.fork()
+        if pid == 0:
+            os._exit(0)
+        pids.append(pid)
+    wait_for(lambda: len(seen) == len(pids))
+    # Statuses reaped at once are delivered one per callback
+    return sorted(seen) == sorted(pids)
+
+
+def reap_exited_before_watcher():
+    pid = os.fork()
+    if pid == 0:
+        os._exit(3)
+    gevent.sleep(0.1)
+    watcher = gevent.get_hub().loop.child(pid)
+    statuses = []
+    watcher.start(lambda: statuses.append(os.WEXITSTATUS(watcher.rstatus)))
+    wait_for(lambda: statuses)
+    return statuses
+
+
+def process_and_child_watchers():
+    from uvent.process import Process
+    watcher = gevent.get_hub().loop.child(0)
+    watcher.start(lambda: None)
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        # Whichever of libuv and uvent's SIGCHLD handler reaps the child, the process gets its status
+        returncodes = [Process(['sh', '-c', 'exit 5']).wait() for _ in range(10)]
+    return returncodes, [w.category.__name__ for w in caught]
+
+
+class ChildWatcherTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        uvent.install()
+
+    def test_batch(self):
+        self.assertEqual(run_forked(reap_batch), 'True')
+
+    def test_any(self):
+        self.assertEqual(run_forked(reap_any), 'True')
+
+    def test_exited_before_watcher(self):
+        self.assertEqual(run_forked(reap_exited_before_watcher), '[3]')
+
+    def test_processes_warn(self):
+        self.assertEqual(run_forked(process_and_child_watchers), repr(([5] * 10, ['RuntimeWarning'])))
+
+
+class ProcessTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        uvent.install()
+
+    def setUp(self):
+        self.timeout = gevent.Timeout.start_new(10)
+
+    def tearDown(self):
+        self.timeout.cancel()
+
+    def test_check_output(self):
+        from uvent.process import check_output
+        self.assertEqual(check_output(['echo', 'hello']), b'hello\n')
+        with self.assertRaises(subprocess.CalledProcessError) as cm:
+            check_output(['sh', '-c', 'echo err; exit 3'])
+        self.assertEqual(cm.exception.returncode, 3)
+        self.assertEqual(cm.exception.output, b'err\n')
+
+    def test_communicate(self):
+        from uvent.process import PIPE, Process
+        data = os.urandom(300000)
+        p = Process(['cat'], stdin=PIPE, stdout=PIPE)
+        self.assertEqual(p.communicate(data), (data, None))
+        self.assertEqual(p.returncode, 0)
+        p = Process(['sh', '-c', 'echo out; echo err >&2'], stdout=PIPE, stderr=PIPE)
+        self.assertEqual(p.communicate(), (b'out\n', b'err\n'))
+
+    def test_read_write(self):
+        from uvent.process import PIPE, Process
+        p = Process(['cat'], stdin=PIPE, stdout=PIPE)
+        p.stdin.write(b'ping')
+        self.assertEqual(p.stdout.read(4), b'ping')
+        p.stdin.close()
+        self.assertEqual(p.stdout.read(), b'')
+        self.assertEqual(p.wait(), 0)
+        p.stdout.close()
+        self.assertRaises(ValueError, p.stdout.read)
+
+    def test_returncode(self):
+        from uvent.process import call
+        self.assertEqual(call(['true']), 0)
+        self.assertEqual(call(['false']), 1)
+        self.assertEqual(call(['/nonexistent/binary']), 127)
+
+    def test_signal(self):
+        from uvent.process import Process
+        p = Process(['sleep', '10'])
+        self.assertIsNone(p.wait(0.05))
+        self.assertIsNone(p.poll())
+        p.terminate()
+        self.assertEqual(p.wait(), -signal.SIGTERM)
+        # Signalling a process which exited does nothing
+        p.kill()
+
+    def test_cooperative(self):
+        from uvent.process import Process
+        ticks = []
+        ticker = gevent.spawn(lambda: [ticks.append(gevent.sleep(0.01)) for _ in range(5)])
+        Process(['sleep', '0.2']).wait()
+        self.assertTrue(ticker.ready())
+        self.assertEqual(len(ticks), 5)
+
+    def test_many(self):
+        from uvent.process import Process
+        processes = [Process(['sh', '-c', 'exit %d' % (i % 5)]) for i in range(100)]
+        self.assertEqual([p.wait() for p in processes], [i % 5 for i in range(100)])
+
+    def test_env_cwd_files(self):
+        from uvent.process import Process
+        directory = tempfile.mkdtemp()
+        with tempfile.TemporaryFile() as out:
+            p = Process(['sh', '-c', 'echo $VALUE; pwd'], env={'VALUE': 'set'}, cwd=directory, stdout=out)
+            self.assertEqual(p.wait(), 0)
+            out.seek(0)
+            self.assertEqual(out.read(), b'set\n' + os.path.realpath(directory).encode() + b'\n')
+        os.rmdir(directory)
+
+    def test_default_loop_only(self):
+        from uvent.loop import UVLoop
+        from uvent.process import Process
+        hub = gevent.get_hub()
+        loop, hub.loop = hub.loop, UVLoop(default=False)
+        try:
+            self.assertRaises(TypeError, Process, ['true'])
+        finally:
+            hub.loop.destroy()
+            hub.loop = loop
+
+
+if __name__ == '__main__':
+    unittest.main()
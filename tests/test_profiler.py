@@ -0,0 +1,138 @@
+# coding=utf8
+
+import os
+import socket
+import subprocess
+import sys
+import time
+import unittest
+
+from uvent.loop import Io, UVLoop, Watcher
+
+
+def busy(seconds):
+    start = time.time()
+    while time.time() - start < seconds:
+        pass
+
+
+class ProfilerTest(unittest.TestCase):
+
+    loop_class = UVLoop
+
+    def setUp(self):
+        self.loop = self.loop_class(default=False)
+        if self.loop._signal_checker is not None:
+            # Only the watchers under test keep the loop alive
+            self.loop._signal_checker.unref()
+        self.reported = []
+
+    def tearDown(self):
+        self.loop.destroy()
+
+    def start(self, threshold=0.02):
+        return self.loop.start_profiling(threshold, self.reported.append)
+
+    def test_dispatch_swapped(self):
+        # Nothing is instrumented while no loop profiles
+        run_callback = Watcher.__dict__['_run_callback'], Io.__dict__['_run_callback']
+        profiler = self.start()
+        self.assertIs(self.loop.start_profiling(), profiler)
+        self.assertIsNot(Watcher.__dict__['_run_callback'], run_callback[0])
+        self.assertIsNot(Io.__dict__['_run_callback'], run_callback[1])
+        other = self.loop_class(default=False)
+        other.start_profiling()
+        self.assertIs(self.loop.stop_profiling(), profiler)
+        self.assertIsNone(self.loop.profiler)
+        self.assertIsNot(Watcher.__dict__['_run_callback'], run_callback[0])
+        other.destroy()
+        self.assertEqual((Watcher.__dict__['_run_callback'], Io.__dict__['_run_callback']), run_callback)
+
+    def test_slow_callback(self):
+        profiler = self.start()
+        self.loop.run_callback(busy, 0.05)
+        self.loop.run()
+        self.assertEqual(len(self.reported), 1)
+        record = self.reported[0]
+        self.assertEqual(record['type'], 'callback')
+        self.assertIn('busy', record['target'])
+        self.assertTrue(record['elapsed'] >= 0.05)
+        # Taken by the watchdog while the callback was running
+        self.assertIn('busy', [entry[2] for entry in record['stack']])
+        self.assertEqual(list(profiler.slow), [record])
+
+    def test_slow_watcher(self):
+        self.start()
+        timer = self.loop.timer(0)
+        timer.start(busy, 0.05)
+        fast = self.loop.timer(0)
+        fast.start(lambda: None)
+        self.loop.run()
+        self.assertEqual([record['type'] for record in self.reported], ['Timer'])
+        self.assertEqual(self.reported[0]['target'], repr(timer))
+
+    def test_histograms(self):
+        profiler = self.start()
+        a, b = socket.socketpair()
+        io = self.loop.io(a.fileno(), 1)
+        io.start(lambda: io.stop() or a.recv(1))
+        b.send(b'x')
+        for _ in range(10):
+            self.loop.run_callback(lambda: None)
+        self.loop.run()
+        histograms = profiler.histograms()
+        self.assertEqual(sorted(histograms), ['Io', 'callback'])
+        self.assertEqual(histograms['callback']['count'], 10)
+        self.assertEqual(sum(histograms['callback']['buckets']), 10)
+        self.assertEqual(histograms['Io']['count'], 1)
+        self.assertTrue(histograms['Io']['max'] <= histograms['Io']['total'] < 0.02)
+        self.assertEqual(self.reported, [])
+        profiler.reset()
+        self.assertEqual(profiler.histograms(), {})
+        a.close()
+        b.close()
+
+    def test_stop(self):
+        profiler = self.start()
+        profiler.stop()
+        self.assertIsNone(self.loop.profiler)
+        self.loop.run_callback(busy, 0.05)
+        self.loop.run()
+        self.assertEqual(self.reported, [])
+        self.assertEqual(profiler.histograms(), {})
+
+    def test_report_error(self):
+        errors = []
+        self.loop.error_handler = lambda context, type, value, tb: errors.append(type)
+        self.loop.start_profiling(0.01, lambda record: 1 / 0)
+        self.loop.run_callback(busy, 0.02)
+        self.loop.run()
+        self.assertEqual(errors, [ZeroDivisionError])
+
+    def test_exit(self):
+        # The watchdog threads are stopped before the interpreter is finalized
+        script = ('from uvent.loop import UVLoop\n'
+                  'loops = [UVLoop(default=False) for _ in range(10)]\n'
+                  'profilers = [loop.start_profiling(0.001) for loop in loops]\n'
+                  'loops[0].stop_profiling()\n')
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        p = subprocess.Popen([sys.executable, '-c', script], stderr=subprocess.PIPE, env=env)
+        self.assertEqual(p.communicate()[1], b'')
+        self.assertEqual(p.returncode, 0)
+
+
+class ThresholdLoop(UVLoop):
+    slow_callback_threshold = 0.5
+
+
+class ThresholdTest(unittest.TestCase):
+
+    def test_started_with_loop(self):
+        loop = ThresholdLoop(default=False)
+        self.assertEqual(loop.profiler.threshold, 0.5)
+        loop.destroy()
+        self.assertIsNone(loop.profiler)
+
+
+if __name__ == '__main__':
+    unittest.main()
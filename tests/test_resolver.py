@@ -0,0 +1,154 @@
+# coding=utf8
+
+import socket
+import struct
+import threading
+import unittest
+
+import gevent
+
+import uvent
+from uvent import resolver
+from uvent.resolver import Resolver
+
+
+class FakeDNSServer(threading.Thread):
+    """Answers A queries for names under .test with a TTL of 300 seconds, or of 10 for names starting with 'short'.
+
+    Other names under .test have no address, names starting with 'fail' get SERVFAIL and anything else NXDOMAIN.
+    """
+
+    def __init__(self):
+        super(FakeDNSServer, self).__init__()
+        self.daemon = True
+        self.queries = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.port = self.sock.getsockname()[1]
+
+    def run(self):
+        while True:
+            data, address = self.sock.recvfrom(512)
+            labels = []
+            i = 12
+            while ord(data[i]):
+                length = ord(data[i])
+                labels.append(data[i + 1:i + 1 + length])
+                i += 1 + length
+            qtype = struct.unpack('!H', data[i + 1:i + 3])[0]
+            question = data[12:i + 5]
+            name = '.'.join(labels)
+            self.queries.append((name, qtype))
+            if name.startswith('fail'):
+                flags, answers = b'\x81\x82', b''
+            elif not name.endswith('.test'):
+                flags, answers = b'\x81\x83', b''
+            elif qtype == 1:
+                ttl = 10 if name.startswith('short') else 300
+                flags = b'\x81\x80'
+                answers = b'\xc0\x0c' + struct.pack('!HHIH', 1, 1, ttl, 4) + socket.inet_aton('10.0.0.%d' % len(name))
+            else:
+                flags, answers = b'\x81\x80', b''
+            header = data[:2] + flags + struct.pack('!HHHH', 1, 1 if answers else 0, 0, 0)
+            self.sock.sendto(header + question + answers, address)
+
+    def count(self, name):
+        return self.queries.count((name, 1))
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000000.0
+
+    def time(self):
+        return self.now
+
+
+class ResolverCacheTest(unittest.TestCase):
+
+    server = None
+
+    @classmethod
+    def setUpClass(cls):
+        uvent.install()
+        cls.server = FakeDNSServer()
+        cls.server.start()
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.time, resolver.time = resolver.time, self.clock
+        self.resolver = Resolver(use_environ=False, servers=['127.0.0.1'], udp_port=self.server.port, tries=1, timeout=1.0)
+
+    def tearDown(self):
+        self.resolver.close()
+        resolver.time = self.time
+
+    def resolve(self, name):
+        return self.resolver.gethostbyname(name)
+
+    def test_cached(self):
+        self.assertEqual(self.resolve('cached.test'), '10.0.0.11')
+        self.assertEqual(self.resolve('cached.test'), '10.0.0.11')
+        self.assertEqual(self.resolve('CACHED.test.'), '10.0.0.11')
+        self.assertEqual(self.server.count('cached.test'), 1)
+
+    def test_ttl(self):
+        self.resolve('ttl.test')
+        self.clock.now += 299
+        self.resolve('ttl.test')
+        self.assertEqual(self.server.count('ttl.test'), 1)
+        self.clock.now += 2
+        self.resolve('ttl.test')
+        self.assertEqual(self.server.count('ttl.test'), 2)
+
+    def test_min_max_ttl(self):
+        self.resolver.max_ttl = 60
+        self.resolve('max.test')
+        self.clock.now += 61
+        self.resolve('max.test')
+        self.assertEqual(self.server.count('max.test'), 2)
+        self.resolver.min_ttl = 30
+        self.resolve('short-min.test')
+        self.clock.now += 20
+        self.resolve('short-min.test')
+        self.assertEqual(self.server.count('short-min.test'), 1)
+        self.clock.now += 11
+        self.resolve('short-min.test')
+        self.assertEqual(self.server.count('short-min.test'), 2)
+
+    def test_coalescing(self):
+        greenlets = [gevent.spawn(self.resolve, 'shared.test') for i in xrange(20)]
+        gevent.joinall(greenlets, raise_error=True)
+        self.assertEqual([g.value for g in greenlets], ['10.0.0.11'] * 20)
+        self.assertEqual(self.server.count('shared.test'), 1)
+
+    def test_negative(self):
+        for i in xrange(2):
+            with self.assertRaises(socket.gaierror) as context:
+                self.resolve('missing.example')
+            self.assertEqual(context.exception.args[0], socket.EAI_NONAME)
+        self.assertEqual(self.server.count('missing.example'), 1)
+        self.clock.now += self.resolver.negative_ttl + 1
+        self.assertRaises(socket.gaierror, self.resolve, 'missing.example')
+        self.assertEqual(self.server.count('missing.example'), 2)
+
+    def test_failure_not_cached(self):
+        for i in xrange(2):
+            with self.assertRaises(socket.gaierror) as context:
+                self.resolve('fail.example')
+            self.assertEqual(context.exception.args[0], socket.EAI_AGAIN)
+        self.assertEqual(self.server.count('fail.example'), 2)
+        self.assertEqual(self.resolver._cache, {})
+
+    def test_expire(self):
+        self.resolver.cache_size = 3
+        for name in ('one.test', 'two.test', 'three.test'):
+            self.resolve(name)
+        self.clock.now += 301
+        self.resolve('four.test')
+        self.assertEqual(sorted(self.resolver._cache), [('four.test', 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+# coding=utf8
+
+import os
+import tempfile
+import unittest
+
+import gevent
+import gevent.socket
+import pyuv
+
+import uvent
+
+
+class SendfileTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        uvent.install()
+
+    def setUp(self):
+        self.data = os.urandom(3 * 1024 * 1024 + 123)
+        fd, self.path = tempfile.mkstemp()
+        os.write(fd, self.data)
+        os.close(fd)
+        self.timeout = gevent.Timeout.start_new(10)
+
+    def tearDown(self):
+        self.timeout.cancel()
+        os.unlink(self.path)
+
+    def pair(self, uvent_sockets):
+        a, b = gevent.socket.socketpair()
+        if uvent_sockets:
+            from uvent.socket import socket
+            a, b = socket(_sock=a._sock), socket(_sock=b._sock)
+        return a, b
+
+    def read_all(self, sock):
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                return b''.join(chunks)
+            chunks.append(chunk)
+
+    def send(self, uvent_sockets, offset=0, count=None, headers=b''):
+        a, b = self.pair(uvent_sockets)
+        reader = gevent.spawn(self.read_all, b)
+        try:
+            if headers:
+                # The kernel doesn't take all the headers at once, libuv still has some to write
+                a.setsockopt(gevent.socket.SOL_SOCKET, gevent.socket.SO_SNDBUF, 4096)
+                a.sendall(headers)
+            with open(self.path, 'rb') as f:
+                sent = uvent.sendfile(a, f, offset, count)
+        finally:
+            a.close()
+        received = reader.get()
+        b.close()
+        return sent, received
+
+    def test_whole_file(self):
+        for uvent_sockets in (False, True):
+            self.assertEqual(self.send(uvent_sockets), (len(self.data), self.data))
+
+    def test_range(self):
+        sent, received = self.send(True, 1000, 100000)
+        self.assertEqual((sent, received), (100000, self.data[1000:101000]))
+
+    def test_past_end(self):
+        sent, received = self.send(False, len(self.data) - 10, 100)
+        self.assertEqual((sent, received), (10, self.data[-10:]))
+        self.assertEqual(self.send(False, len(self.data) + 10), (0, b''))
+
+    def test_after_headers(self):
+        headers = b'HTTP/1.1 200 OK\r\nX-Padding: ' + b'p' * (512 * 1024) + b'\r\n\r\n'
+        for uvent_sockets in (False, True):
+            sent, received = self.send(uvent_sockets, headers=headers)
+            self.assertEqual(sent, len(self.data))
+            self.assertEqual(received[:len(headers)], headers)
+            self.assertTrue(received[len(headers):] == self.data)
+
+    def test_waits_for_queued_writes(self):
+        # Which of libuv and sendfile gets to write first when the socket becomes writable is up to chance,
+        # check that libuv had nothing left to write when the file was sent
+        pending = []
+        sendfile = pyuv.fs.sendfile
+
+        def spy(loop, out_fd, *args):
+            pending.append(transports[0]._writes)
+            return sendfile(loop, out_fd, *args)
+
+        transports = []
+        pair = self.pair
+
+        def uvent_pair(uvent_sockets):
+            a, b = pair(True)
+            transports.append(a._get_transport())
+            return a, b
+
+        self.pair = uvent_pair
+        pyuv.fs.sendfile = spy
+        try:
+            self.send(True, headers=b'h' * (512 * 1024))
+        finally:
+            pyuv.fs.sendfile = sendfile
+        self.assertTrue(pending)
+        self.assertEqual(set(pending), set([0]))
+
+    def test_file_object(self):
+        from uvent.fileobject import FileObject
+        a, b = self.pair(True)
+        reader = gevent.spawn(self.read_all, b)
+        with FileObject(self.path, 'rb') as f:
+            self.assertEqual(uvent.sendfile(a, f, 0, 10), 10)
+        a.close()
+        self.assertEqual(reader.get(), self.data[:10])
+        b.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
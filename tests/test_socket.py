@@ -0,0 +1,238 @@
+# coding=utf8
+
+import errno
+import unittest
+
+import gevent
+import gevent.socket
+
+import uvent
+
+
+class KernelSpy(object):
+    """Wraps a socket object, records the writes libuv had pending when data is sent through the kernel."""
+
+    def __init__(self, sock, transport):
+        self.sock = sock
+        self.transport = transport
+        self.pending = []
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+    def send(self, data, flags=0):
+        self.pending.append(self.transport._writes)
+        return self.sock.send(data, flags)
+
+
+class SocketTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        uvent.install()
+
+    def setUp(self):
+        from uvent.socket import socket
+        self.socket_class = socket
+        self.sockets = []
+        self.timeout = gevent.Timeout.start_new(10)
+
+    def tearDown(self):
+        self.timeout.cancel()
+        for sock in self.sockets:
+            sock.close()
+
+    def socket(self, *args, **kwargs):
+        sock = self.socket_class(*args, **kwargs)
+        self.sockets.append(sock)
+        return sock
+
+    def tcp_pair(self):
+        listener = self.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        client = self.socket()
+        client.connect(listener.getsockname())
+        server, address = listener.accept()
+        self.sockets.append(server)
+        return client, server
+
+    def unix_pair(self):
+        a, b = gevent.socket.socketpair()
+        return self.socket(_sock=a._sock), self.socket(_sock=b._sock)
+
+    def udp_pair(self):
+        a = self.socket(gevent.socket.AF_INET, gevent.socket.SOCK_DGRAM)
+        a.bind(('127.0.0.1', 0))
+        b = self.socket(gevent.socket.AF_INET, gevent.socket.SOCK_DGRAM)
+        b.bind(('127.0.0.1', 0))
+        return a, b
+
+    def buffered(self, sock, size):
+        # Wait until libuv has read size bytes into the socket's buffer
+        transport = sock._get_transport()
+        while transport._buffered < size:
+            gevent.sleep(0.001)
+
+    def test_echo(self):
+        for client, server in (self.tcp_pair(), self.unix_pair()):
+            self.assertTrue(isinstance(server, self.socket_class))
+            client.sendall(b'hello')
+            self.assertEqual(server.recv(100), b'hello')
+            data = b'x' * (3 * 1024 * 1024)
+            sender = gevent.spawn(server.sendall, data)
+            received = bytearray()
+            buf = bytearray(65536)
+            while len(received) < len(data):
+                received += buf[:client.recv_into(buf)]
+            sender.get()
+            self.assertEqual(bytes(received), data)
+
+    def test_partial_reads(self):
+        client, server = self.tcp_pair()
+        client.sendall(b'abc')
+        client.sendall(b'defgh')
+        self.buffered(server, 8)
+        self.assertEqual(server.recv(2), b'ab')
+        self.assertEqual(server.recv(4), b'cdef')
+        self.assertEqual(server.recv(100), b'gh')
+
+    def test_peek_from_buffer(self):
+        client, server = self.tcp_pair()
+        client.sendall(b'hello ')
+        client.sendall(b'world')
+        self.buffered(server, 11)
+        self.assertEqual(server.recv(2), b'he')
+        self.assertEqual(server.recv(6, gevent.socket.MSG_PEEK), b'llo wo')
+        buf = bytearray(3)
+        self.assertEqual(server.recv_into(buf, 0, gevent.socket.MSG_PEEK), 3)
+        self.assertEqual(bytes(buf), b'llo')
+        self.assertEqual(server.recv(100), b'llo world')
+
+    def test_peek_waits(self):
+        client, server = self.tcp_pair()
+        gevent.spawn_later(0.01, client.sendall, b'late')
+        self.assertEqual(server.recv(10, gevent.socket.MSG_PEEK), b'late')
+        self.assertEqual(server.recv(10), b'late')
+
+    def test_flags_before_transport(self):
+        client, server = self.tcp_pair()
+        client.sendall(b'kernel')
+        gevent.sleep(0.01)
+        self.assertTrue(server._transport is None)
+        self.assertEqual(server.recv(3, gevent.socket.MSG_PEEK), b'ker')
+        self.assertTrue(server._transport is None)
+        self.assertEqual(server.recv(100), b'kernel')
+
+    def test_dontwait(self):
+        client, server = self.tcp_pair()
+        server.recv(0)
+        with self.assertRaises(gevent.socket.error) as context:
+            server.recv(10, gevent.socket.MSG_DONTWAIT)
+        self.assertEqual(context.exception.args[0], errno.EWOULDBLOCK)
+        client.sendall(b'now')
+        self.buffered(server, 3)
+        self.assertEqual(server.recv(10, gevent.socket.MSG_DONTWAIT), b'now')
+
+    def test_unsupported_flags(self):
+        client, server = self.tcp_pair()
+        client.sendall(b'data')
+        self.buffered(server, 4)
+        with self.assertRaises(gevent.socket.error) as context:
+            server.recv(10, gevent.socket.MSG_OOB)
+        self.assertEqual(context.exception.args[0], errno.EOPNOTSUPP)
+        self.assertEqual(server.recv(10), b'data')
+
+    def test_recvfrom_stream(self):
+        client, server = self.tcp_pair()
+        client.sendall(b'from')
+        self.buffered(server, 4)
+        self.assertEqual(server.recvfrom(10), (b'from', None))
+
+    def test_send_flags_after_queued_data(self):
+        client, server = self.tcp_pair()
+        # libuv can't write all the data right away, the kernel doesn't take it
+        client.setsockopt(gevent.socket.SOL_SOCKET, gevent.socket.SO_SNDBUF, 4096)
+        data = b'x' * (1024 * 1024)
+
+        def read():
+            chunks = []
+            while True:
+                chunk = server.recv(65536)
+                if not chunk:
+                    return b''.join(chunks)
+                chunks.append(chunk)
+
+        reader = gevent.spawn(read)
+        client.sendall(data)
+        transport = client._transport
+        self.assertTrue(transport._writes)
+        # Sent by the kernel, only once libuv has written what it was given
+        client._sock = KernelSpy(client._sock, transport)
+        client.sendall(b'end', gevent.socket.MSG_DONTROUTE)
+        self.assertEqual(client._sock.pending, [0])
+        client._sock = client._sock.sock
+        client.close()
+        self.assertEqual(reader.get(), data + b'end')
+
+    def test_timeout(self):
+        client, server = self.tcp_pair()
+        server.settimeout(0.01)
+        self.assertRaises(gevent.socket.timeout, server.recv, 10)
+        client.sendall(b'after')
+        self.assertEqual(server.recv(10), b'after')
+
+    def test_eof(self):
+        client, server = self.tcp_pair()
+        client.sendall(b'last')
+        client.close()
+        self.assertEqual(server.recv(10), b'last')
+        self.assertEqual(server.recv(10), b'')
+
+    def test_close_wakes_reader(self):
+        client, server = self.tcp_pair()
+        errors = []
+
+        def read():
+            try:
+                server.recv(10)
+            except gevent.socket.error as e:
+                errors.append(e.args[0])
+
+        reader = gevent.spawn(read)
+        gevent.sleep(0.01)
+        server.close()
+        reader.join()
+        self.assertEqual(errors, [errno.EBADF])
+
+    def test_dup_shares_buffer(self):
+        client, server = self.tcp_pair()
+        client.sendall(b'shared')
+        self.buffered(server, 6)
+        dup = server.dup()
+        self.sockets.append(dup)
+        self.assertTrue(dup._transport is server._transport)
+        self.assertEqual(dup.recv(3), b'sha')
+        self.assertEqual(server.recv(3), b'red')
+
+    def test_udp(self):
+        a, b = self.udp_pair()
+        for i in xrange(10):
+            b.sendto(b'd%d' % i, a.getsockname())
+        received = [a.recvfrom(100) for i in xrange(10)]
+        self.assertEqual([data for data, address in received], [b'd%d' % i for i in xrange(10)])
+        self.assertEqual(received[0][1], b.getsockname())
+
+    def test_udp_peek(self):
+        a, b = self.udp_pair()
+        b.sendto(b'first', a.getsockname())
+        b.sendto(b'second', a.getsockname())
+        self.assertEqual(a.recvfrom(100)[0], b'first')
+        self.assertEqual(a.recvfrom(100, gevent.socket.MSG_PEEK)[0], b'second')
+        self.assertEqual(a.recv(100, gevent.socket.MSG_PEEK), b'second')
+        self.assertEqual(a.recvfrom(100)[0], b'second')
+        self.assertRaises(gevent.socket.error, a.recv, 100, gevent.socket.MSG_DONTWAIT)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+# coding=utf8
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import gevent
+
+import uvent
+
+
+class SharedStatTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        uvent.install()
+
+    def setUp(self):
+        self.loop = gevent.get_hub().loop
+        self.loop.fsevent_stat_watchers = True
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'file')
+        self.write(self.path, b'initial')
+        self.watchers = []
+        self.timeout = gevent.Timeout.start_new(10)
+
+    def tearDown(self):
+        self.timeout.cancel()
+        for watcher in self.watchers:
+            watcher.stop()
+        del self.loop.fsevent_stat_watchers
+        shutil.rmtree(self.dir)
+
+    def write(self, path, data):
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def watch(self, path=None, interval=0.0):
+        from uvent.util import SharedStat
+        watcher = self.loop.stat(path or self.path, interval)
+        self.assertIsInstance(watcher._handle, SharedStat)
+        changes = []
+        watcher.start(lambda: changes.append((watcher.prev, watcher.attr)))
+        self.watchers.append(watcher)
+        # Let the first stat complete, it only records the attributes
+        self.wait(lambda: watcher._handle._entry is None or watcher._handle._entry.known)
+        return changes
+
+    def wait(self, condition):
+        while not condition():
+            gevent.sleep(0.01)
+
+    def dispatcher(self):
+        return self.loop._loop._stat_dispatcher
+
+    def test_change(self):
+        changes = self.watch()
+        self.write(self.path, b'changed!')
+        self.wait(lambda: changes)
+        prev, attr = changes[0]
+        self.assertEqual((prev.st_size, attr.st_size), (7, 8))
+
+    def test_created_and_removed(self):
+        path = os.path.join(self.dir, 'later')
+        changes = self.watch(path)
+        self.write(path, b'x')
+        self.wait(lambda: changes)
+        self.assertEqual(changes[0][0], None)
+        self.assertEqual(changes[0][1].st_size, 1)
+        os.unlink(path)
+        self.wait(lambda: len(changes) == 2)
+        self.assertEqual(changes[1][0].st_size, 1)
+        self.assertEqual(changes[1][1], None)
+
+    def test_replaced(self):
+        changes = self.watch()
+        other = os.path.join(self.dir, 'other')
+        self.write(other, b'replacement')
+        os.rename(other, self.path)
+        self.wait(lambda: changes)
+        self.assertEqual(changes[-1][1].st_size, 11)
+
+    def test_shared(self):
+        # Watchers of paths in the same directory share one FSEvent handle, watchers of the same path its stats
+        changes = [self.watch() for _ in range(5)]
+        other = self.watch(os.path.join(self.dir, 'other'))
+        dispatcher = self.dispatcher()
+        self.assertEqual(len(dispatcher._directories), 1)
+        self.assertEqual(len(dispatcher._directories[self.dir].entries), 2)
+        stats, events = dispatcher.stats, dispatcher.events
+        # Interleaved with writes to another file, or inotify would merge the events itself
+        with open(self.path, 'wb') as f, open(os.path.join(self.dir, 'unwatched'), 'wb') as g:
+            for _ in range(100):
+                f.write(b'burst')
+                f.flush()
+                g.write(b'x')
+                g.flush()
+        self.wait(lambda: all(c and c[-1][1].st_size == 500 for c in changes))
+        self.assertTrue(dispatcher.events - events >= 100)
+        self.assertTrue(dispatcher.stats - stats < 10, dispatcher.stats - stats)
+        self.assertEqual(other, [])
+
+    def test_unwatched_paths(self):
+        self.watch()
+        dispatcher = self.dispatcher()
+        stats, events = dispatcher.stats, dispatcher.events
+        self.write(os.path.join(self.dir, 'unwatched'), b'x')
+        self.wait(lambda: dispatcher.events > events)
+        gevent.sleep(0.05)
+        self.assertEqual(dispatcher.stats, stats)
+
+    def test_stop(self):
+        changes = self.watch()
+        watcher = self.watchers[0]
+        watcher.stop()
+        self.assertFalse(watcher.active)
+        self.assertEqual(self.dispatcher()._directories, {})
+        self.write(self.path, b'changed!')
+        gevent.sleep(0.1)
+        self.assertEqual(changes, [])
+        watcher.start(lambda: changes.append(watcher.attr))
+        self.wait(lambda: self.dispatcher()._directories[self.dir].entries.values()[0].known)
+        self.write(self.path, b'changed again')
+        self.wait(lambda: changes)
+
+    def test_fall_back(self):
+        # The directory doesn't exist yet, so the path is polled
+        directory = os.path.join(self.dir, 'missing')
+        path = os.path.join(directory, 'file')
+        changes = self.watch(path, interval=0.05)
+        handle = self.watchers[0]._handle
+        self.assertIsNone(handle._entry)
+        self.assertTrue(handle._poll.active)
+        # FSPoll reports the missing path once, after its first stat
+        self.wait(lambda: changes)
+        self.assertEqual(changes, [(None, None)])
+        os.mkdir(directory)
+        self.write(path, b'polled')
+        self.wait(lambda: len(changes) == 2)
+        self.assertEqual(changes[-1][1].st_size, 6)
+
+    def test_directory_removed(self):
+        directory = os.path.join(self.dir, 'directory')
+        os.mkdir(directory)
+        path = os.path.join(directory, 'file')
+        self.write(path, b'x')
+        changes = self.watch(path, interval=0.05)
+        shutil.rmtree(directory)
+        self.wait(lambda: changes)
+        self.assertEqual(changes[-1][1], None)
+        handle = self.watchers[0]._handle
+        self.wait(lambda: handle._poll is not None and handle._poll.active)
+        os.mkdir(directory)
+        self.write(path, b'back')
+        self.wait(lambda: changes[-1][1] is not None)
+        self.assertEqual(changes[-1][1].st_size, 4)
+
+    def test_ref(self):
+        watcher = self.loop.stat(self.path, ref=False)
+        watcher.start(lambda: None)
+        self.watchers.append(watcher)
+        # Only referenced watchers keep the directory's FSEvent handle referenced
+        self.assertFalse(self.dispatcher()._directories[self.dir].refs)
+        watcher.ref = True
+        self.assertEqual(self.dispatcher()._directories[self.dir].refs, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
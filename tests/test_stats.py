@@ -0,0 +1,98 @@
+# coding=utf8
+
+import time
+import unittest
+
+from uvent.loop import UVLoop
+
+
+def busy(seconds):
+    start = time.time()
+    while time.time() - start < seconds:
+        pass
+
+
+class StatsTest(unittest.TestCase):
+
+    loop_class = UVLoop
+
+    def setUp(self):
+        self.loop = self.loop_class(default=False)
+        if self.loop._signal_checker is not None:
+            # Only the watchers under test keep the loop alive
+            self.loop._signal_checker.unref()
+
+    def tearDown(self):
+        self.loop.destroy()
+
+    def sleep(self, seconds):
+        timer = self.loop.timer(seconds)
+        timer.start(lambda: None)
+        self.loop.run()
+
+    def test_counted_once_asked_for(self):
+        self.sleep(0.01)
+        self.assertTrue(self.loop._stats_check is None)
+        self.assertEqual(self.loop.stats()['iteration'], 0)
+        for i in xrange(5):
+            self.sleep(0.001)
+        self.assertTrue(self.loop.iteration >= 5)
+
+    def test_iteration(self):
+        self.sleep(0.001)
+        self.loop.iteration
+        self.sleep(0.001)
+        self.assertTrue(self.loop.iteration >= 1)
+
+    def test_times(self):
+        self.loop.stats()
+        self.sleep(0.05)
+        self.loop.run_callback(busy, 0.05)
+        self.loop.run(nowait=True)
+        stats = self.loop.stats()
+        self.assertEqual(stats['depth'], 0)
+        self.assertTrue(0.04 < stats['io_time'] < 0.1, stats)
+        self.assertTrue(0.04 < stats['callback_time'] < 0.1, stats)
+        self.assertAlmostEqual(stats['run_time'], stats['io_time'] + stats['callback_time'])
+
+    def test_pending_callbacks_are_not_io_time(self):
+        # The Prepare handle which starts measuring must run after the one running callbacks
+        for i in xrange(5):
+            self.loop.run_callback(busy, 0.01)
+        self.loop.stats()
+        self.loop.run(nowait=True)
+        stats = self.loop.stats()
+        self.assertTrue(stats['callback_time'] >= 0.05, stats)
+        self.assertTrue(stats['io_time'] < 0.01, stats)
+
+    def test_watchers(self):
+        timer = self.loop.timer(10)
+        timer.start(lambda: None)
+        check = self.loop.check()
+        check.start(lambda: None)
+        stats = self.loop.stats()
+        self.assertEqual(stats['active'], 2)
+        self.assertEqual(stats['watchers'], {'Timer': 1, 'Check': 1})
+        timer.stop()
+        check.stop()
+        self.assertEqual(self.loop.stats()['watchers'], {})
+        self.loop.run_callback(lambda: None)
+        self.assertEqual(self.loop.stats()['pending'], 1)
+
+
+class CollectStatsLoop(UVLoop):
+    collect_stats = True
+
+
+class CollectStatsTest(StatsTest):
+
+    loop_class = CollectStatsLoop
+
+    def test_counted_once_asked_for(self):
+        self.sleep(0.001)
+        self.assertTrue(self.loop._stats_check is not None)
+        self.assertTrue(self.loop.stats()['iteration'] >= 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
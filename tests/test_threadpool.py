@@ -0,0 +1,150 @@
+# coding=utf8
+
+import threading
+import time
+import unittest
+
+import gevent
+
+import uvent
+
+
+class Expected(Exception):
+    pass
+
+
+class ThreadPoolTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        uvent.install()
+
+    def setUp(self):
+        from uvent.threadpool import ThreadPool
+        self.pool = ThreadPool(2)
+        # Set on tearDown so no libuv thread is left blocked by a failed test
+        self.event = threading.Event()
+        self.timeout = gevent.Timeout.start_new(10)
+
+    def tearDown(self):
+        self.event.set()
+        self.timeout.cancel()
+        self.pool.kill()
+
+    def test_hub_threadpool(self):
+        from uvent.threadpool import ThreadPool
+        self.assertIsInstance(gevent.get_hub().threadpool, ThreadPool)
+
+    def test_apply(self):
+        self.assertEqual(self.pool.apply(lambda a, b=1: a + b, (1, ), {'b': 2}), 3)
+
+    def errors(self):
+        errors = []
+        hub = self.pool.hub
+        hub.handle_error = lambda context, type, value, tb: errors.append(type)
+        self.addCleanup(delattr, hub, 'handle_error')
+        return errors
+
+    def test_exception(self):
+        errors = self.errors()
+
+        def fail():
+            raise Expected()
+        self.assertRaises(Expected, self.pool.apply, fail)
+        self.assertEqual(len(self.pool), 0)
+        self.assertEqual(errors, [Expected])
+
+    def test_apply_e(self):
+        errors = self.errors()
+
+        def fail():
+            raise Expected()
+        self.assertRaises(Expected, self.pool.apply_e, Expected, fail)
+        self.assertEqual(errors, [])
+
+    def test_map(self):
+        self.assertEqual(self.pool.map(lambda x: x * 2, range(20)), [x * 2 for x in range(20)])
+
+    def test_cooperative(self):
+        ticks = []
+        ticker = gevent.spawn(lambda: [ticks.append(gevent.sleep(0.005)) for _ in range(10)])
+        self.pool.apply(time.sleep, (0.1, ))
+        ticker.join()
+        self.assertEqual(len(ticks), 10)
+
+    def test_maxsize(self):
+        lock = threading.Lock()
+        running = [0, 0]
+
+        def work():
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+        gevent.joinall([gevent.spawn(self.pool.apply, work) for _ in range(8)])
+        self.assertEqual(running, [0, 2])
+        self.assertEqual(len(self.pool), 0)
+
+    def test_spawn_blocks(self):
+        event = self.event
+        for _ in range(2):
+            self.pool.spawn(event.wait)
+        blocked = gevent.spawn(self.pool.spawn, lambda: 'done')
+        gevent.sleep(0.05)
+        self.assertFalse(blocked.ready())
+        event.set()
+        self.assertEqual(blocked.get().get(), 'done')
+
+    def test_maxsize_increased(self):
+        event = self.event
+        for _ in range(2):
+            self.pool.spawn(event.wait)
+        blocked = [gevent.spawn(self.pool.spawn, event.wait) for _ in range(3)]
+        gevent.sleep(0.05)
+        self.pool.maxsize = 4
+        gevent.sleep(0.05)
+        self.assertEqual(len([greenlet for greenlet in blocked if greenlet.ready()]), 2)
+        self.assertEqual(len(self.pool), 4)
+        event.set()
+        gevent.joinall(blocked)
+        self.pool.join()
+        self.assertEqual(len(self.pool), 0)
+
+    def test_maxsize_decreased(self):
+        event = self.event
+        self.pool.maxsize = 1
+        self.pool.spawn(event.wait)
+        blocked = gevent.spawn(self.pool.spawn, lambda: 'done')
+        gevent.sleep(0.05)
+        self.assertFalse(blocked.ready())
+        event.set()
+        self.assertEqual(blocked.get().get(), 'done')
+
+    def test_killed_waiter_passes_room_on(self):
+        event = self.event
+        self.pool.maxsize = 1
+        self.pool.spawn(event.wait)
+        killed = gevent.spawn(self.pool.spawn, lambda: None)
+        blocked = gevent.spawn(self.pool.spawn, lambda: 'done')
+        gevent.sleep(0.05)
+
+        def kill_woken():
+            # The first waiter is woken up but killed before it gets the room
+            self.pool.maxsize = 2
+            killed.throw(gevent.GreenletExit)
+        gevent.get_hub().loop.run_callback(kill_woken)
+        self.assertEqual(blocked.get().get(), 'done')
+        self.assertTrue(killed.successful())
+        self.assertFalse(self.pool._waiters)
+
+    def test_join(self):
+        results = [self.pool.spawn(time.sleep, 0.02) for _ in range(4)]
+        self.pool.join()
+        self.assertTrue(all(result.ready() for result in results))
+        self.assertEqual(len(self.pool), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+# coding=utf8
+
+import random
+import unittest
+
+import pyuv
+
+from uvent.util import SharedTimer, TimerWheel
+
+
+class FakeLoop(pyuv.Loop):
+    """A pyuv loop whose clock is moved by hand, in milliseconds."""
+
+    def __init__(self):
+        super(FakeLoop, self).__init__()
+        self.time = 1000
+        self.excepthook = None
+        self._timer_wheel = TimerWheel(self, 0.001)
+
+    def now(self):
+        return self.time
+
+
+class TimerWheelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = FakeLoop()
+        self.wheel = self.loop._timer_wheel
+        self.fired = []
+
+    def start(self, timeout, repeat=0.0, name=None):
+        timer = SharedTimer(self.loop)
+        timer.start(lambda t: self.fired.append((name, self.loop.time)), timeout, repeat)
+        return timer
+
+    def advance(self, ms, step=1):
+        end = self.loop.time + ms
+        while self.loop.time < end:
+            self.loop.time = min(self.loop.time + step, end)
+            self.wheel._on_tick(None)
+
+    def test_expires_on_time(self):
+        start = self.loop.time
+        timeouts = [1, 2, 255, 256, 257, 300, 1000, 65535, 65536, 65537, 70000]
+        for timeout in timeouts:
+            self.start(timeout / 1000.0, name=timeout)
+        self.advance(71000)
+        self.assertEqual(self.fired, [(timeout, start + timeout) for timeout in timeouts])
+        self.assertEqual(self.wheel._count, 0)
+
+    def test_never_early(self):
+        random.seed(1)
+        expected = {}
+        for i in xrange(500):
+            timeout = random.randint(0, 100000)
+            self.start(timeout / 1000.0, name=i)
+            expected[i] = self.loop.time + timeout
+        self.advance(101000, step=7)
+        self.assertEqual(len(self.fired), 500)
+        for name, fired_at in self.fired:
+            self.assertTrue(expected[name] <= fired_at < expected[name] + 7, (expected[name], fired_at))
+
+    def test_cascade_in_one_jump(self):
+        self.start(70.0, name='far')
+        self.start(0.3, name='near')
+        self.loop.time += 100000
+        self.wheel._on_tick(None)
+        self.assertEqual([name for name, fired_at in self.fired], ['near', 'far'])
+
+    def test_equal_timers_in_start_order(self):
+        for i in xrange(20):
+            self.start(0.5, name=i)
+        self.advance(600, step=600)
+        self.assertEqual([name for name, fired_at in self.fired], range(20))
+
+    def test_stop_from_callback(self):
+        timer = SharedTimer(self.loop)
+        timer.start(lambda t: other.stop(), 0.01, 0.0)
+        other = self.start(0.01, name='other')
+        self.advance(20)
+        self.assertEqual(self.fired, [])
+        self.assertFalse(other.active)
+        self.assertEqual(self.wheel._count, 0)
+
+    def test_repeat(self):
+        timer = self.start(0.01, 0.02, name='repeat')
+        self.advance(75)
+        timer.stop()
+        self.assertEqual([fired_at - 1000 for name, fired_at in self.fired], [10, 30, 50, 70])
+        self.assertEqual(self.wheel._count, 0)
+
+    def test_unref(self):
+        timer = self.start(10.0)
+        self.assertEqual(self.wheel._refs, 1)
+        timer.unref()
+        self.assertEqual(self.wheel._refs, 0)
+        timer.stop()
+        timer.start(lambda t: None, 1.0, 0.0)
+        self.assertEqual(self.wheel._refs, 0)
+        timer.ref()
+        self.assertEqual(self.wheel._refs, 1)
+        timer.close()
+        self.assertEqual(self.wheel._refs, 0)
+        self.assertRaises(pyuv.error.HandleError, timer.start, lambda t: None, 1.0, 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
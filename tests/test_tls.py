@@ -0,0 +1,162 @@
+# coding=utf8
+
+import os
+import ssl
+import unittest
+
+import gevent
+import gevent.socket
+
+import uvent
+
+try:
+    from OpenSSL import SSL, crypto
+except ImportError:
+    SSL = None
+
+
+def make_certificate(common_name):
+    key = crypto.PKey()
+    key.generate_key(crypto.TYPE_RSA, 2048)
+    cert = crypto.X509()
+    cert.get_subject().CN = common_name
+    cert.set_serial_number(1)
+    cert.gmtime_adj_notBefore(0)
+    cert.gmtime_adj_notAfter(3600)
+    cert.set_issuer(cert.get_subject())
+    cert.set_pubkey(key)
+    cert.sign(key, 'sha256')
+    return cert, key
+
+
+@unittest.skipIf(SSL is None, 'pyOpenSSL is not installed')
+class TLSTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        uvent.install()
+        cls.cert, cls.key = make_certificate(u'localhost')
+        cls.server_context = SSL.Context(SSL.TLSv1_2_METHOD)
+        cls.server_context.use_certificate(cls.cert)
+        cls.server_context.use_privatekey(cls.key)
+        cls.client_context = SSL.Context(SSL.TLSv1_2_METHOD)
+
+    def setUp(self):
+        self.timeout = gevent.Timeout.start_new(10)
+
+    def tearDown(self):
+        self.timeout.cancel()
+
+    def pair(self, uvent_sockets=False):
+        listener = gevent.socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        client = gevent.socket.create_connection(listener.getsockname())
+        server = listener.accept()[0]
+        listener.close()
+        if uvent_sockets:
+            from uvent.socket import socket
+            client, server = socket(_sock=client._sock), socket(_sock=server._sock)
+        return client, server
+
+    def wrap(self, client, server, server_hostname=None):
+        from uvent.tls import wrap_socket
+        accepting = gevent.spawn(wrap_socket, server, self.server_context, server_side=True)
+        try:
+            client = wrap_socket(client, self.client_context, server_hostname=server_hostname)
+        finally:
+            server = accepting.get()
+        return client, server
+
+    def read_all(self, sock):
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                return b''.join(chunks)
+            chunks.append(chunk)
+
+    def test_echo(self):
+        for uvent_sockets in (False, True):
+            client, server = self.wrap(*self.pair(uvent_sockets))
+            client.sendall(b'ping')
+            server.sendall(server.recv(1024))
+            self.assertEqual(client.recv(1024), b'ping')
+            client.close()
+            self.assertEqual(server.recv(1024), b'')
+            server.close()
+
+    def test_large(self):
+        data = os.urandom(2 * 1024 * 1024)
+        client, server = self.wrap(*self.pair())
+        reader = gevent.spawn(self.read_all, server)
+        client.sendall(data)
+        client.unwrap().close()
+        self.assertEqual(reader.get(), data)
+        server.close()
+
+    def test_getpeercert(self):
+        client, server = self.wrap(*self.pair(), server_hostname=b'localhost')
+        self.assertEqual(client.getpeercert()['subject'], ((('commonName', u'localhost'), ), ))
+        self.assertEqual(client.getpeercert(True), crypto.dump_certificate(crypto.FILETYPE_ASN1, self.cert))
+        self.assertIsNone(server.getpeercert())
+        client.close()
+        server.close()
+
+    def test_hostname_mismatch(self):
+        from uvent.tls import wrap_socket
+        client, server = self.pair()
+        accepting = gevent.spawn(wrap_socket, server, self.server_context, server_side=True)
+        self.assertRaises(ssl.CertificateError, wrap_socket, client, self.client_context,
+                          server_hostname=b'example.com')
+        client.close()
+        accepting.join()
+        server.close()
+
+    def test_recv_timeout(self):
+        client, server = self.wrap(*self.pair())
+        client.settimeout(0.05)
+        self.assertRaises(gevent.socket.timeout, client.recv, 1024)
+        client.close()
+        server.close()
+
+    def test_buffered_before_wrap(self):
+        # What the uvent socket had already read from the kernel is ciphertext for the TLS stream
+        client, server = self.pair(True)
+        client.sendall(b'plain')
+        self.assertEqual(server.recv(1024), b'plain')
+        client, server = self.wrap(client, server)
+        client.sendall(b'secret')
+        self.assertEqual(server.recv(1024), b'secret')
+        client.close()
+        server.close()
+
+    def test_close_writes_pending_ciphertext(self):
+        # The uvent socket's handle is shared, closing the socket must not cancel the ciphertext libuv still has
+        client, server = self.pair(True)
+        client.setsockopt(gevent.socket.SOL_SOCKET, gevent.socket.SO_SNDBUF, 4096)
+        server.sendall(b'plain')
+        self.assertEqual(client.recv(1024), b'plain')
+        client, server = self.wrap(client, server)
+        data = os.urandom(client._stream.write_buffer_size)
+        self.assertEqual(client.send(data), len(data))
+        self.assertTrue(client._stream.handle.write_queue_size)
+        client.close()
+        received = self.read_all(server)
+        self.assertEqual(len(received), len(data))
+        self.assertTrue(received == data)
+        server.close()
+
+    def test_makefile(self):
+        client, server = self.wrap(*self.pair())
+        client.sendall(b'line 1\nline 2\n')
+        f = server.makefile()
+        self.assertEqual(f.readline(), 'line 1\n')
+        self.assertEqual(f.readline(), 'line 2\n')
+        f.close()
+        client.close()
+        server.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+# coding=utf8
+
+import unittest
+
+import gevent
+import gevent.socket
+
+import uvent
+
+
+class UDPEndpointTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        uvent.install()
+
+    def setUp(self):
+        from uvent.udp import UDPEndpoint
+        self.receiver = UDPEndpoint(('127.0.0.1', 0))
+        self.address = self.receiver.getsockname()
+        self.sender = UDPEndpoint(('127.0.0.1', 0))
+        self.timeout = gevent.Timeout.start_new(10)
+
+    def tearDown(self):
+        self.timeout.cancel()
+        self.receiver.close()
+        self.sender.close()
+
+    def receive(self, count):
+        received = []
+        while len(received) < count:
+            received.extend(self.receiver.recv_many())
+        return received
+
+    def test_send_many(self):
+        datagrams = [(b'datagram %d' % i, self.address) for i in range(50)]
+        self.assertEqual(self.sender.send_many(datagrams), 50)
+        received = self.receive(50)
+        self.assertEqual([data for data, address in received], [data for data, address in datagrams])
+        self.assertEqual(set(address for data, address in received), set([self.sender.getsockname()]))
+
+    def test_batched_wakeup(self):
+        # Whatever arrived in a loop iteration is returned by one recv_many call
+        sock = gevent.socket.socket(gevent.socket.AF_INET, gevent.socket.SOCK_DGRAM)
+        for i in range(20):
+            sock.sendto(b'%d' % i, self.address)
+        self.assertEqual(len(self.receiver.recv_many()), 20)
+        sock.close()
+
+    def test_max_packets(self):
+        self.sender.send_many([(b'x', self.address)] * 10)
+        gevent.sleep(0.05)
+        self.assertEqual(len(self.receiver.recv_many(max_packets=3)), 3)
+        self.assertEqual(len(self.receiver.recv_many()), 7)
+
+    def test_recv_many_into(self):
+        self.sender.send_many([(b'short', self.address), (b'truncated', self.address)])
+        gevent.sleep(0.05)
+        buffers = [bytearray(8), bytearray(4), bytearray(4)]
+        result = self.receiver.recv_many_into(buffers)
+        self.assertEqual([n for n, address in result], [5, 4])
+        self.assertEqual(bytes(buffers[0][:5]), b'short')
+        self.assertEqual(bytes(buffers[1]), b'trun')
+
+    def test_sendto(self):
+        self.assertEqual(self.sender.sendto(bytearray(b'data'), self.address), 4)
+        self.assertEqual(self.sender.sendto(b'name', ('localhost', self.address[1])), 4)
+        self.assertEqual([data for data, address in self.receive(2)], [b'data', b'name'])
+
+    def test_pending_batches(self):
+        self.sender.max_pending_batches = 1
+        for i in range(20):
+            self.sender.send_many([(b'%d' % i, self.address)])
+        self.assertEqual(len(self.receive(20)), 20)
+
+    def test_queue_size(self):
+        # Reading is paused while the queue is full, the kernel keeps the rest
+        self.receiver.queue_size = 5
+        self.sender.send_many([(b'x', self.address)] * 20)
+        gevent.sleep(0.05)
+        self.assertEqual(len(self.receiver._queue), 5)
+        self.assertEqual(len(self.receive(20)), 20)
+
+    def test_timeout(self):
+        self.assertRaises(gevent.socket.timeout, self.receiver.recv_many, timeout=0.05)
+
+    def test_close(self):
+        reader = gevent.spawn(self.assertRaises, gevent.socket.error, self.receiver.recv_many)
+        gevent.sleep(0.01)
+        self.receiver.close()
+        reader.get()
+        self.assertRaises(gevent.socket.error, self.receiver.recv_many)
+        self.assertRaises(gevent.socket.error, self.receiver.send_many, [(b'x', self.address)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+# coding=utf8
+
+import errno
+import unittest
+
+import gevent
+import gevent.socket
+
+import uvent
+
+
+class WriteQueueTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        uvent.install()
+
+    def setUp(self):
+        self.timeout = gevent.Timeout.start_new(10)
+
+    def tearDown(self):
+        self.timeout.cancel()
+
+    def pair(self, uvent_sockets=False):
+        a, b = gevent.socket.socketpair()
+        if uvent_sockets:
+            from uvent.socket import socket
+            a, b = socket(_sock=a._sock), socket(_sock=b._sock)
+        return a, b
+
+    def queue(self, sock, *args, **kwargs):
+        from uvent.writequeue import WriteQueue
+        return WriteQueue(sock, *args, **kwargs)
+
+    def read(self, sock, size):
+        chunks = []
+        while size > 0:
+            chunk = sock.recv(min(size, 65536))
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
+
+    def test_writelines(self):
+        a, b = self.pair()
+        queue = self.queue(a)
+        queue.writelines([b'head', bytearray(b'er'), memoryview(b'body')[1:], b''])
+        queue.write(b'!')
+        queue.drain()
+        self.assertEqual(queue.buffered, 0)
+        self.assertEqual(self.read(b, 10), b'headerody!')
+        queue.close()
+        a.close()
+        b.close()
+
+    def test_uvent_socket_order(self):
+        # The queue shares the handle of a uvent socket, so writes through both stay in order
+        a, b = self.pair(True)
+        queue = self.queue(a)
+        reader = gevent.spawn(self.read, b, 3 * 300000)
+        for part in (b'a', b'b', b'c'):
+            queue.write(part * 150000)
+            a.sendall(part * 150000)
+        queue.drain()
+        self.assertEqual(reader.get(), b''.join(part * 300000 for part in (b'a', b'b', b'c')))
+        queue.close()
+        a.close()
+        b.close()
+
+    def test_backpressure(self):
+        a, b = self.pair()
+        queue = self.queue(a, high_watermark=64 * 1024, low_watermark=16 * 1024)
+        data = b'x' * (1024 * 1024)
+        writer = gevent.spawn(queue.write, data)
+        gevent.sleep(0.05)
+        self.assertFalse(writer.ready())
+        self.assertTrue(queue.buffered > queue.high_watermark)
+        received = self.read(b, len(data) - 1024)
+        writer.get()
+        self.assertTrue(queue.buffered <= queue.low_watermark)
+        queue.drain()
+        self.assertEqual(received + self.read(b, 1024), data)
+        queue.close()
+        a.close()
+        b.close()
+
+    def test_nonblocking(self):
+        a, b = self.pair()
+        a.settimeout(0.0)
+        queue = self.queue(a, high_watermark=1024, low_watermark=0)
+        queue.write(b'x' * (1024 * 1024))
+        with self.assertRaises(gevent.socket.error) as cm:
+            queue.write(b'more')
+        self.assertEqual(cm.exception.args[0], errno.EWOULDBLOCK)
+        with self.assertRaises(gevent.socket.error) as cm:
+            queue.drain()
+        self.assertEqual(cm.exception.args[0], errno.EWOULDBLOCK)
+        queue.close()
+        a.close()
+        b.close()
+
+    def test_timeout(self):
+        a, b = self.pair()
+        a.settimeout(0.05)
+        queue = self.queue(a, high_watermark=1024, low_watermark=0)
+        self.assertRaises(gevent.socket.timeout, queue.write, b'x' * (1024 * 1024))
+        queue.close()
+        a.close()
+        b.close()
+
+    def test_error(self):
+        a, b = self.pair()
+        queue = self.queue(a)
+        b.close()
+        with self.assertRaises(gevent.socket.error) as cm:
+            queue.write(b'x' * (1024 * 1024))
+            queue.drain()
+        self.assertIn(cm.exception.args[0], (errno.EPIPE, errno.ECONNRESET))
+        queue.close()
+        a.close()
+
+    def test_close(self):
+        a, b = self.pair()
+        queue = self.queue(a, high_watermark=1024, low_watermark=0)
+        writer = gevent.spawn(self.assertRaises, gevent.socket.error, queue.write, b'x' * (1024 * 1024))
+        gevent.sleep(0.01)
+        queue.close()
+        writer.get()
+        self.assertEqual(queue.buffered, 0)
+        self.assertRaises(gevent.socket.error, queue.write, b'x')
+        a.close()
+        b.close()
+
+    def test_watermarks(self):
+        a, b = self.pair()
+        self.assertRaises(ValueError, self.queue, a, high_watermark=10, low_watermark=20)
+        a.close()
+        b.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
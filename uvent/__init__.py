@@ -3,7 +3,7 @@
 # Copyright (C) 2012 Saúl Ibarra Corretgé <saghul@gmail.com>
 #
 
-__all__ = ['install']
+__all__ = ['install', 'sendfile']
 __version__ = '0.3.0'
 
 
@@ -18,6 +18,50 @@ def patch_loop():
     Hub.resolver_class = Resolver
 
 
-def install():
+def patch_socket():
+    from .socket import socket
+    import gevent.socket
+    gevent.socket.socket = socket
+    try:
+        # gevent >= 1.1 creates sockets (on accept, socketpair, etc.) from here
+        import gevent._socket2
+    except ImportError:
+        pass
+    else:
+        gevent._socket2.socket = socket
+
+
+def patch_fileobject():
+    from .fileobject import FileObject
+    import gevent.fileobject
+    gevent.fileobject.FileObject = FileObject
+
+
+def patch_resolver():
+    from .resolver import Resolver
+    from gevent.hub import Hub
+    Hub.resolver_class = Resolver
+
+
+def patch_threadpool():
+    from .threadpool import ThreadPool
+    from gevent.hub import Hub
+    Hub.threadpool_class = ThreadPool
+
+
+def install(socket=False, fileobject=False, resolver=False, threadpool=True):
     patch_loop()
+    if threadpool:
+        patch_threadpool()
+    if resolver:
+        patch_resolver()
+    if socket:
+        patch_socket()
+    if fileobject:
+        patch_fileobject()
+
 
+def sendfile(sock, file, offset=0, count=None):
+    """Send part of a file to a stream socket without copying it through Python, see uvent.fileobject.sendfile."""
+    from .fileobject import sendfile
+    return sendfile(sock, file, offset, count)
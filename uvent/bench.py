@@ -0,0 +1,284 @@
+# coding=utf8
+
+# Copyright (C) 2012 Saúl Ibarra Corretgé <saghul@gmail.com>
+#
+
+"""Micro benchmarks comparing UVLoop with gevent's libev core.
+
+Run with: python -m uvent.bench [options]
+
+Each core runs the same workloads in a process of its own (the loop class
+can't be changed once the hub exists) and the results are printed as JSON,
+operations per second being the figure to compare. `--watchers` prints the
+size and start / stop cost of UVLoop watchers instead.
+"""
+
+from __future__ import absolute_import
+
+__all__ = ['watcher_size', 'watcher_benchmarks', 'WORKLOADS', 'run_workloads', 'run']
+
+import functools
+import json
+import optparse
+import platform
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+
+def watcher_size(watcher):
+    """Return the number of bytes used by the Python side of a started watcher."""
+    size = sys.getsizeof(watcher)
+    d = getattr(watcher, '__dict__', None)
+    if d is not None:
+        size += sys.getsizeof(d)
+    callback = getattr(watcher, '_callback', None)
+    if isinstance(callback, functools.partial):
+        size += sys.getsizeof(callback)
+    return size
+
+
+def _noop(*args):
+    pass
+
+
+def _start_stop(watcher, count):
+    start = watcher.start
+    stop = watcher.stop
+    t0 = time.time()
+    for i in xrange(count):
+        start(_noop)
+        stop()
+    return (time.time() - t0) / count
+
+
+def watcher_benchmarks(count=100000):
+    """Measure the size and the cost of a start/stop cycle for each watcher type.
+
+    Returns a dictionary mapping the watcher type to a (bytes, seconds per cycle) tuple.
+    """
+    from .loop import UVLoop
+    loop = UVLoop(default=False)
+    a, b = socket.socketpair()
+    try:
+        watchers = {'timer': loop.timer(1.0),
+                    'prepare': loop.prepare(),
+                    'idle': loop.idle(),
+                    'check': loop.check(),
+                    'async': loop.async(),
+                    'io': loop.io(a.fileno(), 1),
+                    'signal': loop.signal(signal.SIGUSR1)}
+        results = {}
+        for name, watcher in watchers.items():
+            watcher.start(_noop)
+            size = watcher_size(watcher)
+            watcher.stop()
+            results[name] = (size, _start_stop(watcher, count))
+        return results
+    finally:
+        a.close()
+        b.close()
+        loop.destroy()
+
+
+# Workloads, each one gets the hub and a number of operations and returns the elapsed time
+
+def _bench_run_callback(hub, count):
+    from gevent.hub import Waiter
+    waiter = Waiter()
+    run_callback = hub.loop.run_callback
+    t0 = time.time()
+    for i in xrange(count - 1):
+        run_callback(_noop)
+    run_callback(waiter.switch, None)
+    waiter.get()
+    return time.time() - t0
+
+
+def _bench_sleep0(hub, count):
+    import gevent
+
+    def switch(n):
+        sleep = gevent.sleep
+        for i in xrange(n):
+            sleep(0)
+
+    t0 = time.time()
+    gevent.joinall([gevent.spawn(switch, count // 2) for i in xrange(2)])
+    return time.time() - t0
+
+
+def _bench_timer_churn(hub, count):
+    timer = hub.loop.timer
+    t0 = time.time()
+    for i in xrange(count):
+        t = timer(10.0)
+        t.start(_noop)
+        t.stop()
+    return time.time() - t0
+
+
+def _bench_io_churn(hub, count, pairs=64):
+    sockets = [socket.socketpair() for i in xrange(pairs)]
+    try:
+        watchers = [hub.loop.io(a.fileno(), 1) for a, b in sockets]
+        t0 = time.time()
+        for i in xrange(count):
+            watcher = watchers[i % pairs]
+            watcher.start(_noop)
+            watcher.stop()
+        return time.time() - t0
+    finally:
+        for a, b in sockets:
+            a.close()
+            b.close()
+
+
+def _bench_tcp_echo(hub, count, clients=10, size=1024):
+    import gevent
+    import gevent.socket
+
+    def serve(listener):
+        while True:
+            conn, address = listener.accept()
+            gevent.spawn(echo, conn)
+
+    def echo(conn):
+        try:
+            while True:
+                data = conn.recv(65536)
+                if not data:
+                    break
+                conn.sendall(data)
+        finally:
+            conn.close()
+
+    def client(address, n):
+        sock = gevent.socket.create_connection(address)
+        payload = b'x' * size
+        try:
+            for i in xrange(n):
+                sock.sendall(payload)
+                received = 0
+                while received < size:
+                    data = sock.recv(size - received)
+                    if not data:
+                        raise IOError('connection closed')
+                    received += len(data)
+        finally:
+            sock.close()
+
+    listener = gevent.socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(128)
+    server = gevent.spawn(serve, listener)
+    try:
+        t0 = time.time()
+        gevent.joinall([gevent.spawn(client, listener.getsockname(), count // clients) for i in xrange(clients)],
+                       raise_error=True)
+        return time.time() - t0
+    finally:
+        server.kill()
+        listener.close()
+
+
+def _bench_threadpool(hub, count):
+    apply = hub.threadpool.apply
+    # Start the worker thread outside of the measurement
+    apply(_noop)
+    t0 = time.time()
+    for i in xrange(count):
+        apply(_noop)
+    return time.time() - t0
+
+
+# (name, function, default number of operations)
+WORKLOADS = [('run_callback', _bench_run_callback, 200000),
+             ('sleep0', _bench_sleep0, 100000),
+             ('timer_churn', _bench_timer_churn, 100000),
+             ('io_churn', _bench_io_churn, 100000),
+             ('tcp_echo', _bench_tcp_echo, 20000),
+             ('threadpool', _bench_threadpool, 10000)]
+
+# Names accepted by --cores, and the keyword arguments for uvent.install (None keeps gevent's default core)
+CORES = {'libev': None,
+         'uvent': {},
+         'uvent-socket': {'socket': True}}
+
+
+def run_workloads(core, names=None, scale=1.0, repeat=3):
+    """Run workloads with the given core in the current process, which must not have created a hub yet.
+
+    Returns a dictionary with the loop class and, per workload, the number of
+    operations, the best time out of `repeat` runs and operations per second.
+    """
+    install = CORES[core]
+    if install is not None:
+        import uvent
+        uvent.install(**install)
+    from gevent.hub import get_hub
+    hub = get_hub()
+    results = {}
+    for name, func, count in WORKLOADS:
+        if names and name not in names:
+            continue
+        count = max(int(count * scale), 10)
+        best = min(func(hub, count) for i in xrange(repeat))
+        results[name] = {'operations': count,
+                         'seconds': round(best, 6),
+                         'ops_per_sec': round(count / best if best else 0, 1)}
+    loop_class = type(hub.loop)
+    return {'loop': '%s.%s' % (loop_class.__module__, loop_class.__name__), 'workloads': results}
+
+
+def run(cores=('libev', 'uvent'), names=None, scale=1.0, repeat=3):
+    """Run the workloads with each core in a child process and return all the results."""
+    import gevent
+    import pyuv
+    results = {'python': platform.python_version(),
+               'platform': platform.platform(),
+               'gevent': gevent.__version__,
+               'pyuv': pyuv.__version__,
+               'cores': {}}
+    for core in cores:
+        args = [sys.executable, '-m', 'uvent.bench', '--worker', core, '--scale', repr(scale), '--repeat', str(repeat)]
+        if names:
+            args += ['--workloads', ','.join(names)]
+        process = subprocess.Popen(args, stdout=subprocess.PIPE)
+        output = process.communicate()[0]
+        if process.returncode:
+            results['cores'][core] = {'error': 'exited with status %d' % process.returncode}
+        else:
+            results['cores'][core] = json.loads(output)
+    return results
+
+
+def main():
+    parser = optparse.OptionParser(usage='python -m uvent.bench [options]')
+    parser.add_option('--cores', default='libev,uvent',
+                      help='comma separated cores to compare, out of: %s [default: %%default]' % ', '.join(sorted(CORES)))
+    parser.add_option('--workloads', default='',
+                      help='comma separated workloads to run, out of: %s [default: all]' % ', '.join(w[0] for w in WORKLOADS))
+    parser.add_option('--scale', type='float', default=1.0, help='multiplier for the number of operations [default: %default]')
+    parser.add_option('--repeat', type='int', default=3, help='runs per workload, the best one counts [default: %default]')
+    parser.add_option('--watchers', action='store_true', help='print the size and start / stop cost of UVLoop watchers')
+    parser.add_option('--worker', help=optparse.SUPPRESS_HELP)
+    options, args = parser.parse_args()
+    names = [name for name in options.workloads.split(',') if name]
+    if options.watchers:
+        for name, (size, elapsed) in sorted(watcher_benchmarks().items()):
+            print('%-8s %5d bytes %8.0f ns per start/stop' % (name, size, elapsed * 1e9))
+    elif options.worker:
+        print(json.dumps(run_workloads(options.worker, names, options.scale, options.repeat)))
+    else:
+        cores = [core for core in options.cores.split(',') if core]
+        for core in cores:
+            if core not in CORES:
+                parser.error('unknown core: %s' % core)
+        print(json.dumps(run(cores, names, options.scale, options.repeat), indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
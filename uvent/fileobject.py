@@ -0,0 +1,469 @@
+# coding=utf8
+
+# Copyright (C) 2012 Saúl Ibarra Corretgé <saghul@gmail.com>
+#
+
+"""Cooperative file objects which do i/o in the libuv thread pool.
+
+Every operation is a pyuv.fs request, which runs in the thread pool of the
+loop and completes with a callback on the loop thread, so the calling
+greenlet is just switched out while the request runs. Regular files are
+read and written with positional requests at an offset kept by the file
+object, which makes it possible to read ahead: after a full sequential
+read the next chunk is requested right away, so it's usually there by the
+time it's asked for. Large reads are split into requests which run
+concurrently in the thread pool.
+"""
+
+from __future__ import absolute_import
+
+__all__ = ['FileObject', 'FileObjectUV', 'sendfile']
+
+import errno
+import os
+import pyuv
+
+from gevent.hub import get_hub
+from gevent.socket import timeout, wait_write
+
+from .util import uv_error
+from .waitable import Waitable
+
+
+def _request(func, loop, *args):
+    try:
+        # The pyuv loop is looked up every time, it changes after fork
+        return _Request(func, loop._loop, *args)
+    except pyuv.error.FSError as e:
+        raise uv_error(e.args[0])
+
+
+class _Request(Waitable):
+    """A pending pyuv.fs request, wait() blocks the current greenlet until it completes."""
+
+    __slots__ = ('done', 'result', 'errorno', '_waiter')
+
+    _waitable_kind = 'request'
+
+    def __init__(self, func, loop, *args):
+        self.done = False
+        self.result = None
+        self.errorno = None
+        self._waiter = None
+        func(loop, *(args + (self._on_done,)))
+
+    def _on_done(self, loop, path, *args):
+        self.done = True
+        self.errorno = args[-1]
+        if len(args) > 1:
+            self.result = args[0]
+        self._wake('_waiter')
+
+    def wait(self):
+        if not self.done:
+            self._wait('_waiter', None)
+        if self.errorno is not None:
+            raise uv_error(self.errorno)
+        return self.result
+
+
+def _fs_close(loop, fd, callback):
+    # pyuv 0.10's fs.close loses a reference to the loop each time it calls back, until the loop is freed under
+    # us, so the descriptor is closed with os.close in the thread pool instead
+    errors = []
+
+    def close():
+        try:
+            os.close(fd)
+        except OSError as e:
+            errors.append(getattr(pyuv.errno, 'UV_' + errno.errorcode.get(e.errno, ''), pyuv.errno.UV_EIO))
+
+    def done(errorno):
+        callback(loop, None, errors[0] if errors else errorno)
+    loop.queue_work(close, done)
+
+
+def _open_flags(mode):
+    mode = mode.replace('b', '').replace('t', '').replace('U', '')
+    if mode.startswith('r'):
+        flags = os.O_RDWR if '+' in mode else os.O_RDONLY
+    elif mode.startswith('w'):
+        flags = (os.O_RDWR if '+' in mode else os.O_WRONLY) | os.O_CREAT | os.O_TRUNC
+    elif mode.startswith('a'):
+        flags = (os.O_RDWR if '+' in mode else os.O_WRONLY) | os.O_CREAT | os.O_APPEND
+    else:
+        raise ValueError('invalid mode: %r' % mode)
+    return flags
+
+
+class FileObject(object):
+    """File object which reads and writes using pyuv.fs requests.
+
+    `fobj` may be a path, a file descriptor or an object with a fileno method.
+    `bufsize` is the size of the read ahead and write behind buffers, 0
+    disables both and a negative value selects `default_bufsize`.
+    """
+
+    # Size of the read ahead and write behind buffers, unless a bufsize is given
+    default_bufsize = 64 * 1024
+    # Reads larger than this are split in requests which run concurrently
+    max_request_size = 1024 * 1024
+
+    def __init__(self, fobj, mode=None, bufsize=-1, close=True):
+        self._loop = get_hub().loop
+        self._fobj = None
+        if isinstance(fobj, basestring):
+            mode = mode or 'r'
+            self._fd = _request(pyuv.fs.open, self._loop, fobj, _open_flags(mode), 0666).wait()
+            self.name = fobj
+            close = True
+        elif isinstance(fobj, (int, long)):
+            self._fd = fobj
+            self.name = '<fd:%d>' % fobj
+        else:
+            self._fobj = fobj
+            self._fd = fobj.fileno()
+            self.name = getattr(fobj, 'name', '<fd:%d>' % self._fd)
+            mode = mode or getattr(fobj, 'mode', None)
+        self.mode = mode = mode or 'r'
+        self._close = close
+        self._append = 'a' in mode
+        self._readable = 'r' in mode or '+' in mode
+        self._writable = 'w' in mode or 'a' in mode or '+' in mode
+        self._bufsize = self.default_bufsize if bufsize < 0 else bufsize
+        try:
+            self._pos = os.lseek(self._fd, 0, os.SEEK_CUR)
+        except OSError:
+            # Pipes, sockets and terminals are read and written at their current position
+            self._pos = None
+        self._rbuf = b''
+        self._prefetch = None
+        self._wbuf = []
+        self._wbuf_size = 0
+        self._closed = False
+
+    def __repr__(self):
+        return '<%s %r, mode %r at 0x%x>' % (self.__class__.__name__, self.name, self.mode, id(self))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def fileno(self):
+        return self._fd
+
+    def isatty(self):
+        self._check_closed()
+        return os.isatty(self._fd)
+
+    def _check_closed(self):
+        if self._closed:
+            raise ValueError('I/O operation on closed file')
+
+    def _check_readable(self):
+        self._check_closed()
+        if not self._readable:
+            raise IOError(9, 'File not open for reading')
+        if self._wbuf:
+            self._flush_writes()
+
+    def _check_writable(self):
+        self._check_closed()
+        if not self._writable:
+            raise IOError(9, 'File not open for writing')
+        if self._rbuf or self._prefetch is not None:
+            self._drop_read_buffer()
+
+    def _drop_read_buffer(self):
+        # Rewind to the logical position, a pending read ahead completes but its result is ignored
+        if self._pos is not None:
+            self._pos -= len(self._rbuf)
+        self._rbuf = b''
+        self._prefetch = None
+
+    # Reading
+
+    def _read_request(self, offset, length):
+        return _request(pyuv.fs.read, self._loop, self._fd, length, offset), length
+
+    def _read_chunks(self, size, chunks):
+        """Read up to size bytes at the current position, appending them to chunks.
+
+        Returns False at end of file.
+        """
+        requests = []
+        if self._prefetch is not None:
+            requests.append(self._prefetch)
+            self._prefetch = None
+            size -= requests[0][1]
+        if self._pos is None:
+            if not requests:
+                requests.append(self._read_request(-1, max(size, self._bufsize)))
+        else:
+            offset = self._pos + sum(length for req, length in requests)
+            if not requests:
+                size = max(size, self._bufsize)
+            while size > 0:
+                length = min(size, self.max_request_size)
+                requests.append(self._read_request(offset, length))
+                offset += length
+                size -= length
+        for req, length in requests:
+            data = req.wait()
+            if data:
+                chunks.append(data)
+                if self._pos is not None:
+                    self._pos += len(data)
+            if len(data) < length:
+                return bool(data)
+        if self._bufsize and self._pos is not None:
+            self._prefetch = self._read_request(self._pos, self._bufsize)
+        return True
+
+    def _read_into_buffer(self, size):
+        """Make sure at least size bytes are buffered, unless the end of file is reached first."""
+        chunks = [self._rbuf]
+        buffered = len(self._rbuf)
+        try:
+            while buffered < size:
+                n = len(chunks)
+                if not self._read_chunks(size - buffered, chunks):
+                    break
+                buffered += sum(len(data) for data in chunks[n:])
+        finally:
+            # Whatever was read is kept, even if the wait was interrupted
+            self._rbuf = chunks[0] if len(chunks) == 1 else b''.join(chunks)
+
+    def read(self, size=-1):
+        self._check_readable()
+        if size is None or size < 0:
+            chunks = [self._rbuf]
+            try:
+                while self._read_chunks(self.max_request_size, chunks):
+                    pass
+            finally:
+                self._rbuf = b''.join(chunks)
+        elif size > len(self._rbuf):
+            self._read_into_buffer(size)
+        if size is None or size < 0 or size >= len(self._rbuf):
+            data, self._rbuf = self._rbuf, b''
+        else:
+            data, self._rbuf = self._rbuf[:size], self._rbuf[size:]
+        return data
+
+    def readinto(self, buf):
+        """Read into a caller provided (writable buffer) object, returns the number of bytes read."""
+        self._check_readable()
+        view = memoryview(buf)
+        size = len(view)
+        copied = min(size, len(self._rbuf))
+        if copied:
+            view[:copied] = self._rbuf[:copied]
+            self._rbuf = self._rbuf[copied:]
+        if copied == size:
+            return copied
+        # Large reads go straight into the buffer instead of through the read buffer
+        chunks = []
+        try:
+            self._read_chunks(size - copied, chunks)
+        finally:
+            for data in chunks:
+                n = min(len(data), size - copied)
+                view[copied:copied + n] = data[:n] if n < len(data) else data
+                copied += n
+                if n < len(data):
+                    self._rbuf += data[n:]
+        return copied
+
+    def readline(self, size=-1):
+        self._check_readable()
+        start = 0
+        while True:
+            index = self._rbuf.find(b'\n', start)
+            if index >= 0:
+                end = index + 1
+                break
+            if 0 <= size <= len(self._rbuf):
+                end = size
+                break
+            start = len(self._rbuf)
+            self._read_into_buffer(start + 1)
+            if len(self._rbuf) == start:
+                end = start
+                break
+        if 0 <= size < end:
+            end = size
+        data, self._rbuf = self._rbuf[:end], self._rbuf[end:]
+        return data
+
+    def readlines(self, hint=-1):
+        lines = []
+        total = 0
+        for line in self:
+            lines.append(line)
+            total += len(line)
+            if 0 < hint <= total:
+                break
+        return lines
+
+    xreadlines = __iter__
+
+    # Writing
+
+    def _write_all(self, data):
+        total = 0
+        while total < len(data):
+            offset = -1 if self._pos is None or self._append else self._pos
+            # pyuv copies the data, a buffer avoids copying what's left of it once more
+            chunk = buffer(data, total) if total else data
+            written = _request(pyuv.fs.write, self._loop, self._fd, chunk, offset).wait()
+            total += written
+            if self._pos is not None:
+                self._pos = os.lseek(self._fd, 0, os.SEEK_CUR) if self._append else self._pos + written
+
+    def _flush_writes(self):
+        data = b''.join(self._wbuf)
+        del self._wbuf[:]
+        self._wbuf_size = 0
+        self._write_all(data)
+
+    def write(self, data):
+        self._check_writable()
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        if self._wbuf_size + len(data) < self._bufsize:
+            # Buffered data must not change in the meantime
+            self._wbuf.append(data if isinstance(data, bytes) else bytes(data))
+            self._wbuf_size += len(data)
+            return
+        if self._wbuf:
+            self._wbuf.append(data)
+            self._flush_writes()
+        else:
+            self._write_all(data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        self._check_closed()
+        if self._wbuf:
+            self._flush_writes()
+
+    def fsync(self):
+        self.flush()
+        _request(pyuv.fs.fsync, self._loop, self._fd).wait()
+
+    def fdatasync(self):
+        self.flush()
+        _request(pyuv.fs.fdatasync, self._loop, self._fd).wait()
+
+    def truncate(self, size=None):
+        self.flush()
+        self._drop_read_buffer()
+        if size is None:
+            size = self.tell()
+        _request(pyuv.fs.ftruncate, self._loop, self._fd, size).wait()
+
+    # Positioning and metadata
+
+    def tell(self):
+        self._check_closed()
+        if self._pos is None:
+            return os.lseek(self._fd, 0, os.SEEK_CUR)
+        return self._pos - len(self._rbuf) + self._wbuf_size
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        self.flush()
+        if whence == os.SEEK_CUR:
+            offset, whence = self.tell() + offset, os.SEEK_SET
+        self._drop_read_buffer()
+        if whence == os.SEEK_SET and self._pos is not None:
+            # No system call needed, requests carry the offset
+            self._pos = offset
+        else:
+            self._pos = os.lseek(self._fd, offset, whence)
+
+    def stat(self):
+        self._check_closed()
+        return _request(pyuv.fs.fstat, self._loop, self._fd).wait()
+
+    def close(self):
+        if self._closed:
+            return
+        try:
+            self.flush()
+        finally:
+            self._closed = True
+            self._drop_read_buffer()
+            if self._fobj is not None:
+                if self._close:
+                    self._fobj.close()
+                elif self._pos is not None:
+                    os.lseek(self._fd, self._pos, os.SEEK_SET)
+            elif self._close:
+                _request(_fs_close, self._loop, self._fd).wait()
+            elif self._pos is not None:
+                # Leave the descriptor where a regular file object would have left it
+                os.lseek(self._fd, self._pos, os.SEEK_SET)
+
+
+FileObjectUV = FileObject
+
+# Bytes handed to a single sendfile request, the kernel sends less if the socket buffer fills up
+sendfile_chunk_size = 4 * 1024 * 1024
+
+
+def sendfile(sock, file, offset=0, count=None):
+    """Send count bytes of file (up to its end if None) starting at offset to a stream socket.
+
+    `file` may be a file descriptor or an object with a fileno method. The data
+    is copied by the kernel, each chunk with a sendfile request in the thread
+    pool, and the calling greenlet waits for the socket to become writable
+    when its buffer is full (honouring the socket timeout). Returns the number
+    of bytes sent, which is less than count only if the file ends first.
+    With a uvent socket, the data it was given before is sent first.
+    """
+    from .socket import _Stream
+    loop = get_hub().loop
+    if isinstance(file, FileObject):
+        # Data in the write behind buffer wouldn't be sent
+        file.flush()
+    in_fd = file if isinstance(file, (int, long)) else file.fileno()
+    out_fd = sock.fileno()
+    transport = getattr(sock, '_transport', None)
+    if isinstance(transport, _Stream):
+        # What a uvent socket handed to libuv (headers, say) is still to be written, it goes first
+        transport.wait_writable(getattr(sock, 'timeout', None))
+    if count is None:
+        count = max(_request(pyuv.fs.fstat, loop, in_fd).wait().st_size - offset, 0)
+    sent = 0
+    while sent < count:
+        try:
+            n = _request(pyuv.fs.sendfile, loop, out_fd, in_fd, offset + sent, min(count - sent, sendfile_chunk_size)).wait()
+        except IOError as e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+            wait_write(out_fd, getattr(sock, 'timeout', None), timeout('timed out'))
+            continue
+        if not n:
+            # End of file
+            break
+        sent += n
+    return sent
@@ -6,65 +6,233 @@
 __all__ = ['UVLoop']
 
 import atexit
+import collections
+import errno
 import functools
 import os
 import traceback
+import warnings
 import pyuv
+import select
 import signal
 import sys
 
-from .util import set_nonblocking, close_fd, SharedPoll
+from .util import set_nonblocking, close_fd, PollBatcher, SharedPoll, SharedStat, SharedTimer, TimerWheel
 
 
-if hasattr(signal, 'set_wakeup_fd') and os.name == 'posix':
-    rfd, wfd = os.pipe()
-    set_nonblocking(rfd)
-    set_nonblocking(wfd)
-    try:
-        old_wakeup_fd = signal.set_wakeup_fd(wfd)
-        if old_wakeup_fd != -1:
-            signal.set_wakeup_fd(old_wakeup_fd)
+def _setup_signal_pipe():
+    global _signal_check_rfd, _signal_check_wfd
+    if hasattr(signal, 'set_wakeup_fd') and os.name == 'posix':
+        rfd, wfd = os.pipe()
+        set_nonblocking(rfd)
+        set_nonblocking(wfd)
+        try:
+            old_wakeup_fd = signal.set_wakeup_fd(wfd)
+            if old_wakeup_fd != -1 and old_wakeup_fd != _signal_check_wfd:
+                signal.set_wakeup_fd(old_wakeup_fd)
+                close_fd(rfd)
+                close_fd(wfd)
+            else:
+                _signal_check_rfd, _signal_check_wfd = rfd, wfd
+                atexit.register(close_fd, rfd)
+                atexit.register(close_fd, wfd)
+        except ValueError:
+            _signal_check_rfd, _signal_check_wfd = None, None
             close_fd(rfd)
             close_fd(wfd)
-        else:
-            _signal_check_rfd, _signal_check_wfd = rfd, wfd
-            atexit.register(close_fd, rfd)
-            atexit.register(close_fd, wfd)
-    except ValueError:
+    else:
         _signal_check_rfd, _signal_check_wfd = None, None
-        close_fd(rfd)
-        close_fd(wfd)
+
+_signal_check_rfd, _signal_check_wfd = None, None
+_setup_signal_pipe()
+_signal_pipe_pid = os.getpid()
+
+
+def _reinit_signal_pipe():
+    # The pipe is shared with the parent after fork, signals would wake up either process
+    global _signal_pipe_pid
+    if _signal_pipe_pid != os.getpid() and _signal_check_rfd is not None:
+        _signal_pipe_pid = os.getpid()
+        rfd, wfd = _signal_check_rfd, _signal_check_wfd
+        _setup_signal_pipe()
+        if _signal_check_rfd != rfd:
+            close_fd(rfd)
+            close_fd(wfd)
+
+
+if sys.platform.startswith('linux'):
+    _backend = 'epoll'
+elif sys.platform == 'win32':
+    _backend = 'iocp'
+elif sys.platform.startswith('sunos'):
+    _backend = 'port'
 else:
-    _signal_check_rfd, _signal_check_wfd = None, None
+    _backend = 'kqueue'
+
+# Same values as libev's EVBACKEND_* constants, IOCP has no libev counterpart
+_backend_int = {'epoll': 4, 'kqueue': 8, 'port': 32}.get(_backend, 0)
+
+
+def _stop_handle(handle):
+    handle.stop()
+
+
+# Pooled handles call back through these, so a handle in the pool doesn't keep its last watcher alive
+
+def _timer_cb(handle):
+    handle.watcher._fire()
+
+
+def _watcher_cb(handle):
+    handle.watcher._run_callback()
+
+
+def _warn_reaping():
+    warnings.warn('libuv reaps any child once a pyuv.Process was spawned, child watchers may miss exit statuses',
+                  RuntimeWarning, stacklevel=3)
+
+
+def _detach_backend(loop):
+    # After fork the epoll descriptor of a loop is shared with the parent, if the loop was running it polls
+    # once more (and unregisters the fds it's no longer interested in), so give it an empty one of its own
+    try:
+        poller = select.epoll() if hasattr(select, 'epoll') else select.kqueue()
+    except (AttributeError, EnvironmentError):
+        return
+    try:
+        os.dup2(poller.fileno(), loop.fileno())
+    finally:
+        poller.close()
 
 
 class UVLoop(object):
     MINPRI = -2
     MAXPRI = 2
 
+    # Resolution (in seconds) of the timing wheel which drives all timer watchers
+    # using a single pyuv.Timer. If None, each timer watcher gets its own pyuv.Timer.
+    timer_resolution = None
+
+    # Maximum number of run_callback callbacks run per loop iteration
+    callback_budget = 1000
+
+    # Maximum time (in seconds) spent running run_callback callbacks per loop iteration,
+    # checked after each callback. If None, only callback_budget applies.
+    callback_time_budget = None
+
+    # If True, changes to the events of io watchers are applied once per loop iteration,
+    # right before polling for i/o, instead of immediately
+    deferred_poll_updates = False
+
+    # If True, stat watchers are notified of changes by FSEvent (inotify) handles on the directories
+    # of the watched paths instead of polling them, see uvent.util.SharedStat
+    fsevent_stat_watchers = False
+
+    # If not None, profiling is started when the loop is created, callbacks which take longer
+    # than this many seconds are reported, see start_profiling
+    slow_callback_threshold = None
+
+    # Maximum number of stopped handles of each type kept for reuse by timer, prepare, idle and check
+    # watchers, which only hold a handle while they are started. 0 disables the pools
+    handle_pool_size = 64
+
+    # If True, loop iterations and the time spent polling for i/o are counted from the start. Otherwise
+    # they are only counted once stats() or iteration has been asked for, as they cost two Python
+    # callbacks per loop iteration
+    collect_stats = False
+
     def __init__(self, flags=None, default=True):
+        if default is None:
+            # What gevent passes for the main thread, as libev does it means the default loop
+            default = True
         if default:
             self._loop = pyuv.Loop.default_loop()
         else:
             self._loop = pyuv.Loop()
+        self._default = default
+        self._pid = os.getpid()
+        # run_callback queues, from MAXPRI down to MINPRI
+        self._callback_queues = [collections.deque() for i in xrange(self.MAXPRI - self.MINPRI + 1)]
+        self._callbacks = self._callback_queues[self.MAXPRI]
+        # Number of started watchers with a non default priority, while there are any
+        # watcher callbacks are queued and run in priority order
+        self._prioritized = 0
+        self._threadsafe_callbacks = collections.deque()
+        self._async_queue = collections.deque()
+        self._async_refs = 0
+        self._child_watchers = {}
+        # pid -> uvent.process.Process, for children spawned with pyuv.Process
+        self._processes = {}
+        self._fork_watchers = set()
+        self._watchers = set()
+        self._active_watchers = {}
+        self._sigchld_handle = None
+        self._iteration = 0
+        self._depth = 0
+        self._run_start = 0
+        self._run_time = 0
+        self._poll_start = 0
+        self._io_time = 0
+        self._profiler = None
+        self._handle_pool_hits = 0
+        self._handle_pool_misses = 0
+        self._collecting_stats = self.collect_stats
+        self._setup_loop()
+        if self.slow_callback_threshold is not None:
+            self.start_profiling(self.slow_callback_threshold)
+
+    def _setup_loop(self):
+        # Everything which is attached to the pyuv loop, see reinit
         self._loop._poll_handles = {}
+        # Set once a pyuv.Process has been spawned, from then on libuv reaps any child too
+        self._loop._reaping = False
+        self._loop._stat_dispatcher = None
+        if self.timer_resolution:
+            self._loop._timer_wheel = TimerWheel(self._loop, self.timer_resolution)
+        else:
+            self._loop._timer_wheel = None
         self._loop.excepthook = functools.partial(self.handle_error, None)
+        # Handle type -> stopped handles of the loop
+        self._handle_pools = {}
         self._callback_watcher = pyuv.Prepare(self._loop)
         self._callback_spinner = pyuv.Idle(self._loop)
-        self._callbacks = []
-        self._child_watchers = {}
-        self._watchers = set()
-        self._sigchld_handle = None
+        # A single Async handle wakes up all async watchers and run_callback_threadsafe callbacks,
+        # it's referenced while there are referenced async watchers
+        self._async_handle = pyuv.Async(self._loop, self._on_async)
+        if not self._async_refs:
+            self._async_handle.unref()
+        if self.deferred_poll_updates:
+            self._loop._poll_batcher = PollBatcher(self._loop)
+        else:
+            self._loop._poll_batcher = None
+        self._stats_prepare = None
+        self._stats_check = None
+        if self._collecting_stats:
+            self._start_stats()
         if _signal_check_rfd is not None:
-            self._signal_checker = pyuv.util.SignalChecker(self._loop, _signal_check_rfd)
-            self._signal_checker.start()
+            # Not pyuv.util.SignalChecker: it drains the pipe with recv(), which fails on a pipe and
+            # stops the handle, and it drops a reference to itself on every wakeup
+            self._signal_checker = pyuv.Poll(self._loop, _signal_check_rfd)
+            self._signal_checker.start(pyuv.UV_READABLE, self._on_signal_pipe)
         else:
             self._signal_checker = None
 
     def destroy(self):
+        self.stop_profiling()
         self._watchers.clear()
-        self._callbacks = []
+        self._active_watchers.clear()
+        self._fork_watchers.clear()
+        self._processes.clear()
+        self._handle_pools.clear()
+        for queue in self._callback_queues:
+            queue.clear()
+        self._prioritized = 0
+        self._stats_prepare = None
+        self._stats_check = None
         self._callback_watcher = None
+        self._async_handle = None
+        self._async_queue.clear()
+        self._threadsafe_callbacks.clear()
         self._sigchld_handle = None
         self._signal_checker = None
         self._loop = None
@@ -92,10 +260,61 @@ class UVLoop(object):
             mode = pyuv.UV_RUN_ONCE
         else:
             mode = pyuv.UV_RUN_DEFAULT
-        self._loop.run(mode)
+        self._depth += 1
+        if self._depth == 1:
+            self._run_start = pyuv.util.hrtime()
+        try:
+            while True:
+                loop = self._loop
+                loop.run(mode)
+                if loop is self._loop:
+                    break
+                # The loop was replaced by reinit (after fork) while it was running, carry on with the new one
+        finally:
+            self._depth -= 1
+            if not self._depth:
+                self._run_time += pyuv.util.hrtime() - self._run_start
 
     def reinit(self):
-        pass
+        """Start over with a new pyuv loop in a forked child process.
+
+        libuv can't reinitialize a loop after fork (its epoll / kqueue descriptor
+        is shared with the parent), so a new loop is created and the handles of
+        started watchers are recreated on it. Watchers which are stopped get a new
+        handle when they are started again. Fork watchers are run soon after.
+        """
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        _reinit_signal_pipe()
+        old_loop = self._loop
+        _detach_backend(old_loop)
+        if old_loop._stat_dispatcher is not None:
+            old_loop._stat_dispatcher.abandon()
+        # Signal handles must be stopped, or libuv would keep delivering signals to the old loop
+        if self._sigchld_handle is not None:
+            self._sigchld_handle.close()
+            self._sigchld_handle = None
+        for handle in (self._callback_watcher, self._callback_spinner, self._stats_prepare, self._stats_check, self._signal_checker):
+            if handle is not None:
+                handle.stop()
+        self._loop = pyuv.Loop()
+        self._setup_loop()
+        # Children spawned by the parent are not ours
+        self._processes.clear()
+        if self._child_watchers:
+            self.install_sigchld()
+        for watcher in list(self._watchers):
+            watcher._reinit()
+        for watcher in list(self._fork_watchers):
+            self.run_callback(watcher._run_callback)
+        if self._threadsafe_callbacks or self._async_queue:
+            self._async_handle.send()
+        if self._profiler is not None:
+            self._profiler._reinit()
+        if self._depth:
+            # The hub is running the old loop, make it return after the current iteration
+            old_loop.stop()
 
     def ref(self):
         raise NotImplementedError
@@ -117,31 +336,34 @@ class UVLoop(object):
 
     @property
     def default(self):
-        return self._loop.default
+        return self._default
 
     @property
     def iteration(self):
-        raise NotImplementedError
+        if self._stats_check is None and self._loop is not None:
+            self._collecting_stats = True
+            self._start_stats()
+        return self._iteration
 
     @property
     def depth(self):
-        raise NotImplementedError
+        return self._depth
 
     @property
     def backend(self):
-        raise NotImplementedError
+        return _backend
 
     @property
     def backend_int(self):
-        raise NotImplementedError
+        return _backend_int
 
     @property
     def pendingcnt(self):
-        raise NotImplementedError
+        return sum(len(queue) for queue in self._callback_queues)
 
     @property
     def activecnt(self):
-        raise NotImplementedError
+        return len(self._watchers)
 
     @property
     def origflags(self):
@@ -152,28 +374,28 @@ class UVLoop(object):
         raise NotImplementedError
 
     def io(self, fd, events, ref=True, priority=None):
-        return Io(self, fd, events, ref)
+        return Io(self, fd, events, ref, priority)
 
     def timer(self, after, repeat=0.0, ref=True, priority=None):
-        return Timer(self, after, repeat, ref)
+        return Timer(self, after, repeat, ref, priority)
 
     def prepare(self, ref=True, priority=None):
-        return Prepare(self, ref)
+        return Prepare(self, ref, priority)
 
     def idle(self, ref=True, priority=None):
-        return Idle(self, ref)
+        return Idle(self, ref, priority)
 
     def check(self, ref=True, priority=None):
-        return Check(self, ref)
+        return Check(self, ref, priority)
 
     def async(self, ref=True, priority=None):
-        return Async(self, ref)
+        return Async(self, ref, priority)
 
     def stat(self, path, interval=0.0, ref=True, priority=None):
-        return Stat(self, path, interval, ref)
+        return Stat(self, path, interval, ref, priority)
 
     def fork(self, ref=True, priority=None):
-        return NoOp(self, ref)
+        return Fork(self, ref, priority)
 
     def child(self, pid, trace=False, ref=True):
         if sys.platform == 'win32':
@@ -183,48 +405,274 @@ class UVLoop(object):
     def install_sigchld(self):
         if sys.platform == 'win32':
             raise NotImplementedError
-        if self._loop.default and self._sigchld_handle is None:
+        if self._default and self._sigchld_handle is None:
             self._sigchld_handle = pyuv.Signal(self._loop)
             self._sigchld_handle.start(self._handle_SIGCHLD, signal.SIGCHLD)
             self._sigchld_handle.unref()
+            # Children may have exited before there was a handler, reap them once the watchers are started
+            self.run_callback(self._handle_SIGCHLD, None, signal.SIGCHLD)
 
     def signal(self, signum, ref=True, priority=None):
-        return Signal(self, signum, ref)
+        return Signal(self, signum, ref, priority)
 
-    def run_callback(self, func, *args):
+    def run_callback(self, func, *args, **kw):
         cb = Callback(func, args)
-        self._callbacks.append(cb)
+        priority = kw.pop('priority', 0) if kw else 0
+        if kw:
+            raise TypeError('run_callback() got unexpected keyword arguments: %s' % ', '.join(kw))
+        if priority:
+            # Callbacks with a higher priority are run first
+            self._callback_queues[self.MAXPRI - min(max(priority, self.MINPRI), self.MAXPRI)].append(cb)
+        else:
+            self._callbacks.append(cb)
         if not self._callback_watcher.active:
             self._callback_watcher.start(self._run_callbacks)
         return cb
 
+    def run_callback_threadsafe(self, func, *args):
+        """Like run_callback, but it can be called from any thread.
+
+        Callbacks are queued and the loop is woken up with an Async handle,
+        libuv coalesces the wakeups until the loop gets to run them. Raises
+        RuntimeError if the loop has been destroyed.
+        """
+        # destroy may run in the loop's thread meanwhile, read the handle once
+        handle = self._async_handle
+        if handle is None:
+            raise RuntimeError('run_callback_threadsafe() called on a destroyed loop')
+        cb = Callback(func, args)
+        # deque.append is atomic
+        self._threadsafe_callbacks.append(cb)
+        handle.send()
+        return cb
+
     def fileno(self):
         raise NotImplementedError
 
-    def _run_callbacks(self, h):
-        count = 1000
-        while self._callbacks and count > 0:
-            callbacks, self._callbacks = self._callbacks, []
-            for cb in callbacks:
-                if None in (cb.callback, cb.args):
+    def stats(self):
+        """Return a snapshot of the loop counters. Times are cumulative, in seconds.
+
+        Loop iterations and the time spent polling for i/o are counted from the
+        first call, unless collect_stats is set.
+        """
+        if self._stats_check is None:
+            self._collecting_stats = True
+            self._start_stats()
+        run_time = self._run_time
+        if self._depth:
+            run_time += pyuv.util.hrtime() - self._run_start
+        io_time = self._io_time
+        batcher = self._loop._poll_batcher
+        stat_dispatcher = self._loop._stat_dispatcher
+        return {'iteration': self._iteration,
+                'depth': self._depth,
+                'pending': self.pendingcnt,
+                'active': len(self._watchers),
+                'watchers': dict((name, count) for name, count in self._active_watchers.iteritems() if count),
+                'run_time': run_time / 1e9,
+                'io_time': io_time / 1e9,
+                'callback_time': (run_time - io_time) / 1e9,
+                'poll_updates_saved': batcher.saved if batcher is not None else 0,
+                'stat_events': stat_dispatcher.events if stat_dispatcher is not None else 0,
+                'stat_calls': stat_dispatcher.stats if stat_dispatcher is not None else 0,
+                'handle_pool_hits': self._handle_pool_hits,
+                'handle_pool_misses': self._handle_pool_misses,
+                'pooled_handles': sum(len(pool) for pool in self._handle_pools.itervalues())}
+
+    @property
+    def profiler(self):
+        return self._profiler
+
+    def start_profiling(self, threshold=0.1, report=None):
+        """Time every callback the loop runs and report those which take longer than threshold seconds.
+
+        Returns the uvent.profiler.Profiler, which also keeps latency histograms per
+        watcher type. report(record) is called for each slow callback, by default
+        they are printed to stderr.
+        """
+        if self._profiler is None:
+            from .profiler import Profiler
+            self._profiler = Profiler(self, threshold, report)
+            self._profiler.start()
+        return self._profiler
+
+    def stop_profiling(self):
+        profiler, self._profiler = self._profiler, None
+        if profiler is not None:
+            profiler._stop()
+        return profiler
+
+    def _add_watcher(self, watcher):
+        watchers = self._watchers
+        if watcher not in watchers:
+            watchers.add(watcher)
+            name = watcher.__class__.__name__
+            self._active_watchers[name] = self._active_watchers.get(name, 0) + 1
+            if watcher._priority:
+                self._prioritized += 1
+
+    def _remove_watcher(self, watcher):
+        watchers = self._watchers
+        if watcher in watchers:
+            watchers.remove(watcher)
+            self._active_watchers[watcher.__class__.__name__] -= 1
+            if watcher._priority:
+                self._prioritized -= 1
+
+    def _take_handle(self, handle_type):
+        # A stopped handle of the given type from the pool, or a new one
+        pool = self._handle_pools.get(handle_type)
+        if pool:
+            self._handle_pool_hits += 1
+            return pool.pop()
+        self._handle_pool_misses += 1
+        return handle_type(self._loop)
+
+    def _release_handle(self, handle):
+        # Called with stopped handles
+        pool = self._handle_pools.setdefault(type(handle), [])
+        if handle.loop is self._loop and len(pool) < self.handle_pool_size:
+            handle.ref()
+            pool.append(handle)
+        else:
+            handle.close()
+
+    def _start_stats(self):
+        self._stats_prepare = pyuv.Prepare(self._loop)
+        self._stats_prepare.start(self._on_prepare)
+        self._stats_prepare.unref()
+        self._stats_check = pyuv.Check(self._loop)
+        self._stats_check.start(self._on_check)
+        self._stats_check.unref()
+        # Prepare handles started later run first, the ones started before are started again so that
+        # this one runs last, right before polling for i/o (the batcher's after the callbacks which change
+        # the poll interest)
+        batcher = self._loop._poll_batcher
+        if batcher is not None:
+            batcher.restart()
+        if self._callback_watcher.active:
+            self._callback_watcher.stop()
+            self._callback_watcher.start(self._run_callbacks)
+
+    def _on_prepare(self, handle):
+        self._poll_start = pyuv.util.hrtime()
+
+    def _on_check(self, handle):
+        self._iteration += 1
+        if self._poll_start:
+            self._end_poll()
+
+    def _end_poll(self):
+        # Called by the first callback run after polling for i/o (or by the check handle)
+        self._io_time += pyuv.util.hrtime() - self._poll_start
+        self._poll_start = 0
+
+    def _run_callbacks(self, handle, run=None):
+        # run(callback, args) calls the callback instead, if given (the profiler times them with it)
+        count = self.callback_budget
+        if self.callback_time_budget is not None:
+            deadline = pyuv.util.hrtime() + int(self.callback_time_budget * 1e9)
+        else:
+            deadline = None
+        for callbacks in self._callback_queues:
+            popleft = callbacks.popleft
+            while callbacks and count > 0:
+                cb = popleft()
+                callback = cb.callback
+                if callback is None:
                     continue
+                # pending is cleared before running the callback, but it's nonzero until it finishes
+                cb.callback = None
                 try:
-                    cb.callback(*cb.args)
+                    if run is None:
+                        callback(*cb.args)
+                    else:
+                        run(callback, cb.args)
+                except:
+                    self.handle_error(cb, *sys.exc_info())
                 finally:
-                    cb.callback = None
                     cb.args = None
                 count -= 1
-        if self._callbacks:
+                if deadline is not None and pyuv.util.hrtime() >= deadline:
+                    count = 0
+        if any(self._callback_queues):
             # Start a Idle handle, which will force the loop not to block for io in the next iteration
-            self._callback_spinner.start(lambda h: h.stop())
+            self._callback_spinner.start(_stop_handle)
         else:
             self._callback_watcher.stop()
 
+    def _async_send(self, watcher):
+        # Called from any thread. As with libev, sending to the watcher of a destroyed loop does nothing
+        handle = self._async_handle
+        if handle is not None:
+            self._async_queue.append(watcher)
+            handle.send()
+
+    def _async_ref(self, delta):
+        self._async_refs += delta
+        if self._async_refs == delta and delta > 0:
+            self._async_handle.ref()
+        elif not self._async_refs:
+            self._async_handle.unref()
+
+    def _on_signal_pipe(self, handle, events, error):
+        # Python signal handlers run as pending calls while this executes, they only need the loop to wake up
+        try:
+            while os.read(_signal_check_rfd, 1024):
+                pass
+        except OSError as e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                raise
+
+    def _on_async(self, handle):
+        queue = self._threadsafe_callbacks
+        if queue:
+            popleft = queue.popleft
+            append = self._callbacks.append
+            while queue:
+                append(popleft())
+            if not self._callback_watcher.active:
+                self._callback_watcher.start(self._run_callbacks)
+        queue = self._async_queue
+        popleft = queue.popleft
+        # Watchers sent again by the callbacks are run in the next iteration
+        for i in xrange(len(queue)):
+            watcher = popleft()
+            if watcher._sent:
+                watcher._sent = False
+                if watcher._active:
+                    watcher._fire()
+
+    def _add_process(self, process):
+        # uvent's SIGCHLD handler may reap the child before libuv does
+        self._processes[process.pid] = process
+        if not self._loop._reaping:
+            self._loop._reaping = True
+            if self._child_watchers:
+                _warn_reaping()
+
     def _handle_SIGCHLD(self, handle, signum):
-        pid, status, usage = os.wait3(os.WNOHANG)
-        child = self._child_watchers.get(pid, None) or self._child_watchers.get(0, None)
-        if child is not None:
-            child._set_status(status)
+        # Signals are coalesced, so reap children until there are no more which exited. Child
+        # watchers are sent, all of them run in the same loop iteration when the async handle fires
+        watchers = self._child_watchers
+        processes = self._processes
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                # ECHILD, there are no children left
+                break
+            if not pid:
+                break
+            process = processes.pop(pid, None)
+            if process is not None:
+                # Spawned with pyuv.Process, libuv won't see its exit status now
+                process._reaped(status)
+            child = watchers.get(pid, None) or watchers.get(0, None)
+            if child is not None:
+                child._set_status(pid, status)
 
     def _format(self):
         msg = ''
@@ -237,6 +685,7 @@ class UVLoop(object):
 
 
 class Callback(object):
+    __slots__ = ('callback', 'args')
 
     def __init__(self, callback, args):
         self.callback = callback
@@ -277,23 +726,44 @@ class Callback(object):
 
 
 class Watcher(object):
+    __slots__ = ('loop', '_priority', '_pending', '_ref', '_callback', '_args', '_handle')
 
-    def __init__(self, loop, ref=True):
+    def __init__(self, loop, ref=True, priority=None):
         self.loop = loop
+        self._priority = 0
+        self._pending = False
         self._ref = ref
         self._callback = None
+        self._args = None
+        self._handle = None
+        if priority:
+            self.priority = priority
 
     @property
     def callback(self):
         return self._callback
 
+    @property
+    def args(self):
+        return self._args
+
     @property
     def active(self):
         return self._handle and self._handle.active
 
     @property
     def pending(self):
-        return False
+        return self._pending
+
+    def _get_priority(self):
+        return self._priority
+    def _set_priority(self, value):
+        value = min(max(int(value or 0), UVLoop.MINPRI), UVLoop.MAXPRI)
+        if self in self.loop._watchers:
+            self.loop._prioritized += bool(value) - bool(self._priority)
+        self._priority = value
+    priority = property(_get_priority, _set_priority)
+    del _get_priority, _set_priority
 
     def _get_ref(self):
         return self._ref
@@ -305,21 +775,75 @@ class Watcher(object):
     ref = property(_get_ref, _set_ref)
     del _get_ref, _set_ref
 
+    def _new_handle(self):
+        return None
+
+    def _take_handle(self):
+        # For watchers with pooled handles, which only hold one while they are started
+        handle = self._handle
+        if handle is None:
+            handle = self._handle = self.loop._take_handle(self._handle_type())
+            handle.watcher = self
+        return handle
+
+    def _release_handle(self):
+        handle, self._handle = self._handle, None
+        if handle is not None:
+            handle.stop()
+            handle.watcher = None
+            self.loop._release_handle(handle)
+
+    def _check_handle(self):
+        if self._handle is not None and self._handle.loop is not self.loop._loop:
+            # Created before the loop was reinitialized after fork
+            self._handle = self._new_handle()
+
+    def _reinit(self):
+        # Called by UVLoop.reinit for started watchers
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = self._new_handle()
+            self.start(self._callback, *self._args)
+
     def start(self, callback, *args):
-        self.loop._watchers.add(self)
-        self._callback = functools.partial(callback, *args)
+        if self._handle is not None and self._handle.loop is not self.loop._loop:
+            self._check_handle()
+        self.loop._add_watcher(self)
+        self._callback = callback
+        self._args = args
 
     def stop(self):
-        self.loop._watchers.discard(self)
+        self.loop._remove_watcher(self)
+        self._pending = False
         self._callback = None
+        self._args = None
 
     def feed(self, revents, callback, *args):
         raise NotImplementedError
 
+    def _fire(self):
+        # Called when the handle of a watcher which waits for events fires. While there are watchers with
+        # a non default priority, the callback is queued with the watcher's priority instead, the queues
+        # are run by priority (before the loop polls for i/o again)
+        if self.loop._prioritized:
+            if not self._pending:
+                self._pending = True
+                self.loop.run_callback(self._run_pending, priority=self._priority)
+        else:
+            self._run_callback()
+
+    def _run_pending(self):
+        # Stopping the watcher in the meantime cancels it
+        if self._pending:
+            self._pending = False
+            self._run_callback()
+
     def _run_callback(self):
+        if self.loop._poll_start:
+            self.loop._end_poll()
         if self._callback:
             try:
-                self._callback()
+                self._callback(*self._args)
             except:
                 self.loop.handle_error(self, *sys.exc_info())
             finally:
@@ -340,49 +864,71 @@ class Watcher(object):
         return result + '>'
 
 
-class NoOp(Watcher):
+class Fork(Watcher):
+    __slots__ = ('_active',)
 
-    def __init__(self, loop, ref=True):
-        super(NoOp, self).__init__(loop, ref)
-        self._handle = None
+    def __init__(self, loop, ref=True, priority=None):
+        super(Fork, self).__init__(loop, ref, priority)
+        self._active = False
 
-    def start(self, *args, **kw):
-        pass
+    @property
+    def active(self):
+        return self._active
+
+    def start(self, callback, *args):
+        super(Fork, self).start(callback, *args)
+        self._active = True
+        self.loop._fork_watchers.add(self)
 
     def stop(self):
-        pass
+        self._active = False
+        self.loop._fork_watchers.discard(self)
+        super(Fork, self).stop()
 
 
 class Timer(Watcher):
+    __slots__ = ('_after', '_repeat')
 
-    def __init__(self, loop, after=0.0, repeat=0.0, ref=True):
+    def __init__(self, loop, after=0.0, repeat=0.0, ref=True, priority=None):
         if repeat < 0.0:
             raise ValueError("repeat must be positive or zero: %r" % repeat)
-        super(Timer, self).__init__(loop, ref)
+        super(Timer, self).__init__(loop, ref, priority)
         self._after = after
         self._repeat = repeat
-        self._handle = pyuv.Timer(self.loop._loop)
 
-    def _timer_cb(self, handle):
-        self._run_callback()
+    def _handle_type(self):
+        if self.loop._loop._timer_wheel is not None:
+            return SharedTimer
+        return pyuv.Timer
 
     def start(self, callback, *args, **kw):
         super(Timer, self).start(callback, *args)
         if kw.get('update', True):
             self.loop.update()
-        self._handle.start(self._timer_cb, self._after, self._repeat)
+        handle = self._take_handle()
+        handle.start(_timer_cb, self._after, self._repeat)
         if not self._ref:
-            self._handle.unref()
+            handle.unref()
 
     def stop(self):
-        self._handle.stop()
+        self._release_handle()
         super(Timer, self).stop()
 
     def again(self, callback, *args, **kw):
-        if not self._handle:
-            raise RuntimeError('timer not started')
-        self.loop._watchers.add(self)
-        self._callback = functools.partial(callback, *args)
+        if self._handle is None:
+            # Stopped, as with libev it's started again only if it repeats
+            if self._repeat:
+                after = self._after
+                self._after = self._repeat
+                try:
+                    self.start(callback, *args, **kw)
+                finally:
+                    self._after = after
+            return
+        self._check_handle()
+        self.loop._add_watcher(self)
+        self._callback = callback
+        self._args = args
         if kw.get('update', True):
             self.loop.update()
         self._handle.again()
@@ -393,72 +939,79 @@ class Timer(Watcher):
 
 
 class Prepare(Watcher):
+    __slots__ = ()
 
-    def __init__(self, loop, ref=True):
-        super(Prepare, self).__init__(loop, ref)
-        self._handle = pyuv.Prepare(self.loop._loop)
+    def __init__(self, loop, ref=True, priority=None):
+        super(Prepare, self).__init__(loop, ref, priority)
 
-    def _prepare_cb(self, handle):
-        self._run_callback()
+    def _handle_type(self):
+        return pyuv.Prepare
 
     def start(self, callback, *args):
         super(Prepare, self).start(callback, *args)
-        self._handle.start(self._prepare_cb)
+        handle = self._take_handle()
+        handle.start(_watcher_cb)
         if not self._ref:
-            self._handle.unref()
+            handle.unref()
 
     def stop(self):
-        self._handle.stop()
+        self._release_handle()
         super(Prepare, self).stop()
 
 
 class Idle(Watcher):
+    __slots__ = ()
 
-    def __init__(self, loop, ref=True):
-        super(Idle, self).__init__(loop, ref)
-        self._handle = pyuv.Idle(self.loop._loop)
+    def __init__(self, loop, ref=True, priority=None):
+        super(Idle, self).__init__(loop, ref, priority)
 
-    def _idle_cb(self, handle):
-        self._run_callback()
+    def _handle_type(self):
+        return pyuv.Idle
 
     def start(self, callback, *args):
         super(Idle, self).start(callback, *args)
-        self._handle.start(self._idle_cb)
+        handle = self._take_handle()
+        handle.start(_watcher_cb)
         if not self._ref:
-            self._handle.unref()
+            handle.unref()
 
     def stop(self):
-        self._handle.stop()
+        self._release_handle()
         super(Idle, self).stop()
 
 
 class Check(Watcher):
+    __slots__ = ()
 
-    def __init__(self, loop, ref=True):
-        super(Check, self).__init__(loop, ref)
-        self._handle = pyuv.Check(self.loop._loop)
+    def __init__(self, loop, ref=True, priority=None):
+        super(Check, self).__init__(loop, ref, priority)
 
-    def _check_cb(self, handle):
-        self._run_callback()
+    def _handle_type(self):
+        return pyuv.Check
 
     def start(self, callback, *args):
         super(Check, self).start(callback, *args)
-        self._handle.start(self._check_cb)
+        handle = self._take_handle()
+        handle.start(_watcher_cb)
         if not self._ref:
-            self._handle.unref()
+            handle.unref()
 
     def stop(self):
-        self._handle.stop()
+        self._release_handle()
         super(Check, self).stop()
 
 
 class Io(Watcher):
+    __slots__ = ('_fd', '_events')
 
-    def __init__(self, loop, fd, events, ref=True):
-        super(Io, self).__init__(loop, ref)
+    def __init__(self, loop, fd, events, ref=True, priority=None):
+        super(Io, self).__init__(loop, ref, priority)
         self._fd = fd
         self._events = self._ev2uv(events)
-        self._handle = SharedPoll(self.loop._loop, self._fd)
+        self._handle = self._new_handle()
+
+    def _new_handle(self):
+        return SharedPoll(self.loop._loop, self._fd)
 
     @classmethod
     def _ev2uv(cls, events):
@@ -470,8 +1023,13 @@ class Io(Watcher):
         return uv_events
 
     def _poll_cb(self):
+        self._fire()
+
+    def _run_callback(self):
+        if self.loop._poll_start:
+            self.loop._end_poll()
         try:
-            self._callback()
+            self._callback(*self._args)
         except:
             self.loop.handle_error(self, *sys.exc_info())
             self.stop()
@@ -516,81 +1074,112 @@ class Io(Watcher):
 
 
 class Async(Watcher):
+    __slots__ = ('_active', '_sent')
 
-    def __init__(self, loop, ref=True):
-        super(Async, self).__init__(loop, ref)
-        self._handle = pyuv.Async(self.loop._loop, self._async_cb)
+    def __init__(self, loop, ref=True, priority=None):
+        super(Async, self).__init__(loop, ref, priority)
+        self._active = False
+        self._sent = False
+
+    @property
+    def active(self):
+        return self._active
 
-    def _async_cb(self, handle):
-        self._run_callback()
+    def _get_ref(self):
+        return self._ref
+    def _set_ref(self, value):
+        value = bool(value)
+        if self._active and value != self._ref:
+            self.loop._async_ref(1 if value else -1)
+        self._ref = value
+    ref = property(_get_ref, _set_ref)
+    del _get_ref, _set_ref
 
     def start(self, callback, *args, **kw):
         super(Async, self).start(callback, *args)
-        if not self._ref:
-            self._handle.unref()
+        if not self._active:
+            self._active = True
+            # Sends which happened while stopped are lost, as with libev
+            self._sent = False
+            if self._ref:
+                self.loop._async_ref(1)
 
     def stop(self):
+        if self._active:
+            self._active = False
+            if self._ref:
+                self.loop._async_ref(-1)
         super(Async, self).stop()
 
     def send(self):
-        self._handle.send()
+        # Sends are coalesced until the callback runs, only the first one wakes up the loop
+        if not self._sent:
+            self._sent = True
+            self.loop._async_send(self)
 
 
-class Child(Watcher):
+class Child(Async):
+    __slots__ = ('_pid', 'rpid', 'rstatus', '_statuses')
 
     def __init__(self, loop, pid, ref=True):
         if not loop.default:
             raise TypeError("child watchers are only allowed in the default loop")
         super(Child, self).__init__(loop, ref)
         loop.install_sigchld()
-        self._active = False
         self._pid = pid
         self.rpid = None
         self.rstatus = None
-        self._handle = pyuv.Async(self.loop._loop, self._async_cb)
-
-    @property
-    def active(self):
-        return self._active
+        self._statuses = None
 
     @property
     def pid(self):
         return self._pid
 
-    def _async_cb(self, handle):
-        self._run_callback()
-
     def start(self, callback, *args, **kw):
         super(Child, self).start(callback, *args)
-        if not self._ref:
-            self._handle.unref()
-        self._active = True
         # TODO: should someone be able to register 2 child watchers for the same PID?
         self.loop._child_watchers[self._pid] = self
+        if self.loop._loop._reaping:
+            _warn_reaping()
 
     def stop(self):
-        self._active = False
         self.loop._child_watchers.pop(self._pid, None)
+        self._statuses = None
         super(Child, self).stop()
 
-    def _set_status(self, status):
+    def _set_status(self, pid, status):
+        if self._sent:
+            # A watcher for any pid may get several statuses at once, it gets them one per callback
+            if self._statuses is None:
+                self._statuses = collections.deque()
+            self._statuses.append((pid, status))
+            return
+        self.rpid = pid
         self.rstatus = status
-        self.rpid = os.getpid()
-        self._handle.send()
+        self.send()
+
+    def _run_callback(self):
+        super(Child, self)._run_callback()
+        if self._statuses and self._active:
+            self._set_status(*self._statuses.popleft())
 
     def _format(self):
         return ' pid=%r rstatus=%r' % (self.pid, self.rstatus)
 
 
 class Signal(Watcher):
+    __slots__ = ('_signum',)
 
-    def __init__(self, loop, signum, ref):
-        super(Signal, self).__init__(loop, ref)
+    def __init__(self, loop, signum, ref, priority=None):
+        super(Signal, self).__init__(loop, ref, priority)
         self._signum = signum
-        self._handle = pyuv.Signal(self.loop._loop)
+        self._handle = self._new_handle()
+
+    def _new_handle(self):
+        return pyuv.Signal(self.loop._loop)
 
     def _signal_cb(self, handle, signum):
-        self._run_callback()
+        self._fire()
 
     def start(self, callback, *args):
         super(Signal, self).start(callback, *args)
@@ -604,14 +1193,20 @@ class Signal(Watcher):
 
 
 class Stat(Watcher):
+    __slots__ = ('_path', '_interval', '_attr', '_prev')
 
-    def __init__(self, loop, path, interval, ref):
-        super(Stat, self).__init__(loop, ref)
+    def __init__(self, loop, path, interval, ref, priority=None):
+        super(Stat, self).__init__(loop, ref, priority)
         self._path = path
         self._interval = interval
         self._attr = None
         self._prev = None
-        self._handle = pyuv.fs.FSPoll(self.loop._loop)
+        self._handle = self._new_handle()
+
+    def _new_handle(self):
+        if self.loop.fsevent_stat_watchers:
+            return SharedStat(self.loop._loop)
+        return pyuv.fs.FSPoll(self.loop._loop)
 
     @property
     def path(self):
@@ -638,8 +1233,10 @@ class Stat(Watcher):
             self._prev = prev_stat
             self._attr = curr_stat
         else:
+            if prev_stat is not None:
+                self._prev = prev_stat
             self._attr = None
-        self._run_callback()
+        self._fire()
 
     def start(self, callback, *args):
         super(Stat, self).start(callback, *args)
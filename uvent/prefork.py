@@ -0,0 +1,133 @@
+# coding=utf8
+
+# Copyright (C) 2012 Saúl Ibarra Corretgé <saghul@gmail.com>
+#
+
+"""Pre-fork server mode: run a server in several worker processes.
+
+The supervisor forks the workers, each of which gets its own listening
+socket bound to the same address with SO_REUSEPORT, so the kernel spreads
+incoming connections across them. Where SO_REUSEPORT is not available the
+workers share the supervisor's listening socket instead. Workers which die
+are replaced, SIGTERM and SIGINT stop all of them.
+
+Example::
+
+    from gevent.server import StreamServer
+    from uvent import prefork
+
+    def worker(listener):
+        StreamServer(listener, handle).serve_forever()
+
+    prefork.run(('0.0.0.0', 8000), worker, processes=4)
+
+Nothing should be using the libuv thread pool (uvent.fileobject, the
+uvent threadpool) in the supervisor before it forks, libuv doesn't
+recreate its threads in the child processes.
+"""
+
+from __future__ import absolute_import
+
+__all__ = ['run']
+
+import errno
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+
+import gevent.hub
+import gevent.socket
+
+# Not exposed by the socket module on Python 2
+SO_REUSEPORT = getattr(socket, 'SO_REUSEPORT', 15 if sys.platform.startswith('linux') else None)
+
+
+def _bind(address, reuse_port):
+    family = socket.AF_INET6 if ':' in address[0] else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
+    sock.bind(address)
+    return sock
+
+
+def _run_worker(sock, worker, backlog, reuse_port):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    status = 0
+    try:
+        gevent.hub.reinit()
+        if reuse_port:
+            # Each worker listens on its own socket, the kernel balances connections between them
+            own = _bind(sock.getsockname(), True)
+            sock.close()
+            sock = own
+        sock.listen(backlog)
+        worker(gevent.socket.socket(sock.family, sock.type, sock.proto, sock._sock))
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    except:
+        traceback.print_exc()
+        status = 1
+    finally:
+        os._exit(status)
+
+
+def run(address, worker, processes=None, backlog=128, reuse_port=True, respawn=True):
+    """Fork `processes` workers (by default, one per CPU) and wait for them.
+
+    Each worker process calls worker(listener) with a listening gevent socket
+    bound to address. Workers which exit are replaced while respawn is True.
+    Returns when all workers have exited.
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    reuse_port = reuse_port and SO_REUSEPORT is not None
+    # With SO_REUSEPORT this socket only reserves the address (and port, if 0 was given), it never listens
+    sock = _bind(address, reuse_port)
+    if not reuse_port:
+        sock.listen(backlog)
+    workers = set()
+    stopping = []
+
+    def stop(signum, frame):
+        stopping.append(signum)
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+    old_handlers = [(signum, signal.signal(signum, stop)) for signum in (signal.SIGTERM, signal.SIGINT)]
+    try:
+        while True:
+            while not stopping and len(workers) < processes:
+                pid = os.fork()
+                if pid == 0:
+                    _run_worker(sock, worker, backlog, reuse_port)
+                workers.add(pid)
+            if not workers:
+                break
+            try:
+                pid, status = os.waitpid(-1, 0)
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                if e.errno == errno.ECHILD:
+                    break
+                raise
+            workers.discard(pid)
+            if not respawn:
+                stopping.append(None)
+            elif not stopping and (os.WIFSIGNALED(status) or os.WEXITSTATUS(status)):
+                # Don't spin if workers die right away
+                time.sleep(0.1)
+    finally:
+        for signum, handler in old_handlers:
+            signal.signal(signum, handler)
+        sock.close()
@@ -0,0 +1,289 @@
+# coding=utf8
+
+# Copyright (C) 2012 Saúl Ibarra Corretgé <saghul@gmail.com>
+#
+
+"""Cooperative child processes spawned with pyuv.Process.
+
+libuv forks and execs the child in C, no Python code runs in the child
+process, and the exit status is picked up by the loop, so waiting for a
+child just switches the calling greenlet out. The standard streams of the
+child can be inherited, redirected to a file descriptor or connected to
+the parent with pipes, which are read and written cooperatively.
+
+Example::
+
+    from uvent.process import Process, PIPE
+
+    p = Process(['ls', '-l'], stdout=PIPE)
+    output, _ = p.communicate()
+
+Processes can only be spawned on the default loop. libuv 0.10 reaps
+children itself once a loop has spawned one, waiting for any child as
+uvent's SIGCHLD handler does, and it drops the status of children it
+didn't spawn on that same loop. Children spawned here get their exit
+status whichever of the two reaps them, but the status of children
+started otherwise (os.fork, gevent.subprocess) is lost if libuv gets to
+them first, so don't wait for both kinds of children in the same process:
+a RuntimeWarning is issued when child watchers and processes are mixed.
+"""
+
+from __future__ import absolute_import
+
+__all__ = ['Process', 'PIPE', 'call', 'check_output']
+
+import os
+import pyuv
+import signal
+
+from subprocess import CalledProcessError
+
+import gevent
+
+from gevent.event import Event
+from gevent.hub import get_hub
+
+from .util import uv_error
+from .waitable import Waitable, cancel_wait_error
+
+# Same value as subprocess.PIPE
+PIPE = -1
+
+
+class _Pipe(Waitable):
+    """The parent's end of a pipe connected to a standard stream of the child."""
+
+    _waitable_kind = 'pipe'
+
+    # Reading from the child is paused while this many bytes are buffered and nobody is reading
+    buffer_size = 64 * 1024
+
+    def __init__(self, loop):
+        self.loop = loop
+        self._handle = pyuv.Pipe(loop._loop)
+        self._buffer = []
+        self._buffered = 0
+        self._reading = False
+        self._eof = False
+        self._error = None
+        self._write_error = None
+        self._read_waiter = None
+        self._write_waiter = None
+        self.closed = False
+
+    def _stdio(self, child_reads):
+        flags = pyuv.UV_CREATE_PIPE | (pyuv.UV_READABLE_PIPE if child_reads else pyuv.UV_WRITABLE_PIPE)
+        return pyuv.StdIO(stream=self._handle, flags=flags)
+
+    def _check_closed(self):
+        if self.closed:
+            raise ValueError('I/O operation on closed file')
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._handle.close()
+        self._wake_later('_read_waiter', 'throw', cancel_wait_error)
+        self._wake_later('_write_waiter', 'throw', cancel_wait_error)
+
+    # Reading
+
+    def _on_read(self, handle, data, errorno):
+        if errorno is not None:
+            if errorno != pyuv.errno.UV_EOF:
+                self._error = uv_error(errorno)
+            self._eof = True
+            self._reading = False
+            handle.stop_read()
+        else:
+            self._buffer.append(data)
+            self._buffered += len(data)
+            if self._read_waiter is None and self._buffered >= self.buffer_size:
+                handle.stop_read()
+                self._reading = False
+        self._wake_soon('_read_waiter')
+
+    def _wait_readable(self):
+        if not self._reading:
+            self._handle.start_read(self._on_read)
+            self._reading = True
+        self._wait('_read_waiter', None)
+
+    def read(self, size=-1):
+        """Read up to size bytes, waiting until there are some. A negative size reads until end of file."""
+        self._check_closed()
+        while not self._eof and (size < 0 or not self._buffered):
+            self._wait_readable()
+        data = b''.join(self._buffer)
+        if 0 <= size < len(data):
+            data, rest = data[:size], data[size:]
+            self._buffer = [rest]
+        else:
+            self._buffer = []
+        self._buffered -= len(data)
+        if not data and self._error is not None:
+            exc, self._error = self._error, None
+            raise exc
+        return data
+
+    # Writing
+
+    def write(self, data):
+        """Write all the data, returns when the child has it (or the pipe buffer does)."""
+        self._check_closed()
+        try:
+            self._handle.write(data, self._on_write)
+        except pyuv.error.PipeError as e:
+            raise uv_error(e.args[0])
+        self._wait('_write_waiter', None)
+        if self._write_error is not None:
+            exc, self._write_error = self._write_error, None
+            raise exc
+
+    def _on_write(self, handle, errorno):
+        if errorno is not None:
+            self._write_error = uv_error(errorno)
+        self._wake('_write_waiter')
+
+
+class Process(object):
+    """Spawn a child process running args, a sequence whose first item is looked up in PATH.
+
+    stdin, stdout and stderr may be None (inherited from the parent), PIPE
+    (readable or writable through the stdin, stdout and stderr attributes),
+    a file descriptor or an object with a fileno method. returncode follows
+    the subprocess module convention, a child which could not be executed
+    exits with 127.
+    """
+
+    def __init__(self, args, env=None, cwd=None, stdin=None, stdout=None, stderr=None, uid=None, gid=None, detached=False):
+        if isinstance(args, basestring):
+            args = [args]
+        self.args = args
+        self.loop = get_hub().loop
+        if not self.loop.default:
+            # libuv's reaper on the default loop would take the exit status of the child
+            raise TypeError('processes can only be spawned on the default loop')
+        self.returncode = None
+        self._exited = Event()
+        self.stdin = self.stdout = self.stderr = None
+        stdio = []
+        for fd, spec in enumerate((stdin, stdout, stderr)):
+            if spec is None:
+                stdio.append(pyuv.StdIO(fd=fd, flags=pyuv.UV_INHERIT_FD))
+            elif spec == PIPE:
+                pipe = _Pipe(self.loop)
+                setattr(self, ('stdin', 'stdout', 'stderr')[fd], pipe)
+                stdio.append(pipe._stdio(fd == 0))
+            else:
+                fileno = spec if isinstance(spec, (int, long)) else spec.fileno()
+                stdio.append(pyuv.StdIO(fd=fileno, flags=pyuv.UV_INHERIT_FD))
+        kwargs = {}
+        flags = 0
+        if env is not None:
+            kwargs['env'] = dict(env)
+        if cwd is not None:
+            kwargs['cwd'] = cwd
+        if uid is not None:
+            kwargs['uid'] = uid
+            flags |= pyuv.UV_PROCESS_SETUID
+        if gid is not None:
+            kwargs['gid'] = gid
+            flags |= pyuv.UV_PROCESS_SETGID
+        if detached:
+            flags |= pyuv.UV_PROCESS_DETACHED
+        self._handle = pyuv.Process(self.loop._loop)
+        try:
+            self._handle.spawn(file=args[0], exit_callback=self._on_exit, args=tuple(args[1:]),
+                               flags=flags, stdio=stdio, **kwargs)
+        except pyuv.error.ProcessError as e:
+            self._handle.close()
+            for pipe in (self.stdin, self.stdout, self.stderr):
+                if pipe is not None:
+                    pipe.close()
+            raise uv_error(e.args[0], OSError)
+        self.pid = self._handle.pid
+        self.loop._add_process(self)
+
+    def __repr__(self):
+        return '<%s at 0x%x pid=%r returncode=%r>' % (self.__class__.__name__, id(self), self.pid, self.returncode)
+
+    def _on_exit(self, handle, exit_status, term_signal):
+        self.loop._processes.pop(self.pid, None)
+        if term_signal:
+            self._set_returncode(-term_signal)
+        else:
+            # libuv reports -1 if the child could not be executed, it exited with 127
+            self._set_returncode(exit_status if exit_status >= 0 else 127)
+
+    def _reaped(self, status):
+        # Called by UVLoop._handle_SIGCHLD
+        if os.WIFSIGNALED(status):
+            self._set_returncode(-os.WTERMSIG(status))
+        else:
+            self._set_returncode(os.WEXITSTATUS(status))
+
+    def _set_returncode(self, returncode):
+        if self.returncode is None:
+            self.returncode = returncode
+            self._handle.close()
+            self._exited.set()
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self, timeout=None):
+        """Wait for the child to exit and return returncode, None if timeout expires first."""
+        self._exited.wait(timeout)
+        return self.returncode
+
+    def send_signal(self, signum):
+        if self.returncode is None:
+            try:
+                self._handle.kill(signum)
+            except pyuv.error.ProcessError as e:
+                raise uv_error(e.args[0], OSError)
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+    def communicate(self, input=None):
+        """Write input to stdin and read stdout and stderr until end of file, then wait for the child.
+
+        Returns a (stdout data, stderr data) tuple, None for streams which are not pipes.
+        """
+        greenlets = []
+        if self.stdin is not None:
+            greenlets.append(gevent.spawn(self._feed, input))
+        if self.stderr is not None:
+            stderr = gevent.spawn(self.stderr.read)
+            greenlets.append(stderr)
+        stdout = self.stdout.read() if self.stdout is not None else None
+        gevent.joinall(greenlets, raise_error=True)
+        self.wait()
+        return stdout, stderr.value if self.stderr is not None else None
+
+    def _feed(self, data):
+        try:
+            if data:
+                self.stdin.write(data)
+        finally:
+            self.stdin.close()
+
+
+def call(args, **kwargs):
+    """Run args and return its returncode."""
+    return Process(args, **kwargs).wait()
+
+
+def check_output(args, **kwargs):
+    """Run args and return its output, CalledProcessError is raised if it exits with a non zero status."""
+    process = Process(args, stdout=PIPE, **kwargs)
+    output, _ = process.communicate()
+    if process.returncode:
+        raise CalledProcessError(process.returncode, args, output=output)
+    return output
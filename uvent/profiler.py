@@ -0,0 +1,276 @@
+# coding=utf8
+
+# Copyright (C) 2012 Saúl Ibarra Corretgé <saghul@gmail.com>
+#
+
+"""Slow callback detection and callback latency histograms for UVLoop.
+
+A callback which takes long (a greenlet which doesn't yield, blocking i/o
+or plain CPU work) stalls everything else the loop serves. While profiling
+is on, every callback the loop runs (watcher callbacks and run_callback
+callbacks) is timed, those which take longer than the threshold are
+reported with the watcher and the stack they were blocking at, and the
+durations are kept in a histogram per watcher type.
+
+Example::
+
+    from gevent.hub import get_hub
+
+    profiler = get_hub().loop.start_profiling(threshold=0.05)
+    ...
+    print(profiler.histograms())
+
+The stack is taken by a watchdog thread, which looks at the loop's thread
+every half threshold, so callbacks which only just go over the threshold
+may be reported without one. Profiling is enabled by swapping the dispatch
+functions of the watchers and the loop, it costs nothing while it's off.
+"""
+
+from __future__ import absolute_import
+
+__all__ = ['Profiler']
+
+import atexit
+import bisect
+import collections
+import functools
+import os
+import pyuv
+import sys
+import traceback
+
+from gevent import monkey
+from gevent._threading import Lock, get_ident, start_new_thread
+
+from .loop import Io, Watcher
+
+_sleep = monkey.get_original('time', 'sleep')
+
+# Upper bounds (in seconds) of the histogram buckets, the last bucket counts everything above
+BUCKETS = (1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1.0)
+
+# Watcher classes which define a _run_callback, every watcher callback goes through one of them
+_dispatchers = (Watcher, Io)
+_originals = {}
+_profiling_loops = 0
+# (pid, lock) of the running watchdog threads, which hold the lock
+_watchdogs = set()
+_exiting = False
+
+
+def _instrument(func):
+    def _run_callback(self):
+        profiler = self.loop._profiler
+        if profiler is None:
+            return func(self)
+        frame = profiler._enter(self.__class__.__name__, self)
+        try:
+            func(self)
+        finally:
+            profiler._exit(frame)
+    _run_callback.__doc__ = func.__doc__
+    return _run_callback
+
+
+def _install():
+    global _profiling_loops
+    _profiling_loops += 1
+    if _profiling_loops == 1:
+        for cls in _dispatchers:
+            func = _originals[cls] = cls.__dict__['_run_callback']
+            cls._run_callback = _instrument(func)
+
+
+def _uninstall():
+    global _profiling_loops
+    _profiling_loops -= 1
+    if not _profiling_loops:
+        for cls in _dispatchers:
+            cls._run_callback = _originals.pop(cls)
+
+
+@atexit.register
+def _join_watchdogs():
+    # A watchdog which wakes up while the interpreter is being finalized may crash it
+    global _exiting
+    _exiting = True
+    pid = os.getpid()
+    for owner, lock in list(_watchdogs):
+        # Those of the parent process don't run after fork
+        if owner == pid:
+            lock.acquire()
+
+
+class _Histogram(object):
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def add(self, elapsed):
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        self.buckets[bisect.bisect_left(BUCKETS, elapsed)] += 1
+
+
+class Profiler(object):
+    """Times the callbacks run by a loop, use UVLoop.start_profiling to create one.
+
+    Callbacks which take longer than threshold seconds are appended to `slow`
+    (the last `history` of them) as dictionaries with the type, repr of the
+    watcher or function, the time it took and the stack (a list of
+    traceback.extract_stack entries, or None), and passed to report, which
+    defaults to printing them to stderr. The time a callback spends running
+    other dispatches (a watcher whose callback is queued because of
+    priorities) is accounted to those.
+    """
+
+    # Number of slow callbacks kept in `slow`
+    history = 100
+
+    def __init__(self, loop, threshold=0.1, report=None):
+        self.loop = loop
+        self.threshold = threshold
+        if report is not None:
+            self.report = report
+        self.slow = collections.deque(maxlen=self.history)
+        self._histograms = {}
+        # Dispatches in progress, each one is a [type, target, start, nested time, stack] list
+        self._stack = []
+        self._threshold_ns = int(threshold * 1e9)
+        self._thread_id = None
+        self._running = False
+        self._generation = 0
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread_id = get_ident()
+        _install()
+        loop = self.loop
+        # The callback watcher picks this up the next time it's started, restart it if it's running
+        loop._run_callbacks = functools.partial(type(loop)._run_callbacks, loop, run=self._run_callback)
+        if loop._callback_watcher.active:
+            loop._callback_watcher.start(loop._run_callbacks)
+        self._start_watchdog()
+
+    def stop(self):
+        if self.loop._profiler is self:
+            self.loop.stop_profiling()
+        else:
+            self._stop()
+
+    def _stop(self):
+        # Called by UVLoop.stop_profiling
+        if not self._running:
+            return
+        self._running = False
+        self._generation += 1
+        _uninstall()
+        loop = self.loop
+        del loop._run_callbacks
+        if loop._callback_watcher is not None and loop._callback_watcher.active:
+            loop._callback_watcher.start(loop._run_callbacks)
+
+    def _reinit(self):
+        # Called by UVLoop.reinit, threads don't survive fork
+        if self._running:
+            self._thread_id = get_ident()
+            self._start_watchdog()
+
+    def histograms(self):
+        """Return callback durations per watcher type ('callback' for run_callback callbacks).
+
+        Each one is a dictionary with the count, total and max (in seconds) and
+        the number of callbacks per bucket, out of BUCKETS (the last bucket
+        counts everything above the last bound).
+        """
+        return dict((name, {'count': h.count, 'total': h.total, 'max': h.max, 'buckets': list(h.buckets)})
+                    for name, h in self._histograms.iteritems())
+
+    def reset(self):
+        self._histograms.clear()
+        self.slow.clear()
+
+    def report(self, record):
+        lines = ['Slow callback: %s took %.3f seconds\n' % (record['target'], record['elapsed'])]
+        if record['stack'] is not None:
+            lines.append('Blocked at (most recent call last):\n')
+            lines.extend(traceback.format_list(record['stack']))
+        sys.stderr.write(''.join(lines))
+
+    # Dispatch
+
+    def _enter(self, name, target):
+        frame = [name, target, pyuv.util.hrtime(), 0, None]
+        self._stack.append(frame)
+        return frame
+
+    def _exit(self, frame):
+        stack = self._stack
+        elapsed = pyuv.util.hrtime() - frame[2]
+        # The stack can be left unbalanced by a reinit in a callback
+        while stack and stack.pop() is not frame:
+            pass
+        if stack:
+            stack[-1][3] += elapsed
+        own = elapsed - frame[3]
+        name = frame[0]
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            histogram = self._histograms[name] = _Histogram()
+        histogram.add(own / 1e9)
+        if own > self._threshold_ns:
+            record = {'type': name,
+                      'target': repr(frame[1]),
+                      'elapsed': own / 1e9,
+                      'stack': frame[4]}
+            self.slow.append(record)
+            try:
+                self.report(record)
+            except:
+                self.loop.handle_error(self, *sys.exc_info())
+
+    def _run_callback(self, callback, args):
+        # Called by UVLoop._run_callbacks
+        frame = self._enter('callback', callback)
+        try:
+            callback(*args)
+        finally:
+            self._exit(frame)
+
+    # Watchdog
+
+    def _start_watchdog(self):
+        self._generation += 1
+        lock = Lock()
+        lock.acquire()
+        watchdog = (os.getpid(), lock)
+        _watchdogs.add(watchdog)
+        start_new_thread(self._watchdog, (self._generation, watchdog))
+
+    def _watchdog(self, generation, watchdog):
+        interval = max(self.threshold / 2.0, 0.001)
+        try:
+            while self._running and self._generation == generation and not _exiting:
+                _sleep(interval)
+                stack = self._stack
+                if not stack:
+                    continue
+                try:
+                    frame = stack[-1]
+                except IndexError:
+                    continue
+                if frame[4] is None and pyuv.util.hrtime() - frame[2] > self._threshold_ns:
+                    current = sys._current_frames().get(self._thread_id)
+                    if current is not None:
+                        frame[4] = traceback.extract_stack(current)
+        finally:
+            _watchdogs.discard(watchdog)
+            watchdog[1].release()
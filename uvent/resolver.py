@@ -0,0 +1,304 @@
+# coding=utf8
+
+# Copyright (C) 2012 Saúl Ibarra Corretgé <saghul@gmail.com>
+#
+
+"""DNS resolver built on pycares, with an answer cache which honours TTLs.
+
+Addresses are looked up with A / AAAA queries on a pycares channel whose
+sockets are watched with the loop's io watchers (and retried from a timer),
+so no threads are involved. Answers are cached for as long as their TTL
+says (within `min_ttl` and `max_ttl`), names which don't exist or have no
+addresses are cached for `negative_ttl` seconds, and concurrent lookups
+of the same name share a single query. The hosts file is looked at first,
+its entries are not cached.
+
+The rest of the work getaddrinfo does (services, socket types, flags) is
+done by the socket module on the resolved numeric addresses, which doesn't
+need the network. Note that names are queried as given, the search domains
+in resolv.conf are not applied.
+"""
+
+from __future__ import absolute_import
+
+__all__ = ['Resolver']
+
+import os
+import pycares
+import time
+
+from _socket import getaddrinfo, getnameinfo, gaierror, herror, error, inet_pton
+from gevent.hub import Waiter, get_hub
+from gevent.socket import AF_UNSPEC, AF_INET, AF_INET6, AI_CANONNAME, AI_NUMERICHOST, AI_PASSIVE, SOCK_DGRAM
+from gevent.socket import EAI_AGAIN, EAI_FAIL, EAI_NONAME, NI_NAMEREQD, NI_NUMERICHOST
+
+try:
+    from gevent.socket import EAI_NODATA
+except ImportError:
+    EAI_NODATA = EAI_NONAME
+
+
+_BAD = pycares.ARES_SOCKET_BAD
+
+# Errors which mean the name doesn't exist or has no address, rather than a failure to get an answer
+_negative_errors = {pycares.errno.ARES_ENOTFOUND: (EAI_NONAME, 'Name or service not known'),
+                    pycares.errno.ARES_ENONAME: (EAI_NONAME, 'Name or service not known'),
+                    pycares.errno.ARES_ENODATA: (EAI_NODATA, 'No address associated with hostname')}
+
+
+def _ares_error(errorno):
+    if errorno in _negative_errors:
+        return gaierror(*_negative_errors[errorno])
+    if errorno in (pycares.errno.ARES_ETIMEOUT, pycares.errno.ARES_ESERVFAIL, pycares.errno.ARES_ECONNREFUSED):
+        return gaierror(EAI_AGAIN, 'Temporary failure in name resolution')
+    return gaierror(EAI_FAIL, pycares.errno.strerror(errorno))
+
+
+def _is_numeric(host):
+    for family in (AF_INET, AF_INET6):
+        try:
+            inet_pton(family, host)
+        except (error, ValueError):
+            continue
+        return True
+    return False
+
+
+class _Lookup(object):
+    """A query for a name and record type. Completed lookups are kept in the cache until they expire."""
+
+    __slots__ = ('done', 'addresses', 'exception', 'expires', '_waiters')
+
+    def __init__(self):
+        self.done = False
+        self.addresses = None
+        self.exception = None
+        self.expires = 0
+        self._waiters = []
+
+    def set(self, addresses, exception, expires):
+        self.done = True
+        self.addresses = addresses
+        self.exception = exception
+        self.expires = expires
+        waiters, self._waiters = self._waiters, None
+        for waiter in waiters:
+            waiter.switch(None)
+
+    def get(self):
+        if not self.done:
+            waiter = Waiter()
+            self._waiters.append(waiter)
+            waiter.get()
+        if self.exception is not None:
+            raise self.exception
+        return self.addresses
+
+
+class Resolver(object):
+    """Implementation of gevent's resolver interface on top of a pycares channel.
+
+    Keyword arguments are passed to pycares.Channel (with use_environ, also from
+    GEVENTARES_* environment variables, as gevent's c-ares resolver does).
+    """
+
+    # Answers are cached for at least / at most this many seconds, whatever their TTL is
+    min_ttl = 0
+    max_ttl = 3600
+    # Seconds names which don't exist or have no addresses are cached for
+    negative_ttl = 30
+    # The cache is emptied of expired answers when it reaches this many entries
+    cache_size = 10000
+
+    def __init__(self, hub=None, use_environ=True, **kwargs):
+        if hub is None:
+            hub = get_hub()
+        self.hub = hub
+        if use_environ:
+            for key in os.environ:
+                if key.startswith('GEVENTARES_') and key[11:]:
+                    kwargs.setdefault(key[11:].lower(), os.environ[key])
+        for key in ('timeout', ):
+            if key in kwargs:
+                kwargs[key] = float(kwargs[key])
+        for key in ('tries', 'ndots', 'udp_port', 'tcp_port', 'flags'):
+            if key in kwargs:
+                kwargs[key] = int(kwargs[key])
+        if isinstance(kwargs.get('servers'), basestring):
+            kwargs['servers'] = kwargs['servers'].split(',')
+        self._params = kwargs
+        self._channel = pycares.Channel(sock_state_cb=self._sock_state_cb, **kwargs)
+        self._hosts = pycares.Channel(lookups='f')
+        self._watchers = {}
+        self._timer = hub.loop.timer(1.0, 1.0)
+        self._cache = {}
+        self._pid = os.getpid()
+        self._fork_watcher = hub.loop.fork(ref=False)
+        self._fork_watcher.start(self._on_fork)
+
+    def __repr__(self):
+        return '<%s at 0x%x, %d cached>' % (self.__class__.__name__, id(self), len(self._cache))
+
+    def _on_fork(self):
+        # Queries in flight belong to the parent, start over with a new channel
+        pid = os.getpid()
+        if pid != self._pid and self._channel is not None:
+            self._pid = pid
+            self._stop_watchers()
+            channel = self._channel
+            self._channel = pycares.Channel(sock_state_cb=self._sock_state_cb, **self._params)
+            self.hub.loop.run_callback(channel.destroy)
+            for key, lookup in self._cache.items():
+                if not lookup.done:
+                    del self._cache[key]
+
+    def _stop_watchers(self):
+        for watcher in self._watchers.values():
+            watcher.stop()
+        self._watchers.clear()
+        self._timer.stop()
+
+    def close(self):
+        if self._channel is not None:
+            self._stop_watchers()
+            self._fork_watcher.stop()
+            channel, self._channel = self._channel, None
+            self.hub.loop.run_callback(channel.destroy)
+            self._hosts.destroy()
+            self._cache.clear()
+
+    # pycares integration
+
+    def _sock_state_cb(self, fd, readable, writable):
+        watcher = self._watchers.pop(fd, None)
+        if watcher is not None:
+            watcher.stop()
+        if readable or writable:
+            watcher = self.hub.loop.io(fd, (1 if readable else 0) | (2 if writable else 0))
+            watcher.start(self._process_fd, fd, readable, writable)
+            self._watchers[fd] = watcher
+            if not self._timer.active:
+                self._timer.start(self._process_timeouts)
+        elif not self._watchers:
+            self._timer.stop()
+
+    def _process_fd(self, fd, readable, writable):
+        self._channel.process_fd(fd if readable else _BAD, fd if writable else _BAD)
+
+    def _process_timeouts(self):
+        self._channel.process_fd(_BAD, _BAD)
+
+    # Cache
+
+    def _lookup(self, name, qtype):
+        key = (name, qtype)
+        lookup = self._cache.get(key)
+        if lookup is not None and (not lookup.done or lookup.expires > time.time()):
+            return lookup
+        if len(self._cache) >= self.cache_size:
+            self._expire()
+        lookup = self._cache[key] = _Lookup()
+        self._channel.query(name, qtype, lambda result, errorno: self._on_answer(key, lookup, result, errorno))
+        return lookup
+
+    def _on_answer(self, key, lookup, result, errorno):
+        now = time.time()
+        if errorno is None and result:
+            ttl = min(max(min(answer.ttl for answer in result), self.min_ttl), self.max_ttl)
+            lookup.set([answer.host for answer in result], None, now + ttl)
+        else:
+            if errorno is None:
+                errorno = pycares.errno.ARES_ENODATA
+            expires = now + self.negative_ttl if errorno in _negative_errors else 0
+            if not expires and self._cache.get(key) is lookup:
+                # Only answers are cached, a failure to get one is retried by the next lookup. Dropped
+                # before waking up the waiters, which run before this returns
+                del self._cache[key]
+            lookup.set(None, _ares_error(errorno), expires)
+
+    def _expire(self):
+        now = time.time()
+        for key, lookup in self._cache.items():
+            if lookup.done and lookup.expires <= now:
+                del self._cache[key]
+        if len(self._cache) >= self.cache_size:
+            self._cache.clear()
+
+    def _resolve(self, host, family):
+        """Return a list of (family, address) tuples for the given name."""
+        if isinstance(host, unicode):
+            host = host.encode('idna')
+        elif not isinstance(host, str):
+            raise TypeError('Expected string, not %s' % type(host).__name__)
+        host = host.lower()
+        families = (AF_INET, AF_INET6) if family == AF_UNSPEC else (family, )
+        result = []
+        for f in families:
+            addresses = []
+            self._hosts.gethostbyname(host, f, lambda r, errorno: addresses.extend(r.addresses if r else ()))
+            result.extend((f, address) for address in addresses)
+        if result:
+            return result
+        if family not in (AF_INET, AF_INET6, AF_UNSPEC):
+            raise gaierror(5, 'ai_family not supported: %r' % (family, ))
+        if self._channel is None:
+            raise gaierror(EAI_FAIL, 'Resolver was closed')
+        name = host.rstrip('.')
+        lookups = [(f, self._lookup(name, pycares.QUERY_TYPE_A if f == AF_INET else pycares.QUERY_TYPE_AAAA)) for f in families]
+        exception = None
+        for f, lookup in lookups:
+            try:
+                result.extend((f, address) for address in lookup.get())
+            except gaierror as e:
+                exception = e
+        if not result:
+            raise exception
+        return result
+
+    # gevent resolver interface
+
+    def gethostbyname(self, hostname, family=AF_INET):
+        return self.gethostbyname_ex(hostname, family)[-1][0]
+
+    def gethostbyname_ex(self, hostname, family=AF_INET):
+        if hostname == '':
+            hostname = getaddrinfo(None, 0, family, SOCK_DGRAM, 0, AI_PASSIVE)[0][4][0]
+        if _is_numeric(hostname):
+            return hostname, [], [hostname]
+        return hostname, [], [address for f, address in self._resolve(hostname, family)]
+
+    def getaddrinfo(self, host, port, family=0, socktype=0, proto=0, flags=0):
+        if not isinstance(host, basestring) or (flags & AI_NUMERICHOST) or _is_numeric(host):
+            # No network access needed
+            return getaddrinfo(host, port, family, socktype, proto, flags)
+        result = []
+        for f, address in self._resolve(host, family):
+            # The socket module takes care of services, socket types and protocols
+            result.extend(getaddrinfo(address, port, f, socktype, proto, flags | AI_NUMERICHOST))
+        if result and flags & AI_CANONNAME:
+            result[0] = result[0][:3] + (host, ) + result[0][4:]
+        return result
+
+    def gethostbyaddr(self, ip_address):
+        if not _is_numeric(ip_address):
+            ip_address = self.gethostbyname(ip_address, AF_UNSPEC)
+        waiter = Waiter()
+        self._channel.gethostbyaddr(ip_address, lambda result, errorno: waiter.switch((result, errorno)))
+        result, errorno = waiter.get()
+        if errorno is not None:
+            raise herror(1, 'Unknown host')
+        return result.name, result.aliases, result.addresses
+
+    def getnameinfo(self, sockaddr, flags):
+        if flags & NI_NUMERICHOST:
+            return getnameinfo(sockaddr, flags)
+        family, _, _, _, address = self.getaddrinfo(sockaddr[0], sockaddr[1], AF_UNSPEC, SOCK_DGRAM)[0]
+        if family == AF_INET6:
+            address = address[:2] + tuple(sockaddr[2:])
+        node, service = getnameinfo(address, flags | NI_NUMERICHOST)
+        try:
+            node = self.gethostbyaddr(address[0])[0]
+        except herror:
+            if flags & NI_NAMEREQD:
+                raise gaierror(EAI_NONAME, 'Name or service not known')
+        return node, service
@@ -0,0 +1,75 @@
+# coding=utf8
+
+# Copyright (C) 2012 Saúl Ibarra Corretgé <saghul@gmail.com>
+#
+
+"""StreamServer which serves connections as uvent sockets.
+
+gevent's server already accepts up to `max_accept` connections each time
+the listening socket becomes readable, calling do_read for each one; this
+one only overrides do_read, which returns uvent.socket sockets instead of
+gevent ones, and raises the default backlog and max_accept.
+
+If `start_reading` is set, accepted connections get their pyuv.TCP handle
+right away, so libuv starts reading the request while the handler greenlet
+is being scheduled and the first recv is served from the buffer, instead
+of failing with EAGAIN and waiting for readiness. It's off by default:
+the handle takes the data from the socket, so it must not be set if
+handlers read from anything but the uvent socket (wrapping it with
+gevent.ssl, reading from sock._sock or passing the file descriptor to
+another process). It's ignored when the server does SSL itself.
+
+Example::
+
+    from uvent.server import StreamServer
+
+    server = StreamServer(('0.0.0.0', 8000), handle)
+    server.start_reading = True
+    server.serve_forever()
+
+It is a drop-in replacement for gevent.server.StreamServer. pyuv 0.10
+handles don't expose their file descriptor, so connections accepted by a
+listening pyuv.TCP handle couldn't be turned into sockets; the listening
+socket is watched with an io watcher and accepted from Python.
+"""
+
+from __future__ import absolute_import
+
+__all__ = ['StreamServer']
+
+import errno
+
+from _socket import error
+from gevent.server import StreamServer as _StreamServer
+
+from .socket import socket
+
+
+class StreamServer(_StreamServer):
+    """gevent.server.StreamServer serving uvent sockets, see the module documentation."""
+
+    # Listen backlog, unless one is given. Large enough to ride a reconnection storm
+    backlog = 1024
+
+    # Maximum number of connections accepted each time the listening socket is readable
+    max_accept = 256
+
+    # Start reading from accepted connections before their handler runs
+    start_reading = False
+
+    def do_read(self):
+        while True:
+            try:
+                client, address = self.socket.accept()
+            except error as e:
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                if e.args[0] == errno.ECONNABORTED:
+                    # The client is gone already, not an error of the server
+                    continue
+                raise
+            break
+        sock = socket(_sock=client)
+        if self.start_reading and self.ssl_args is None:
+            sock._get_transport()
+        return sock, address
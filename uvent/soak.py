@@ -0,0 +1,382 @@
+# coding=utf8
+
+# Copyright (C) 2012 Saúl Ibarra Corretgé <saghul@gmail.com>
+#
+
+"""Loopback soak test: many connections, mixed clients, tail latencies over time.
+
+Run with: python -m uvent.soak [options]
+
+A server process runs a StreamServer speaking a minimal HTTP-like
+keep-alive protocol, which closes connections that stay idle longer than
+`--idle-timeout`. It is gevent's StreamServer, or with `--uvent-sockets`
+uvent's, which installs uvent sockets and starts reading as it accepts.
+Client processes (on gevent's default core, so they don't share whatever
+is being tested) open `--connections` connections between them and send
+requests until `--duration` is over, waiting `--think` seconds on average
+between requests or keeping `--rate` requests per second per connection.
+A `--slow` fraction of the connections sends requests in two parts and
+reads responses in small pieces. Everything runs on 127.0.0.1.
+
+Every `--interval` seconds the server samples its RSS, connections,
+requests and UVLoop.stats(). Clients record request latencies in
+mergeable log scale histograms. The results (options, throughput,
+p50 / p99 / p999 latency, RSS growth, the server samples and requests per
+interval) are written as JSON to `--output`, to compare runs.
+"""
+
+from __future__ import absolute_import
+
+__all__ = ['Histogram', 'run']
+
+import json
+import math
+import optparse
+import platform
+import random
+import resource
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+# Histogram buckets grow by this factor, the percentiles are accurate to about half of it
+_BUCKET_BASE = 1.02
+_LOG_BASE = math.log(_BUCKET_BASE)
+
+
+class Histogram(object):
+    """Log scale histogram of durations (in seconds) which can be merged with others."""
+
+    def __init__(self, buckets=None):
+        self.buckets = dict((int(k), v) for k, v in (buckets or {}).items())
+
+    def add(self, seconds):
+        index = int(math.log(max(seconds, 1e-6) * 1e6) / _LOG_BASE)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def merge(self, other):
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+
+    @property
+    def count(self):
+        return sum(self.buckets.values())
+
+    def percentile(self, p):
+        """Return the duration below which p percent of the samples are, None if there are none."""
+        total = self.count
+        if not total:
+            return None
+        rank = total * p / 100.0
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                # Middle of the bucket
+                return _BUCKET_BASE ** (index + 0.5) / 1e6
+        return _BUCKET_BASE ** (max(self.buckets) + 0.5) / 1e6
+
+
+def _raise_nofile():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, resource.error):
+            pass
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+
+def _rss():
+    """Resident set size in KiB."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize() // 1024
+    except (IOError, OSError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _emit(obj):
+    sys.stdout.write(json.dumps(obj) + '\n')
+    sys.stdout.flush()
+
+
+# Server
+
+def _read_request(sock, buf):
+    while b'\r\n\r\n' not in buf:
+        data = sock.recv(4096)
+        if not data:
+            return None, b''
+        buf += data
+    request, _, rest = buf.partition(b'\r\n\r\n')
+    return request, rest
+
+
+def _server(options):
+    import uvent
+    uvent.install(socket=options.uvent_sockets)
+    import gevent
+    from gevent import Timeout
+    from gevent.hub import get_hub
+    if options.uvent_sockets:
+        from .server import StreamServer
+    else:
+        from gevent.server import StreamServer
+
+    counters = {'connections': 0, 'accepted': 0, 'requests': 0, 'timeouts': 0, 'errors': 0}
+
+    def handle(sock, address):
+        counters['connections'] += 1
+        counters['accepted'] += 1
+        buf = b''
+        try:
+            while True:
+                request = timed_out = object()
+                with Timeout(options.idle_timeout, False):
+                    request, buf = _read_request(sock, buf)
+                if request is timed_out:
+                    counters['timeouts'] += 1
+                    return
+                if request is None:
+                    return
+                try:
+                    size = int(request.split(b' ', 2)[1].lstrip(b'/') or 0)
+                except (IndexError, ValueError):
+                    size = 0
+                sock.sendall(b'HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n%s' % (size, b'x' * size))
+                counters['requests'] += 1
+        except Exception:
+            counters['errors'] += 1
+        finally:
+            counters['connections'] -= 1
+
+    server = StreamServer(('127.0.0.1', 0), handle, backlog=options.backlog)
+    if options.uvent_sockets:
+        # The handler only reads from the uvent socket
+        server.start_reading = True
+    server.start()
+    loop = get_hub().loop
+    start = time.time()
+    gevent.signal(signal.SIGTERM, server.close)
+    _emit({'port': server.server_port})
+
+    def sample():
+        while not server.closed:
+            _emit({'sample': dict(counters, t=round(time.time() - start, 3), rss=_rss(), loop=loop.stats())})
+            gevent.sleep(options.interval)
+
+    sampler = gevent.spawn(sample)
+    server.serve_forever(stop_timeout=1)
+    sampler.kill()
+    _emit({'sample': dict(counters, t=round(time.time() - start, 3), rss=_rss(), loop=loop.stats()), 'final': True})
+
+
+# Clients
+
+def _client(options):
+    import gevent
+    import gevent.socket
+
+    rng = random.Random(options.seed)
+    latencies = Histogram()
+    slow_latencies = Histogram()
+    per_interval = {}
+    # Errors include connections closed by the server's idle timeout, which are opened again
+    counters = {'requests': 0, 'errors': 0, 'timeouts': 0}
+    start = time.time()
+    deadline = start + options.ramp + options.duration
+    request = b'GET /%d HTTP/1.1\r\nHost: soak\r\n\r\n' % options.size
+    response_size = len(b'HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n' % options.size) + options.size
+
+    def exchange(sock, slow):
+        if slow:
+            half = len(request) // 2
+            sock.sendall(request[:half])
+            gevent.sleep(options.slow_delay)
+            sock.sendall(request[half:])
+        else:
+            sock.sendall(request)
+        received = 0
+        while received < response_size:
+            data = sock.recv(512 if slow else 65536)
+            if not data:
+                raise IOError('connection closed')
+            received += len(data)
+            if slow and received < response_size:
+                gevent.sleep(options.slow_delay / 10.0)
+
+    def connection(index, slow):
+        gevent.sleep(options.ramp * index / max(options.connections, 1))
+        sock = None
+        next_time = time.time()
+        while time.time() < deadline:
+            timeout = gevent.Timeout(options.request_timeout)
+            timeout.start()
+            try:
+                if sock is None:
+                    sock = gevent.socket.create_connection(('127.0.0.1', options.port))
+                if options.rate:
+                    next_time += 1.0 / options.rate
+                t0 = time.time()
+                exchange(sock, slow)
+                t1 = time.time()
+                (slow_latencies if slow else latencies).add(t1 - t0)
+                counters['requests'] += 1
+                slot = int((t1 - start) / options.interval)
+                per_interval[slot] = per_interval.get(slot, 0) + 1
+            except (IOError, gevent.socket.error, gevent.Timeout) as e:
+                if e is timeout:
+                    counters['timeouts'] += 1
+                elif isinstance(e, gevent.Timeout):
+                    raise
+                else:
+                    counters['errors'] += 1
+                if sock is not None:
+                    sock.close()
+                    sock = None
+                gevent.sleep(0.1)
+                continue
+            finally:
+                timeout.cancel()
+            if options.rate:
+                gevent.sleep(max(next_time - time.time(), 0))
+            elif options.think:
+                gevent.sleep(rng.expovariate(1.0 / options.think))
+        if sock is not None:
+            sock.close()
+
+    slow_count = int(round(options.connections * options.slow))
+    greenlets = [gevent.spawn(connection, i, i < slow_count) for i in xrange(options.connections)]
+    gevent.joinall(greenlets)
+    _emit({'latency': latencies.buckets, 'slow_latency': slow_latencies.buckets,
+           'per_interval': per_interval, 'counters': counters})
+
+
+# Coordinator
+
+def _spawn(role, options, extra=()):
+    args = [sys.executable, '-m', 'uvent.soak', '--role', role]
+    for name in ('duration', 'ramp', 'rate', 'think', 'slow', 'slow_delay', 'size', 'idle_timeout', 'request_timeout',
+                 'interval', 'backlog'):
+        args += ['--' + name.replace('_', '-'), repr(getattr(options, name))]
+    if options.uvent_sockets:
+        args.append('--uvent-sockets')
+    return subprocess.Popen(args + list(extra), stdout=subprocess.PIPE)
+
+
+def _summary(histogram):
+    if not histogram.count:
+        return None
+    return dict(('p%s' % str(p).replace('.', ''), round(histogram.percentile(p), 6)) for p in (50, 99, 99.9))
+
+
+def run(options):
+    """Run a soak test with the given options (as parsed by main) and return the results."""
+    limit = _raise_nofile()
+    server = _spawn('server', options)
+    port = json.loads(server.stdout.readline())['port']
+    samples = []
+
+    def read_samples():
+        for line in iter(server.stdout.readline, b''):
+            samples.append(json.loads(line)['sample'])
+
+    reader = threading.Thread(target=read_samples)
+    reader.daemon = True
+    reader.start()
+    clients = []
+    per_client = options.connections // options.clients
+    for i in xrange(options.clients):
+        count = per_client + (1 if i < options.connections % options.clients else 0)
+        clients.append(_spawn('client', options, ['--port', str(port), '--connections', str(count), '--seed', str(i)]))
+    outputs = [client.communicate()[0] for client in clients]
+    server.send_signal(signal.SIGTERM)
+    server.wait()
+    reader.join()
+
+    latency = Histogram()
+    slow_latency = Histogram()
+    per_interval = {}
+    counters = {}
+    for output in outputs:
+        if not output.strip():
+            continue
+        result = json.loads(output.strip().splitlines()[-1])
+        latency.merge(Histogram(result['latency']))
+        slow_latency.merge(Histogram(result['slow_latency']))
+        for slot, count in result['per_interval'].items():
+            per_interval[int(slot)] = per_interval.get(int(slot), 0) + count
+        for name, value in result['counters'].items():
+            counters[name] = counters.get(name, 0) + value
+    total = Histogram()
+    total.merge(latency)
+    total.merge(slow_latency)
+    rss = [sample['rss'] for sample in samples]
+    return {'options': vars(options),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'fd_limit': limit,
+            'client_counters': counters,
+            'server_counters': samples[-1] if samples else None,
+            'throughput': round(total.count / float(options.duration + options.ramp), 1),
+            'latency': _summary(total),
+            'fast_latency': _summary(latency),
+            'slow_latency': _summary(slow_latency),
+            'rss_start': rss[0] if rss else None,
+            'rss_max': max(rss) if rss else None,
+            'rss_end': rss[-1] if rss else None,
+            'rss_growth': rss[-1] - rss[0] if rss else None,
+            'requests_per_interval': [per_interval.get(i, 0) for i in xrange(max(per_interval) + 1)] if per_interval else [],
+            'samples': samples}
+
+
+def main():
+    parser = optparse.OptionParser(usage='python -m uvent.soak [options]')
+    parser.add_option('--connections', type='int', default=1000, help='connections in total [default: %default]')
+    parser.add_option('--clients', type='int', default=4, help='client processes [default: %default]')
+    parser.add_option('--duration', type='float', default=30.0, help='seconds to run for after the ramp up [default: %default]')
+    parser.add_option('--ramp', type='float', default=5.0, help='seconds over which connections are opened [default: %default]')
+    parser.add_option('--rate', type='float', default=0.0,
+                      help='requests per second per connection, 0 to use --think instead [default: %default]')
+    parser.add_option('--think', type='float', default=0.1,
+                      help='mean seconds between requests of a connection (exponential) [default: %default]')
+    parser.add_option('--slow', type='float', default=0.1, help='fraction of slow connections [default: %default]')
+    parser.add_option('--slow-delay', type='float', default=0.05,
+                      help='pause in the middle of the requests of slow connections [default: %default]')
+    parser.add_option('--size', type='int', default=1024, help='response body size [default: %default]')
+    parser.add_option('--idle-timeout', type='float', default=5.0,
+                      help='the server closes connections idle for longer [default: %default]')
+    parser.add_option('--request-timeout', type='float', default=10.0,
+                      help='clients give up on connecting or on a request after this long [default: %default]')
+    parser.add_option('--backlog', type='int', default=1024, help='listen backlog [default: %default]')
+    parser.add_option('--interval', type='float', default=1.0, help='sampling interval [default: %default]')
+    parser.add_option('--uvent-sockets', action='store_true', help='install uvent sockets in the server')
+    parser.add_option('--output', default=None, help='file to write the JSON results to [default: soak-<time>.json]')
+    parser.add_option('--role', default=None, help=optparse.SUPPRESS_HELP)
+    parser.add_option('--port', type='int', default=0, help=optparse.SUPPRESS_HELP)
+    parser.add_option('--seed', type='int', default=0, help=optparse.SUPPRESS_HELP)
+    options, args = parser.parse_args()
+    if options.role == 'server':
+        _raise_nofile()
+        _server(options)
+    elif options.role == 'client':
+        _raise_nofile()
+        _client(options)
+    else:
+        if options.clients < 1 or options.connections < options.clients:
+            parser.error('there must be at least one client process and one connection per client')
+        output = options.output or time.strftime('soak-%Y%m%d-%H%M%S.json')
+        results = run(options)
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        summary = dict((key, results[key]) for key in ('throughput', 'latency', 'slow_latency', 'rss_start',
+                                                       'rss_end', 'rss_growth', 'client_counters'))
+        print(json.dumps(summary, indent=2, sort_keys=True))
+        print('Results written to %s' % output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,510 @@
+# coding=utf8
+
+# Copyright (C) 2012 Saúl Ibarra Corretgé <saghul@gmail.com>
+#
+
+"""Cooperative sockets which transfer data using pyuv handles.
+
+gevent sockets wait for readiness with io watchers and then retry the
+system call from Python. The socket class in this module uses a pyuv.TCP
+(or pyuv.Pipe, for Unix domain sockets) handle opened on a duplicate of
+the socket's file descriptor instead: data is read by libuv as soon as it
+arrives and buffered, so recv is satisfied from the buffer without an
+extra wakeup, and writes are handed to libuv, which tries to complete them
+right away. Datagram sockets use a pyuv.UDP handle the same way.
+
+The handle is created on the first data transfer call, connecting,
+accepting and everything else is left to the gevent socket this class
+extends. Once it has been created, readiness of the file descriptor
+(as reported by select, for instance) is no longer meaningful.
+"""
+
+from __future__ import absolute_import
+
+__all__ = ['socket']
+
+import errno
+import os
+import pyuv
+
+from collections import deque
+
+from gevent import socket as _gevent_socket
+from gevent.socket import AF_INET, AF_INET6, MSG_DONTWAIT, MSG_PEEK, SOCK_DGRAM, SOCK_STREAM, error, getaddrinfo, inet_pton
+
+from .util import uv_error
+from .waitable import Waitable, cancel_wait_error
+
+try:
+    from gevent.socket import AF_UNIX
+except ImportError:
+    AF_UNIX = None
+
+# recv flags which can still be honoured once libuv reads the data, it isn't in the kernel any more
+_RECV_FLAGS = MSG_PEEK | MSG_DONTWAIT
+
+
+class _Transport(Waitable):
+    """Base class for the pyuv handle wrappers shared by a socket and its dups."""
+
+    _waitable_kind = 'socket'
+
+    def __init__(self, handle, fd):
+        fd = os.dup(fd)
+        try:
+            handle.open(fd)
+        except Exception:
+            os.close(fd)
+            raise
+        self.handle = handle
+        self.refs = 1
+        self._read_waiter = None
+        self._write_waiter = None
+
+    def close(self):
+        self.refs -= 1
+        if self.refs > 0:
+            return
+        self._close()
+
+    def _close(self):
+        self.handle.close()
+        self._wake_later('_read_waiter', 'throw', cancel_wait_error)
+        self._wake_later('_write_waiter', 'throw', cancel_wait_error)
+
+
+class _Stream(_Transport):
+    """Buffered reads and writes on a pyuv stream handle."""
+
+    # Reading from the kernel is paused while this many bytes are buffered
+    read_buffer_size = 256 * 1024
+
+    # Writes are handed to libuv this many bytes at a time, each once the previous one has been written. As with
+    # the kernel's send buffer, what libuv was given is still written after a timeout, and after the socket is closed
+    write_buffer_size = 256 * 1024
+
+    def __init__(self, loop, sock):
+        handle = pyuv.Pipe(loop) if sock.family == AF_UNIX else pyuv.TCP(loop)
+        super(_Stream, self).__init__(handle, sock.fileno())
+        self._chunks = deque()
+        self._offset = 0
+        self._buffered = 0
+        self._eof = False
+        self._error = None
+        self._write_error = None
+        self._writes = 0
+        self._closing = False
+        self._reading = False
+        self._start_reading()
+
+    def _start_reading(self):
+        if not self._reading and not self._eof and self._error is None:
+            try:
+                self.handle.start_read(self._on_read)
+            except pyuv.error.StreamError as e:
+                self._error = uv_error(e.args[0], error)
+            else:
+                self._reading = True
+
+    def _on_read(self, handle, data, errorno):
+        if errorno is not None:
+            # pyuv stops reading on error
+            self._reading = False
+            if errorno == pyuv.errno.UV_EOF:
+                self._eof = True
+            else:
+                self._error = uv_error(errorno, error)
+        elif data:
+            self._chunks.append(data)
+            self._buffered += len(data)
+            if self._buffered >= self.read_buffer_size:
+                handle.stop_read()
+                self._reading = False
+        else:
+            return
+        self._wake('_read_waiter')
+
+    def _on_write(self, handle, errorno):
+        self._writes -= 1
+        if errorno is not None:
+            self._write_error = uv_error(errorno, error)
+        if self._closing:
+            if errorno is not None or not self._writes:
+                self._closing = False
+                handle.close()
+        elif errorno is not None or not self._writes:
+            self._wake('_write_waiter')
+
+    def wait_readable(self, seconds):
+        """Return True if there is data to read, False on EOF. Blocks if needed."""
+        while not self._buffered:
+            if self._error is not None:
+                raise self._error
+            if self._eof:
+                return False
+            if seconds == 0.0:
+                raise error(errno.EWOULDBLOCK, os.strerror(errno.EWOULDBLOCK))
+            self._wait('_read_waiter', seconds)
+        return True
+
+    def read(self, size):
+        chunks = self._chunks
+        chunk = chunks[0]
+        offset = self._offset
+        available = len(chunk) - offset
+        if size >= available and (len(chunks) == 1 or size == available):
+            # Fast path: hand out the whole chunk
+            chunks.popleft()
+            self._offset = 0
+            data = chunk[offset:] if offset else chunk
+        elif size < available:
+            self._offset += size
+            data = chunk[offset:offset + size]
+        else:
+            parts = []
+            while chunks and size > 0:
+                chunk = chunks[0]
+                available = len(chunk) - self._offset
+                if available > size:
+                    parts.append(chunk[self._offset:self._offset + size])
+                    self._offset += size
+                    break
+                parts.append(chunk[self._offset:] if self._offset else chunk)
+                chunks.popleft()
+                self._offset = 0
+                size -= available
+            data = b''.join(parts)
+        self._consumed(len(data))
+        return data
+
+    def read_into(self, view, size):
+        chunks = self._chunks
+        copied = 0
+        while chunks and copied < size:
+            chunk = chunks[0]
+            offset = self._offset
+            n = min(len(chunk) - offset, size - copied)
+            view[copied:copied + n] = memoryview(chunk)[offset:offset + n]
+            copied += n
+            if offset + n == len(chunk):
+                chunks.popleft()
+                self._offset = 0
+            else:
+                self._offset += n
+        self._consumed(copied)
+        return copied
+
+    def peek(self, size):
+        parts = []
+        offset = self._offset
+        for chunk in self._chunks:
+            if size <= 0:
+                break
+            part = chunk[offset:offset + size]
+            parts.append(part)
+            size -= len(part)
+            offset = 0
+        return b''.join(parts)
+
+    def _consumed(self, size):
+        self._buffered -= size
+        if not self._reading and self._buffered < self.read_buffer_size:
+            self._start_reading()
+
+    def wait_writable(self, seconds):
+        """Block until libuv has written the data it was given before."""
+        # Only writes made through the transport or a TLS stream on it count, a WriteQueue may share the handle
+        while self._writes and self._write_error is None:
+            if seconds == 0.0:
+                raise error(errno.EWOULDBLOCK, os.strerror(errno.EWOULDBLOCK))
+            self._wait('_write_waiter', seconds)
+        if self._write_error is not None:
+            raise self._write_error
+
+    def write(self, data, offset=0):
+        """Hand up to write_buffer_size bytes of data, starting at offset, to libuv. Return how many."""
+        size = min(len(data) - offset, self.write_buffer_size)
+        if isinstance(data, bytes):
+            chunk = buffer(data, offset, size) if offset or size < len(data) else data
+        else:
+            # libuv references the data until it's written, which may be after the caller got control back
+            chunk = memoryview(data)[offset:offset + size].tobytes()
+        try:
+            self.handle.write(chunk, self._on_write)
+        except pyuv.error.StreamError as e:
+            raise uv_error(e.args[0], error)
+        self._writes += 1
+        return size
+
+    def _close(self):
+        if self._writes and self._write_error is None:
+            # The handle is closed by _on_write once the data is written
+            self._closing = True
+            self._wake_later('_read_waiter', 'throw', cancel_wait_error)
+            self._wake_later('_write_waiter', 'throw', cancel_wait_error)
+        else:
+            super(_Stream, self)._close()
+
+    def shutdown_read(self):
+        if self._reading:
+            self.handle.stop_read()
+            self._reading = False
+        self._eof = True
+        self._wake_later('_read_waiter', 'switch', None)
+
+
+class _Datagram(_Transport):
+    """Queued reads and writes on a pyuv.UDP handle."""
+
+    # Reading from the kernel is paused while this many datagrams are queued
+    read_queue_size = 256
+    # Senders block while this many datagrams are waiting to be sent
+    write_queue_size = 256
+
+    def __init__(self, loop, sock):
+        super(_Datagram, self).__init__(pyuv.UDP(loop), sock.fileno())
+        self._family = sock.family
+        self._queue = deque()
+        self._error = None
+        self._write_error = None
+        self._pending = 0
+        self._reading = False
+        self._start_reading()
+
+    def _start_reading(self):
+        if not self._reading:
+            self.handle.start_recv(self._on_recv)
+            self._reading = True
+
+    def _on_recv(self, handle, address, flags, data, errorno):
+        if errorno is not None:
+            self._error = uv_error(errorno, error)
+        else:
+            self._queue.append((data, address))
+            if len(self._queue) >= self.read_queue_size:
+                handle.stop_recv()
+                self._reading = False
+        self._wake('_read_waiter')
+
+    def _on_send(self, handle, errorno):
+        self._pending -= 1
+        if errorno is not None:
+            self._write_error = uv_error(errorno, error)
+        if self._pending < self.write_queue_size:
+            self._wake('_write_waiter')
+
+    def wait_readable(self, seconds):
+        while not self._queue:
+            if self._error is not None:
+                exc, self._error = self._error, None
+                raise exc
+            if seconds == 0.0:
+                raise error(errno.EWOULDBLOCK, os.strerror(errno.EWOULDBLOCK))
+            self._wait('_read_waiter', seconds)
+
+    def peek(self):
+        return self._queue[0]
+
+    def read(self):
+        item = self._queue.popleft()
+        if not self._reading and len(self._queue) < self.read_queue_size:
+            self._start_reading()
+        return item
+
+    def resolve(self, address):
+        try:
+            inet_pton(self._family, address[0])
+        except (error, TypeError, ValueError):
+            return getaddrinfo(address[0], address[1], self._family, SOCK_DGRAM)[0][-1]
+        return address
+
+    def write(self, data, address, seconds):
+        if self._write_error is not None:
+            exc, self._write_error = self._write_error, None
+            raise exc
+        if not isinstance(data, bytes):
+            # libuv sends the datagram later on, the data must not change in the meantime
+            data = memoryview(data).tobytes()
+        while self._pending >= self.write_queue_size:
+            if seconds == 0.0:
+                raise error(errno.EWOULDBLOCK, os.strerror(errno.EWOULDBLOCK))
+            self._wait('_write_waiter', seconds)
+        try:
+            self.handle.send(address, data, self._on_send)
+        except pyuv.error.UDPError as e:
+            raise uv_error(e.args[0], error)
+        self._pending += 1
+        return len(data)
+
+
+class socket(_gevent_socket.socket):
+    """gevent socket which transfers data using a pyuv handle.
+
+    Only TCP, UDP and Unix domain stream sockets use a pyuv handle, any
+    other kind of socket behaves just like a gevent socket.
+    """
+
+    def __init__(self, family=AF_INET, type=SOCK_STREAM, proto=0, _sock=None):
+        super(socket, self).__init__(family, type, proto, _sock)
+        self._transport = None
+        if isinstance(_sock, socket):
+            # dup and makefile, share the handle and its buffers
+            self._transport = _sock._get_transport()
+            if self._transport is not None:
+                self._transport.refs += 1
+
+    def _get_transport(self):
+        transport = self._transport
+        if transport is None:
+            sock = self._sock
+            if sock.type == SOCK_STREAM and sock.family in (AF_INET, AF_INET6, AF_UNIX):
+                transport = _Stream(self.hub.loop._loop, sock)
+            elif sock.type == SOCK_DGRAM and sock.family in (AF_INET, AF_INET6):
+                transport = _Datagram(self.hub.loop._loop, sock)
+            else:
+                return None
+            self._transport = transport
+        return transport
+
+    def accept(self):
+        sock, address = super(socket, self).accept()
+        if not isinstance(sock, socket):
+            sock = socket(_sock=sock)
+        return sock, address
+
+    def close(self):
+        super(socket, self).close()
+        transport, self._transport = self._transport, None
+        if transport is not None:
+            transport.close()
+
+    def dup(self):
+        return socket(_sock=self)
+
+    def __del__(self):
+        # Like the fd of a regular socket, the handle is closed when the last object using it is gone
+        transport = getattr(self, '_transport', None)
+        if transport is not None:
+            self._transport = None
+            transport.close()
+
+    def shutdown(self, how):
+        transport = self._transport
+        if isinstance(transport, _Stream) and how in (0, 2):
+            transport.shutdown_read()
+        super(socket, self).shutdown(how)
+
+    def _recv_transport(self, flags):
+        # With flags, the kernel is only used if libuv hasn't started reading from it yet
+        return self._transport if flags else self._get_transport()
+
+    def _recv_timeout(self, flags):
+        if flags & ~_RECV_FLAGS:
+            raise error(errno.EOPNOTSUPP, os.strerror(errno.EOPNOTSUPP))
+        return 0.0 if flags & MSG_DONTWAIT else self.timeout
+
+    def recv(self, bufsize, flags=0):
+        transport = self._recv_transport(flags)
+        if transport is None:
+            return super(socket, self).recv(bufsize, flags)
+        if isinstance(transport, _Datagram):
+            return self.recvfrom(bufsize, flags)[0]
+        if not bufsize or not transport.wait_readable(self._recv_timeout(flags)):
+            return b''
+        if flags & MSG_PEEK:
+            return transport.peek(bufsize)
+        return transport.read(bufsize)
+
+    def recv_into(self, buffer, nbytes=0, flags=0):
+        transport = self._recv_transport(flags)
+        if transport is None:
+            return super(socket, self).recv_into(buffer, nbytes, flags)
+        if isinstance(transport, _Datagram):
+            return self.recvfrom_into(buffer, nbytes, flags)[0]
+        view = memoryview(buffer)
+        nbytes = min(nbytes or len(view), len(view))
+        if not nbytes or not transport.wait_readable(self._recv_timeout(flags)):
+            return 0
+        if flags & MSG_PEEK:
+            data = transport.peek(nbytes)
+            view[:len(data)] = data
+            return len(data)
+        return transport.read_into(view, nbytes)
+
+    def _recv_datagram(self, transport, flags):
+        transport.wait_readable(self._recv_timeout(flags))
+        return transport.peek() if flags & MSG_PEEK else transport.read()
+
+    def recvfrom(self, bufsize, flags=0):
+        transport = self._recv_transport(flags)
+        if isinstance(transport, _Stream):
+            return self.recv(bufsize, flags), None
+        if transport is None:
+            return super(socket, self).recvfrom(bufsize, flags)
+        data, address = self._recv_datagram(transport, flags)
+        return data[:bufsize], address
+
+    def recvfrom_into(self, buffer, nbytes=0, flags=0):
+        transport = self._recv_transport(flags)
+        if isinstance(transport, _Stream):
+            return self.recv_into(buffer, nbytes, flags), None
+        if transport is None:
+            return super(socket, self).recvfrom_into(buffer, nbytes, flags)
+        view = memoryview(buffer)
+        nbytes = min(nbytes or len(view), len(view))
+        data, address = self._recv_datagram(transport, flags)
+        n = min(nbytes, len(data))
+        view[:n] = data[:n]
+        return n, address
+
+    def _kernel_send(self, transport, timeout):
+        # Sending with flags is left to the kernel, after what libuv was given before
+        if isinstance(transport, _Stream):
+            transport.wait_writable(timeout)
+
+    def send(self, data, flags=0, timeout=_gevent_socket.timeout_default):
+        transport = self._get_transport()
+        if transport is None:
+            return super(socket, self).send(data, flags, timeout)
+        if timeout is _gevent_socket.timeout_default:
+            timeout = self.timeout
+        if flags:
+            self._kernel_send(transport, timeout)
+            return super(socket, self).send(data, flags, timeout)
+        if isinstance(transport, _Datagram):
+            return transport.write(data, self._sock.getpeername(), timeout)
+        if isinstance(data, unicode):
+            data = data.encode()
+        if not len(data):
+            return 0
+        # Like a kernel send buffer with room for write_buffer_size bytes: only what was accepted is returned
+        transport.wait_writable(timeout)
+        return transport.write(data)
+
+    def sendall(self, data, flags=0):
+        transport = self._get_transport()
+        if transport is None:
+            return super(socket, self).sendall(data, flags)
+        if flags:
+            self._kernel_send(transport, self.timeout)
+            return super(socket, self).sendall(data, flags)
+        if isinstance(data, unicode):
+            data = data.encode()
+        if isinstance(transport, _Datagram):
+            transport.write(data, self._sock.getpeername(), self.timeout)
+        else:
+            timeout = self.timeout
+            offset = 0
+            while offset < len(data):
+                transport.wait_writable(timeout)
+                offset += transport.write(data, offset)
+
+    def sendto(self, data, flags_or_address, address=None):
+        if address is None:
+            flags, address = 0, flags_or_address
+        else:
+            flags = flags_or_address
+        transport = self._get_transport()
+        if not isinstance(transport, _Datagram) or flags:
+            return super(socket, self).sendto(data, flags, address)
+        return transport.write(data, transport.resolve(address), self.timeout)
@@ -0,0 +1,250 @@
+# coding=utf8
+
+# Copyright (C) 2012 Saúl Ibarra Corretgé <saghul@gmail.com>
+#
+
+"""gevent's ThreadPool interface on top of the libuv thread pool.
+
+Functions are run with pyuv.Loop.queue_work, libuv hands them to its
+threads and calls back on the loop thread when they are done, so there is
+no Python queue, lock or async watcher per task as in gevent's pool.
+uvent.install() makes this the hub's threadpool class.
+
+The libuv thread pool is shared by everything in the process which uses
+it, pyuv.fs requests included, and has a fixed number of threads: 4, or
+UV_THREADPOOL_SIZE (up to 128) if set in the environment before it's
+first used. Functions which block for long delay the pyuv.fs requests
+(uvent.fileobject, stat watchers) queued behind them. `maxsize` limits how
+many functions are handed to it at once, spawn blocks once that many are
+running. libuv doesn't recreate its threads after fork, so in a forked
+child of a process which used the pool, pools fall back to gevent's
+ThreadPool.
+"""
+
+from __future__ import absolute_import
+
+__all__ = ['ThreadPool']
+
+import os
+import sys
+
+from collections import deque
+
+from gevent import threadpool as _gevent_threadpool
+from gevent.event import AsyncResult, Event
+from gevent.hub import Waiter, get_hub
+from gevent.pool import GroupMappingMixin
+
+from .util import pool_usable, pool_used
+
+
+def _libuv_threads():
+    try:
+        threads = int(os.environ.get('UV_THREADPOOL_SIZE', 4))
+    except ValueError:
+        threads = 4
+    return min(max(threads, 1), 128)
+
+
+def _wrap_errors(errors, function, args, kwargs):
+    # Used by ThreadPool.apply_e, runs in the pool
+    try:
+        return True, function(*args, **kwargs)
+    except errors as e:
+        return False, e
+
+
+class _Task(object):
+    __slots__ = ('pool', 'func', 'args', 'kwargs', 'result', 'value', 'exc_info')
+
+    def __init__(self, pool, func, args, kwargs, result):
+        self.pool = pool
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.result = result
+        self.value = None
+        self.exc_info = None
+
+    def run(self):
+        # Runs in a libuv thread
+        try:
+            self.value = self.func(*self.args, **self.kwargs)
+        except:
+            self.exc_info = sys.exc_info()
+
+    def done(self, errorno):
+        # Runs on the loop thread
+        pool, result, exc_info = self.pool, self.result, self.exc_info
+        pool._task_done()
+        if exc_info is not None:
+            # As gevent's ThreadPool does, report the error and raise it to whoever waits for the result
+            pool.hub.handle_error((pool, self.func), *exc_info)
+            result.set_exception(exc_info[1], exc_info)
+        else:
+            result.set(self.value)
+        self.pool = self.func = self.args = self.kwargs = self.result = self.value = self.exc_info = None
+
+
+class ThreadPool(GroupMappingMixin):
+    """Implementation of gevent's ThreadPool with pyuv.Loop.queue_work.
+
+    `size` is the number of threads which can run functions of this pool,
+    libuv decides it, setting it only checks the value.
+    """
+
+    def __init__(self, maxsize, hub=None):
+        if hub is None:
+            hub = get_hub()
+        self.hub = hub
+        self.pid = os.getpid()
+        self._maxsize = 0
+        self._unfinished = 0
+        # Waiters of the spawn calls blocked until fewer than maxsize functions are running
+        self._waiters = deque()
+        self._idle = Event()
+        self._idle.set()
+        self._fallback = None
+        self.maxsize = maxsize
+        self._fork_watcher = hub.loop.fork(ref=False)
+        self._fork_watcher.start(self._on_fork)
+
+    def __repr__(self):
+        return '<%s at 0x%x %s/%s/%s>' % (self.__class__.__name__, id(self), len(self), self.size, self.maxsize)
+
+    def __len__(self):
+        if self._fallback is not None:
+            return len(self._fallback)
+        return self._unfinished
+
+    def _get_maxsize(self):
+        return self._maxsize
+
+    def _set_maxsize(self, maxsize):
+        if not isinstance(maxsize, (int, long)):
+            raise TypeError('maxsize must be integer: %r' % (maxsize, ))
+        if maxsize < 0:
+            raise ValueError('maxsize must not be negative: %r' % (maxsize, ))
+        self._maxsize = maxsize
+        if self._fallback is not None:
+            self._fallback.maxsize = maxsize
+        self._wake_waiters()
+    maxsize = property(_get_maxsize, _set_maxsize)
+    del _get_maxsize, _set_maxsize
+
+    def _get_size(self):
+        if self._fallback is not None:
+            return self._fallback.size
+        return min(self._maxsize, _libuv_threads())
+
+    def _set_size(self, size):
+        if size < 0:
+            raise ValueError('Size of the pool cannot be negative: %r' % (size, ))
+        if size > self._maxsize:
+            raise ValueError('Size of the pool cannot be bigger than maxsize: %r > %r' % (size, self._maxsize))
+        if self._fallback is not None:
+            self._fallback.size = size
+    size = property(_get_size, _set_size)
+    del _get_size, _set_size
+
+    def _on_fork(self):
+        # Functions in progress belong to the parent, the libuv threads are gone if the parent used them
+        pid = os.getpid()
+        if pid != self.pid:
+            self.pid = pid
+            self._unfinished = 0
+            self._idle.set()
+            self._wake_waiters()
+            if self._fallback is not None:
+                self._fallback._on_fork()
+        if self._fallback is None and not pool_usable():
+            self._fallback = _gevent_threadpool.ThreadPool(self._maxsize, self.hub)
+
+    def spawn(self, func, *args, **kwargs):
+        """Run func(*args, **kwargs) in the libuv thread pool and return a gevent.event.AsyncResult.
+
+        Blocks while `maxsize` functions are running.
+        """
+        if self._fallback is None and not pool_usable():
+            # Created in a forked child, or the fork watcher didn't run yet
+            self._on_fork()
+        if self._fallback is not None:
+            return self._fallback.spawn(func, *args, **kwargs)
+        self._wait_for_room()
+        result = AsyncResult()
+        task = _Task(self, func, args, kwargs, result)
+        # The pyuv loop is looked up every time, it changes after fork
+        self.hub.loop._loop.queue_work(task.run, task.done)
+        pool_used()
+        self._unfinished += 1
+        self._idle.clear()
+        return result
+
+    def _wait_for_room(self):
+        while self._unfinished >= self._maxsize:
+            waiter = Waiter()
+            self._waiters.append(waiter)
+            try:
+                waiter.get()
+            except:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                else:
+                    # Woken up meanwhile, let another one have the room
+                    self._wake_waiters()
+                raise
+
+    def _wake_waiters(self):
+        # The spawn calls woken up check again, one which didn't wait may have taken the room meanwhile
+        room = self._maxsize - self._unfinished
+        while room > 0 and self._waiters:
+            self.hub.loop.run_callback(self._waiters.popleft().switch, None)
+            room -= 1
+
+    def _task_done(self):
+        self._unfinished -= 1
+        if not self._unfinished:
+            self._idle.set()
+        self._wake_waiters()
+
+    def join(self):
+        """Wait until all the functions which were spawned have finished."""
+        if self._fallback is not None:
+            self._fallback.join()
+        self._idle.wait()
+
+    def kill(self):
+        # libuv's threads can't be stopped, functions which are running finish on their own
+        if self._fallback is not None:
+            self._fallback.kill()
+
+    def adjust(self):
+        pass
+
+    def apply_e(self, expected_errors, function, args=None, kwargs=None):
+        """Run function in the pool and return its result, or raise its error.
+
+        As with gevent 1.0's ThreadPool (gevent.resolver_thread uses it),
+        errors which are instances of expected_errors are raised here without
+        being reported.
+        """
+        if args is None:
+            args = ()
+        if kwargs is None:
+            kwargs = {}
+        success, result = self.spawn(_wrap_errors, expected_errors, function, args, kwargs).get()
+        if success:
+            return result
+        raise result
+
+    # GroupMappingMixin hooks, same as gevent's ThreadPool
+
+    def _apply_immediately(self):
+        # A function running in the pool can't wait for another one
+        return get_hub() is not self.hub
+
+    def _apply_async_cb_spawn(self, callback, result):
+        callback(result)
+
+    def _apply_async_use_greenlet(self):
+        return True
@@ -0,0 +1,156 @@
+# coding=utf8
+
+# Copyright (C) 2012 Saúl Ibarra Corretgé <saghul@gmail.com>
+#
+
+"""A pool of threads, each of which runs its own gevent hub and UVLoop.
+
+Work is handed to the threads with UVLoop.run_callback_threadsafe. Accepted
+connections are handed to the thread with the fewest connections in
+progress, where they are served by a greenlet as gevent sockets.
+
+Example::
+
+    from uvent.threads import LoopThreads
+
+    threads = LoopThreads(4)
+    threads.serve(listener, handle)
+
+Only greenlets in the same thread can switch to each other, and the GIL
+still applies, so this pays off for services which spend their time
+waiting for i/o rather than running Python code.
+"""
+
+from __future__ import absolute_import
+
+__all__ = ['LoopThreads']
+
+import errno
+import threading
+
+import gevent
+import gevent.socket
+
+from gevent.event import Event
+from gevent.hub import get_hub
+
+
+def _noop():
+    pass
+
+
+class _LoopThread(threading.Thread):
+
+    def __init__(self, index):
+        super(_LoopThread, self).__init__(name='uvent-loop-%d' % index)
+        self.daemon = True
+        self.loop = None
+        # Only written by the thread dispatching work / by this thread, the difference is the load
+        self.dispatched = 0
+        self.finished = 0
+        self._ready = threading.Event()
+        self._stopped = None
+
+    def run(self):
+        hub = get_hub()
+        self.loop = hub.loop
+        self._stopped = Event()
+        # Keeps the loop alive while waiting for work
+        keepalive = self.loop.async()
+        keepalive.start(_noop)
+        self._ready.set()
+        try:
+            self._stopped.wait()
+        finally:
+            keepalive.stop()
+            hub.destroy(destroy_loop=True)
+
+    def wait_ready(self):
+        self._ready.wait()
+
+    def submit(self, func, args):
+        self.dispatched += 1
+        try:
+            self.loop.run_callback_threadsafe(gevent.spawn, self._run, func, args)
+        except RuntimeError:
+            self.dispatched -= 1
+            raise
+
+    def _run(self, func, args):
+        try:
+            func(*args)
+        finally:
+            self.finished += 1
+
+    def stop(self):
+        try:
+            self.loop.run_callback_threadsafe(self._stopped.set)
+        except RuntimeError:
+            # Already stopped, its loop was destroyed
+            pass
+
+
+def _serve_connection(handle, client, address):
+    # The socket object is created in the thread which serves it, so are its watchers
+    sock = gevent.socket.socket(_sock=client)
+    try:
+        handle(sock, address)
+    finally:
+        sock.close()
+
+
+class LoopThreads(object):
+    """Start `size` threads, each running a hub on its own loop."""
+
+    def __init__(self, size):
+        self.size = size
+        self._threads = [_LoopThread(i) for i in xrange(size)]
+        self._next = 0
+        for thread in self._threads:
+            thread.start()
+        for thread in self._threads:
+            thread.wait_ready()
+
+    @property
+    def loads(self):
+        """Number of functions which were submitted and have not finished yet, per thread."""
+        return [thread.dispatched - thread.finished for thread in self._threads]
+
+    def spawn(self, func, *args):
+        """Run func(*args) in a new greenlet in the next thread, round robin."""
+        thread = self._threads[self._next]
+        self._next = (self._next + 1) % self.size
+        thread.submit(func, args)
+
+    def spawn_least_loaded(self, func, *args):
+        """Run func(*args) in a new greenlet in the thread with the least unfinished work."""
+        thread = min(self._threads, key=lambda t: t.dispatched - t.finished)
+        thread.submit(func, args)
+
+    def dispatch(self, handle, client, address):
+        """Have handle(socket, address) serve an accepted (Python, not gevent) socket in the least loaded thread."""
+        self.spawn_least_loaded(_serve_connection, handle, client, address)
+
+    def serve(self, listener, handle):
+        """Accept connections on a listening gevent socket and dispatch them, forever.
+
+        Connections are accepted by the calling greenlet, as many as there are
+        each time the listener becomes readable.
+        """
+        sock = listener._sock
+        fileno = sock.fileno()
+        while True:
+            try:
+                client, address = sock.accept()
+            except gevent.socket.error as e:
+                if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    raise
+                gevent.socket.wait_read(fileno)
+                continue
+            self.dispatch(handle, client, address)
+
+    def stop(self, timeout=None):
+        for thread in self._threads:
+            thread.stop()
+        for thread in self._threads:
+            thread.join(timeout)
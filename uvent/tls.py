@@ -0,0 +1,497 @@
+# coding=utf8
+
+# Copyright (C) 2012 Saúl Ibarra Corretgé <saghul@gmail.com>
+#
+
+"""TLS on pyuv.TCP handles, with OpenSSL memory BIOs (pyOpenSSL).
+
+gevent's ssl wrapper drives OpenSSL on the socket itself: each record may
+take a readiness wakeup and a retry after SSL_ERROR_WANT_READ. Here libuv
+reads the ciphertext and everything it delivers in a loop iteration is fed
+to OpenSSL at once, the handshake progresses and records are decrypted
+right in the read callback, and greenlets read the buffered plaintext.
+Encrypted output is handed to libuv, which writes it right away if it can.
+
+Example::
+
+    from OpenSSL import SSL
+    from uvent.tls import wrap_socket
+
+    context = SSL.Context(SSL.TLSv1_2_METHOD)
+    context.use_certificate_file('cert.pem')
+    context.use_privatekey_file('key.pem')
+    tls = wrap_socket(sock, context, server_side=True)
+    tls.sendall(tls.recv(1024))
+
+Python 2's ssl module has no MemoryBIO, pyOpenSSL is needed for this
+module. The wrapped socket must not be read from anymore, a uvent socket
+hands over its handle (and what it had buffered). The certificate chain is
+verified as configured in the context (SSL.VERIFY_PEER and the trusted
+CAs); if server_hostname is given the certificate must also match it, as
+ssl.match_hostname checks, or ssl.CertificateError is raised.
+"""
+
+from __future__ import absolute_import
+
+__all__ = ['TLSSocket', 'wrap_socket']
+
+import errno
+import os
+import pyuv
+import time
+
+from collections import deque
+from socket import _fileobject
+from ssl import CertificateError, match_hostname
+
+from OpenSSL import SSL
+from gevent.hub import get_hub
+from gevent.socket import AF_UNIX, error
+
+from .util import uv_error
+from .waitable import Waitable, cancel_wait_error
+
+# Long names of the attributes of certificate subjects and issuers, as the ssl module reports them
+_attribute_names = {
+    'C': 'countryName',
+    'ST': 'stateOrProvinceName',
+    'L': 'localityName',
+    'O': 'organizationName',
+    'OU': 'organizationalUnitName',
+    'CN': 'commonName',
+    'DC': 'domainComponent',
+    'UID': 'userId',
+    'serialNumber': 'serialNumber',
+    'emailAddress': 'emailAddress',
+}
+
+
+def _decode_name(name):
+    return tuple(((_attribute_names.get(key, key), value.decode('utf8')), )
+                 for key, value in ((k.decode('ascii'), v) for k, v in name.get_components()))
+
+
+def _decode_time(value):
+    # '20260118005320Z' -> 'Jan 18 00:53:20 2026 GMT'
+    t = time.strptime(value.decode('ascii'), '%Y%m%d%H%M%SZ')
+    return '%s %2d %s %d GMT' % (time.strftime('%b', t), t.tm_mday, time.strftime('%H:%M:%S', t), t.tm_year)
+
+
+def _decode_certificate(cert):
+    """Return a pyOpenSSL X509 as a dictionary in the format of ssl.SSLSocket.getpeercert()."""
+    serial = '%X' % cert.get_serial_number()
+    result = {
+        'subject': _decode_name(cert.get_subject()),
+        'issuer': _decode_name(cert.get_issuer()),
+        'version': cert.get_version() + 1,
+        'serialNumber': serial if len(serial) % 2 == 0 else '0' + serial,
+        'notBefore': _decode_time(cert.get_notBefore()),
+        'notAfter': _decode_time(cert.get_notAfter()),
+    }
+    for i in xrange(cert.get_extension_count()):
+        extension = cert.get_extension(i)
+        if extension.get_short_name() == b'subjectAltName':
+            names = []
+            for item in str(extension).split(', '):
+                kind, _, value = item.partition(':')
+                names.append((kind, value))
+            result['subjectAltName'] = tuple(names)
+    return result
+
+
+class _TLSStream(Waitable):
+    """Ciphertext from / to a pyuv stream handle, plaintext from / to greenlets."""
+
+    _waitable_kind = 'socket'
+
+    # Reading from the kernel is paused while this much plaintext is buffered
+    read_buffer_size = 256 * 1024
+
+    # Bytes of ciphertext taken from OpenSSL at a time
+    chunk_size = 64 * 1024
+
+    # Plaintext is encrypted and handed to libuv this many bytes at a time, each once the previous ciphertext has
+    # been written. As with a socket, what libuv was given is still written after a timeout
+    write_buffer_size = 256 * 1024
+
+    def __init__(self, loop, sock, context, server_side, server_hostname):
+        self._sock = sock
+        # The uvent socket transport whose handle is used, None if the handle is our own
+        self._transport = None
+        ciphertext = b''
+        transport = getattr(sock, '_transport', None)
+        if transport is not None and hasattr(transport, 'shutdown_read'):
+            # A uvent socket which already has a handle: take it over, along with what it read
+            if transport._reading:
+                transport.handle.stop_read()
+                transport._reading = False
+            transport._eof = True
+            if transport._buffered:
+                ciphertext = transport.read(transport._buffered)
+            self.handle = transport.handle
+            self._transport = transport
+        else:
+            handle = pyuv.Pipe(loop) if sock.family == AF_UNIX else pyuv.TCP(loop)
+            fd = os.dup(sock.fileno())
+            try:
+                handle.open(fd)
+            except Exception:
+                os.close(fd)
+                raise
+            self.handle = handle
+        self._conn = conn = SSL.Connection(context, None)
+        if server_side:
+            conn.set_accept_state()
+        else:
+            conn.set_connect_state()
+            if isinstance(server_hostname, unicode):
+                server_hostname = server_hostname.encode('idna')
+            if server_hostname:
+                conn.set_tlsext_host_name(server_hostname)
+        # Checked against the certificate once the handshake is done
+        self._hostname = server_hostname if not server_side and server_hostname else None
+        self.handshake_done = False
+        self._chunks = deque()
+        self._offset = 0
+        self._buffered = 0
+        self._eof = False
+        self._error = None
+        self._write_error = None
+        self._writes = 0
+        self._closing = False
+        self._reading = False
+        self._read_waiter = None
+        self._write_waiter = None
+        self._handshake_waiter = None
+        self.closed = False
+        if ciphertext:
+            conn.bio_write(ciphertext)
+            self._process()
+        self._start_reading()
+
+    # Reading
+
+    def _start_reading(self):
+        if not self._reading and not self._eof and self._error is None and not self.closed:
+            try:
+                self.handle.start_read(self._on_read)
+            except pyuv.error.StreamError as e:
+                self._error = uv_error(e.args[0], error)
+            else:
+                self._reading = True
+
+    def _on_read(self, handle, data, errorno):
+        if errorno is not None:
+            self._reading = False
+            if errorno == pyuv.errno.UV_EOF:
+                self._eof = True
+            else:
+                self._error = uv_error(errorno, error)
+        elif data:
+            self._conn.bio_write(data)
+            self._process()
+        else:
+            return
+        if self._error is not None or self._eof:
+            self._wake('_handshake_waiter')
+            self._wake('_write_waiter')
+        self._wake('_read_waiter')
+
+    def _process(self):
+        # Runs the handshake and decrypts every complete record OpenSSL has been given
+        conn = self._conn
+        try:
+            if not self.handshake_done:
+                try:
+                    conn.do_handshake()
+                except SSL.WantReadError:
+                    return
+                finally:
+                    self._flush()
+                self.handshake_done = True
+                self._wake('_handshake_waiter')
+            chunks = self._chunks
+            while True:
+                try:
+                    data = conn.recv(self.chunk_size)
+                except SSL.WantReadError:
+                    break
+                except SSL.ZeroReturnError:
+                    self._eof = True
+                    break
+                chunks.append(data)
+                self._buffered += len(data)
+        except SSL.Error as e:
+            self._error = error(errno.EPROTO, 'TLS error: %s' % (e, ))
+        finally:
+            # Alerts, session tickets and renegotiation produce output
+            self._flush()
+        if self._reading and (self._buffered >= self.read_buffer_size or self._eof or self._error is not None):
+            self.handle.stop_read()
+            self._reading = False
+
+    def wait_readable(self, seconds):
+        """Return True if there is plaintext to read, False on EOF. Blocks if needed."""
+        while not self._buffered:
+            if self._error is not None:
+                raise self._error
+            if self._eof:
+                return False
+            if seconds == 0.0:
+                raise error(errno.EWOULDBLOCK, os.strerror(errno.EWOULDBLOCK))
+            self._wait('_read_waiter', seconds)
+        return True
+
+    def read(self, size):
+        chunks = self._chunks
+        parts = []
+        while chunks and size > 0:
+            chunk = chunks[0]
+            available = len(chunk) - self._offset
+            if available > size:
+                parts.append(chunk[self._offset:self._offset + size])
+                self._offset += size
+                break
+            parts.append(chunk[self._offset:] if self._offset else chunk)
+            chunks.popleft()
+            self._offset = 0
+            size -= available
+        data = parts[0] if len(parts) == 1 else b''.join(parts)
+        self._buffered -= len(data)
+        if self._buffered < self.read_buffer_size:
+            self._start_reading()
+        return data
+
+    # Writing
+
+    def _flush(self):
+        # Hand the ciphertext OpenSSL produced to libuv
+        conn = self._conn
+        while True:
+            try:
+                data = conn.bio_read(self.chunk_size)
+            except SSL.WantReadError:
+                return
+            if not data or self.closed:
+                return
+            try:
+                self.handle.write(data, self._on_write)
+            except pyuv.error.StreamError as e:
+                self._write_error = uv_error(e.args[0], error)
+                return
+            self._writes += 1
+            if self._transport is not None:
+                # Counted by the transport too, so closing the socket doesn't close the handle under the ciphertext
+                self._transport._writes += 1
+
+    def _on_write(self, handle, errorno):
+        if self._transport is not None:
+            self._transport._on_write(handle, errorno)
+        self._writes -= 1
+        if errorno is not None and self._write_error is None:
+            self._write_error = uv_error(errorno, error)
+        if self._closing:
+            if errorno is not None or not self._writes:
+                self._closing = False
+                handle.close()
+        elif errorno is not None or not self._writes:
+            self._wake('_write_waiter')
+
+    def do_handshake(self, seconds):
+        while not self.handshake_done:
+            if self._error is not None:
+                raise self._error
+            if self._eof:
+                raise error(errno.ECONNRESET, 'Connection closed during the TLS handshake')
+            if self._write_error is not None:
+                raise self._write_error
+            # Starts the handshake on the client side
+            self._process()
+            if not self.handshake_done:
+                self._wait('_handshake_waiter', seconds)
+        if self._hostname is not None:
+            hostname, self._hostname = self._hostname, None
+            self._match_hostname(hostname)
+
+    def _match_hostname(self, hostname):
+        cert = self._conn.get_peer_certificate()
+        if isinstance(hostname, bytes):
+            hostname = hostname.decode('ascii')
+        try:
+            if cert is None:
+                raise CertificateError('no certificate to match %r against' % (hostname, ))
+            match_hostname(_decode_certificate(cert), hostname)
+        except CertificateError as e:
+            # Nothing the peer sent is handed out, and nothing is sent to it
+            self._error = self._write_error = e
+            self._chunks.clear()
+            self._offset = self._buffered = 0
+            raise
+
+    def wait_writable(self, seconds):
+        """Block until libuv has written the ciphertext it was given before."""
+        if self.closed:
+            raise error(errno.EBADF, os.strerror(errno.EBADF))
+        while self._writes and self._write_error is None:
+            if seconds == 0.0:
+                raise error(errno.EWOULDBLOCK, os.strerror(errno.EWOULDBLOCK))
+            self._wait('_write_waiter', seconds)
+        if self._write_error is not None:
+            raise self._write_error
+
+    def write(self, data, offset=0):
+        """Encrypt up to write_buffer_size bytes of data, starting at offset, and hand them to libuv. Return how many."""
+        size = min(len(data) - offset, self.write_buffer_size)
+        conn = self._conn
+        view = memoryview(data)[offset:offset + size]
+        while view:
+            try:
+                # With a memory BIO OpenSSL takes it all, a record at a time
+                n = conn.send(view[:self.chunk_size].tobytes())
+            except SSL.Error as e:
+                raise error(errno.EPROTO, 'TLS error: %s' % (e, ))
+            view = view[n:]
+            self._flush()
+        return size
+
+    def shutdown(self):
+        if not self.closed and self.handshake_done:
+            try:
+                self._conn.shutdown()
+            except SSL.Error:
+                pass
+            self._flush()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self._reading:
+            self.handle.stop_read()
+            self._reading = False
+        if self._transport is None:
+            if self._writes and self._write_error is None:
+                # The handle is closed by _on_write once the ciphertext is written
+                self._closing = True
+            else:
+                self.handle.close()
+        for attr in ('_read_waiter', '_write_waiter', '_handshake_waiter'):
+            self._wake_later(attr, 'throw', cancel_wait_error)
+
+
+class TLSSocket(object):
+    """A connected gevent or uvent socket with TLS on top.
+
+    Data transfer methods work on plaintext, the rest is delegated to the
+    wrapped socket. The socket timeout applies to each call.
+    """
+
+    def __init__(self, sock, context, server_side=False, server_hostname=None, do_handshake_on_connect=True):
+        self._sock = sock
+        self._stream = _TLSStream(get_hub().loop._loop, sock, context, server_side, server_hostname)
+        if do_handshake_on_connect:
+            try:
+                self.do_handshake()
+            except:
+                # As the ssl module does, the wrapped socket is left alone
+                self._stream.close()
+                raise
+
+    def __repr__(self):
+        return '<%s at 0x%x %r>' % (self.__class__.__name__, id(self), self._sock)
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+    @property
+    def timeout(self):
+        return self._sock.timeout
+
+    def do_handshake(self):
+        self._stream.do_handshake(self._sock.timeout)
+
+    @property
+    def connection(self):
+        """The OpenSSL.SSL.Connection, to look at the peer certificate, cipher, protocol and so on."""
+        return self._stream._conn
+
+    def getpeercert(self, binary_form=False):
+        """Return the peer certificate as ssl.SSLSocket.getpeercert does, None if there is none.
+
+        Unlike the ssl module the dictionary is returned whether the certificate
+        was verified or not, see the verify mode of the context.
+        """
+        cert = self._stream._conn.get_peer_certificate()
+        if cert is None:
+            return None
+        if binary_form:
+            from OpenSSL import crypto
+            return crypto.dump_certificate(crypto.FILETYPE_ASN1, cert)
+        return _decode_certificate(cert)
+
+    def cipher(self):
+        conn = self._stream._conn
+        return conn.get_cipher_name(), conn.get_cipher_version(), conn.get_cipher_bits()
+
+    def recv(self, bufsize, flags=0):
+        stream = self._stream
+        stream.do_handshake(self._sock.timeout)
+        if not bufsize or not stream.wait_readable(self._sock.timeout):
+            return b''
+        return stream.read(bufsize)
+
+    def recv_into(self, buffer, nbytes=0, flags=0):
+        if not nbytes:
+            nbytes = len(buffer)
+        data = self.recv(nbytes)
+        buffer[:len(data)] = data
+        return len(data)
+
+    read = recv
+
+    def send(self, data, flags=0):
+        stream = self._stream
+        timeout = self._sock.timeout
+        stream.do_handshake(timeout)
+        if isinstance(data, unicode):
+            data = data.encode()
+        if not len(data):
+            return 0
+        # As uvent sockets do: only what was accepted is returned, no timeout is raised once it was
+        stream.wait_writable(timeout)
+        return stream.write(data)
+
+    def sendall(self, data, flags=0):
+        stream = self._stream
+        timeout = self._sock.timeout
+        stream.do_handshake(timeout)
+        if isinstance(data, unicode):
+            data = data.encode()
+        offset = 0
+        while offset < len(data):
+            stream.wait_writable(timeout)
+            offset += stream.write(data, offset)
+
+    write = sendall
+
+    def makefile(self, mode='r', bufsize=-1):
+        return _fileobject(self, mode, bufsize, close=True)
+
+    def unwrap(self):
+        """Send a close_notify alert and return the wrapped socket."""
+        self._stream.shutdown()
+        self._stream.close()
+        return self._sock
+
+    def shutdown(self, how):
+        self._stream.shutdown()
+        self._sock.shutdown(how)
+
+    def close(self):
+        self._stream.close()
+        self._sock.close()
+
+
+def wrap_socket(sock, context, server_side=False, server_hostname=None, do_handshake_on_connect=True):
+    """Return a TLSSocket for the connected socket sock, using the OpenSSL.SSL.Context context."""
+    return TLSSocket(sock, context, server_side, server_hostname, do_handshake_on_connect)
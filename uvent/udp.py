@@ -0,0 +1,190 @@
+# coding=utf8
+
+# Copyright (C) 2012 Saúl Ibarra Corretgé <saghul@gmail.com>
+#
+
+"""Cooperative UDP endpoint which receives and sends datagrams in batches.
+
+Datagrams received by the pyuv.UDP handle are queued and the waiting
+greenlet is woken up once per loop iteration, so it gets all the datagrams
+which arrived in that iteration with a single switch. Sending a batch hands
+all the datagrams to libuv, which sends them when the socket is writable,
+and only the last one of each batch gets a completion callback.
+"""
+
+from __future__ import absolute_import
+
+__all__ = ['UDPEndpoint']
+
+import pyuv
+
+from collections import deque
+
+from gevent.hub import get_hub
+from gevent.socket import AF_INET, SOCK_DGRAM, error, getaddrinfo, inet_pton
+
+from .util import uv_error
+from .waitable import Waitable, cancel_wait_error
+
+
+class UDPEndpoint(Waitable):
+    """A UDP endpoint.
+
+    At most `queue_size` received datagrams are queued, if the queue is full
+    reading is paused and the kernel buffers (or drops) further datagrams.
+    Senders block while `max_pending_batches` batches have not been sent yet.
+    """
+
+    _waitable_kind = 'endpoint'
+
+    def __init__(self, address=None, family=AF_INET, queue_size=4096, max_pending_batches=64):
+        self.hub = get_hub()
+        self.family = family
+        self.queue_size = queue_size
+        self.max_pending_batches = max_pending_batches
+        self._handle = pyuv.UDP(self.hub.loop._loop)
+        self._queue = deque()
+        self._error = None
+        self._send_error = None
+        self._pending = 0
+        self._reading = False
+        self._read_waiter = None
+        self._write_waiter = None
+        self._closed = False
+        if address is not None:
+            self.bind(address)
+
+    def _resolve(self, address):
+        try:
+            inet_pton(self.family, address[0])
+        except (error, TypeError, ValueError):
+            return getaddrinfo(address[0] or None, address[1], self.family, SOCK_DGRAM)[0][-1]
+        return address
+
+    def _check_closed(self):
+        if self._closed:
+            raise error(9, 'Bad file descriptor')
+
+    def bind(self, address):
+        self._check_closed()
+        try:
+            self._handle.bind(self._resolve(address))
+        except pyuv.error.UDPError as e:
+            raise uv_error(e.args[0], error)
+        self._start_reading()
+
+    def getsockname(self):
+        return self._handle.getsockname()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._handle.close()
+        self._wake_later('_read_waiter', 'throw', cancel_wait_error)
+        self._wake_later('_write_waiter', 'throw', cancel_wait_error)
+
+    def _start_reading(self):
+        if not self._reading:
+            self._handle.start_recv(self._on_recv)
+            self._reading = True
+
+    def _on_recv(self, handle, address, flags, data, errorno):
+        if errorno is not None:
+            self._error = uv_error(errorno, error)
+        else:
+            self._queue.append((data, address))
+            if len(self._queue) >= self.queue_size:
+                handle.stop_recv()
+                self._reading = False
+        self._wake_soon('_read_waiter')
+
+    def _on_send(self, handle, errorno):
+        self._pending -= 1
+        if errorno is not None:
+            self._send_error = uv_error(errorno, error)
+        if self._pending < self.max_pending_batches:
+            self._wake('_write_waiter')
+
+    def _wait_readable(self, seconds):
+        self._check_closed()
+        self._start_reading()
+        while not self._queue:
+            if self._error is not None:
+                exc, self._error = self._error, None
+                raise exc
+            self._wait('_read_waiter', seconds)
+
+    def _dequeued(self):
+        if not self._reading and not self._closed and len(self._queue) < self.queue_size:
+            self._start_reading()
+
+    def recv_many(self, max_packets=64, timeout=None):
+        """Wait for datagrams and return a list with up to max_packets (data, address) tuples."""
+        self._wait_readable(timeout)
+        queue = self._queue
+        if len(queue) <= max_packets:
+            result = list(queue)
+            queue.clear()
+        else:
+            popleft = queue.popleft
+            result = [popleft() for i in xrange(max_packets)]
+        self._dequeued()
+        return result
+
+    def recv_many_into(self, buffers, timeout=None):
+        """Wait for datagrams and copy them into the given (preallocated) buffers, one per buffer.
+
+        Returns a list of (nbytes, address) tuples, datagrams which don't fit in
+        their buffer are truncated.
+        """
+        self._wait_readable(timeout)
+        queue = self._queue
+        popleft = queue.popleft
+        result = []
+        for buf in buffers:
+            if not queue:
+                break
+            data, address = popleft()
+            n = min(len(data), len(buf))
+            buf[:n] = data if n == len(data) else data[:n]
+            result.append((n, address))
+        self._dequeued()
+        return result
+
+    def send_many(self, datagrams, timeout=None):
+        """Send an iterable of (data, address) tuples. Returns the number of datagrams queued."""
+        self._check_closed()
+        if self._send_error is not None:
+            exc, self._send_error = self._send_error, None
+            raise exc
+        while self._pending >= self.max_pending_batches:
+            self._wait('_write_waiter', timeout)
+        send = self._handle.send
+        resolved = {}
+        last = None
+        count = 0
+        try:
+            for data, address in datagrams:
+                if last is not None:
+                    send(last[1], last[0])
+                    count += 1
+                if not isinstance(data, bytes):
+                    # libuv sends the datagram later on, the data must not change in the meantime
+                    data = memoryview(data).tobytes()
+                try:
+                    address = resolved[address]
+                except KeyError:
+                    address = resolved[address] = self._resolve(address)
+                last = data, address
+            if last is not None:
+                send(last[1], last[0], self._on_send)
+                self._pending += 1
+                count += 1
+        except pyuv.error.UDPError as e:
+            raise uv_error(e.args[0], error)
+        return count
+
+    def sendto(self, data, address, timeout=None):
+        self.send_many(((data, address),), timeout)
+        return len(data)
@@ -1,8 +1,15 @@
 
-__all__ = ['set_nonblocking', 'close_fd', 'SharedPoll']
+__all__ = ['set_nonblocking', 'close_fd', 'uv_error', 'pool_usable', 'pool_used', 'SharedPoll', 'PollBatcher', 'TimerWheel', 'SharedTimer', 'SharedStat']
 
+import errno
+import operator
 import os
 import pyuv
+import sys
+import traceback
+
+# Raised when starting a closed handle, pyuv 0.10 raises it but doesn't export it
+_HandleClosedError = getattr(pyuv.error, 'HandleClosedError', pyuv.error.HandleError)
 
 
 def set_nonblocking(fd):
@@ -18,26 +25,204 @@ def close_fd(fd):
         pass
 
 
+# Process in which the libuv thread pool was started, its threads are gone in forked children
+_pool_pid = None
+
+
+def pool_usable():
+    """Whether the libuv thread pool works in this process, it doesn't if it was started before fork."""
+    return _pool_pid is None or _pool_pid == os.getpid()
+
+
+def pool_used():
+    """Record that this process started the libuv thread pool."""
+    global _pool_pid
+    if _pool_pid is None:
+        _pool_pid = os.getpid()
+
+
+def uv_error(errorno, cls=IOError):
+    """Build an exception of the given class out of a pyuv error code.
+
+    The errno module equivalent of the code is used, if there is one.
+    """
+    name = pyuv.errno.errorcode.get(errorno, '')
+    code = getattr(errno, name[3:], None) if name.startswith('UV_') else None
+    return cls(errorno if code is None else code, pyuv.errno.strerror(errorno))
+
+
+class _PollDispatcher(object):
+    """Per file descriptor registry of SharedPoll instances.
+
+    Readers and writers are kept in sets, so adding and removing them is O(1).
+    The only reader (writer) is also kept aside, so the common case of one
+    reader and / or one writer per fd doesn't need to loop.
+
+    If the loop has a PollBatcher, changes to the events mask are applied to
+    the Poll handle by the batcher right before the loop polls for i/o.
+    """
+    __slots__ = ('fd', 'poll', 'batcher', 'count', 'mask', 'events', 'dirty',
+                 'readers', 'writers', 'reader', 'writer')
+
+    def __init__(self, loop, fd):
+        self.fd = fd
+        self.poll = pyuv.Poll(loop, fd)
+        self.batcher = loop._poll_batcher
+        self.count = 0
+        self.mask = 0
+        self.events = 0
+        self.dirty = False
+        self.readers = set()
+        self.writers = set()
+        self.reader = None
+        self.writer = None
+
+    def update(self, shared, old_events, events):
+        changed = old_events ^ events
+        if changed & pyuv.UV_READABLE:
+            readers = self.readers
+            if events & pyuv.UV_READABLE:
+                readers.add(shared)
+            else:
+                readers.discard(shared)
+            self.reader = next(iter(readers)) if len(readers) == 1 else None
+        if changed & pyuv.UV_WRITABLE:
+            writers = self.writers
+            if events & pyuv.UV_WRITABLE:
+                writers.add(shared)
+            else:
+                writers.discard(shared)
+            self.writer = next(iter(writers)) if len(writers) == 1 else None
+        if changed:
+            mask = 0
+            if self.readers:
+                mask |= pyuv.UV_READABLE
+            if self.writers:
+                mask |= pyuv.UV_WRITABLE
+            if mask != self.mask:
+                self.mask = mask
+                if self.batcher is None:
+                    self.apply()
+                else:
+                    self.batcher.add(self)
+
+    def apply(self):
+        mask = self.mask
+        if mask != self.events:
+            self.events = mask
+            if mask:
+                self.poll.start(mask, self._poll_cb)
+            else:
+                self.poll.stop()
+            return True
+        return False
+
+    def close(self):
+        if self.dirty:
+            self.batcher.discard(self)
+        self.poll.close()
+        self.poll = None
+
+    def _poll_cb(self, handle, events, errorno):
+        if errorno is not None:
+            # libuv stops the handle on error
+            self.events = 0
+            # Signal both readability and writability so that the error can be detected
+            events = pyuv.UV_READABLE | pyuv.UV_WRITABLE
+        if events & pyuv.UV_READABLE:
+            if self.reader is not None:
+                self.reader._callback()
+            else:
+                self._fan_out(self.readers, pyuv.UV_READABLE)
+        if events & pyuv.UV_WRITABLE:
+            if self.writer is not None:
+                self.writer._callback()
+            else:
+                self._fan_out(self.writers, pyuv.UV_WRITABLE)
+
+    @staticmethod
+    def _fan_out(shared_polls, event):
+        # Callbacks may start or stop other instances, iterate over a copy
+        for shared in list(shared_polls):
+            if shared._events & event:
+                shared._callback()
+
+
+class PollBatcher(object):
+    """Applies pending events mask changes of all fds once per loop iteration.
+
+    A greenlet which goes recv -> would block -> send -> would block changes the
+    interest for its fd several times per iteration, often ending up where it
+    started. With a batcher only the final mask is applied, right before polling.
+    """
+
+    def __init__(self, loop):
+        self._dirty = set()
+        self.changes = 0
+        self.updates = 0
+        # Prepare handles run in reverse start order, this one is started when the loop is created so
+        # it runs after those of the watchers and run_callback. Only the one UVLoop counts the time spent
+        # polling for i/o with runs after it, see UVLoop._start_stats
+        self._handle = pyuv.Prepare(loop)
+        self._handle.start(self._flush)
+        self._handle.unref()
+
+    def restart(self):
+        # Start the handle again, so that it runs before the prepare handles started meanwhile
+        self._handle.stop()
+        self._handle.start(self._flush)
+
+    @property
+    def saved(self):
+        """Number of Poll handle updates avoided by batching."""
+        return self.changes - self.updates - len(self._dirty)
+
+    def add(self, dispatcher):
+        self.changes += 1
+        if not dispatcher.dirty:
+            dispatcher.dirty = True
+            if not self._dirty:
+                # Keep the loop alive until the changes are applied
+                self._handle.ref()
+            self._dirty.add(dispatcher)
+
+    def discard(self, dispatcher):
+        dispatcher.dirty = False
+        self._dirty.discard(dispatcher)
+        if not self._dirty:
+            self._handle.unref()
+
+    def close(self):
+        self._dirty.clear()
+        self._handle.close()
+
+    def _flush(self, handle):
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, set()
+        for dispatcher in dirty:
+            dispatcher.dirty = False
+            if dispatcher.apply():
+                self.updates += 1
+        self._handle.unref()
+
+
 class SharedPoll(object):
     """A shared poll handle.
 
     This is like pyuv.Poll, but multiple instances can be active
     for the same file descriptor.
     """
+    __slots__ = ('loop', '_dispatcher', '_events', '_callback', '_closed')
 
     def __init__(self, loop, fd):
         self.loop = loop
         try:
-            poll = loop._poll_handles[fd]
+            dispatcher = loop._poll_handles[fd]
         except KeyError:
-            poll = pyuv.Poll(loop, fd)
-            poll._count = 0
-            poll._events = 0
-            poll._readers = []
-            poll._writers = []
-            loop._poll_handles[fd] = poll
-        poll._count += 1
-        self._poll = poll
+            dispatcher = loop._poll_handles[fd] = _PollDispatcher(loop, fd)
+        dispatcher.count += 1
+        self._dispatcher = dispatcher
         self._events = 0
         self._callback = None
         self._closed = False
@@ -46,61 +231,44 @@ class SharedPoll(object):
     def active(self):
         if self._closed or not self._callback:
             return False
-        return self._poll.active
+        return self._dispatcher.dirty or self._dispatcher.poll.active
 
     @property
     def fileno(self):
         if self._closed:
             return -1
-        return self._poll.fileno()
+        return self._dispatcher.fd
 
     def start(self, events, callback):
-        if self._events:
-            self.stop()
+        if self._closed:
+            raise _HandleClosedError('Handle is closing/closed')
+        old_events = self._events
         self._events = events
         self._callback = callback
-        if events & pyuv.UV_READABLE:
-            self._poll._readers.append(callback)
-        if events & pyuv.UV_WRITABLE:
-            self._poll._writers.append(callback)
-        self._adjust()
+        self._dispatcher.update(self, old_events, events)
 
     def stop(self):
         if not self._callback:
             return
-        if self._events & pyuv.UV_READABLE:
-            self._poll._readers.remove(self._callback)
-        if self._events & pyuv.UV_WRITABLE:
-            self._poll._writers.remove(self._callback)
+        old_events = self._events
         self._events = 0
         self._callback = None
-        self._adjust()
+        self._dispatcher.update(self, old_events, 0)
 
     def close(self):
         if self._closed:
             return
-        self._poll._count -= 1
         self.stop()
-        if self._poll._count > 0:
-            return
-        del self.loop._poll_handles[self._poll.fileno()]
-        self._poll.close()
-        self._poll = None
+        dispatcher, loop = self._dispatcher, self.loop
+        self._dispatcher = None
         self.loop = None
+        # Closed even if other instances still use the fd, or __del__ would count it again
         self._closed = True
-
-    def _adjust(self):
-        mask = 0
-        if self._poll._readers:
-            mask |= pyuv.UV_READABLE
-        if self._poll._writers:
-            mask |= pyuv.UV_WRITABLE
-        if mask and mask != self._poll._events:
-            self._poll._events = mask
-            self._poll.start(mask, self._poll_callback)
-        elif not mask and mask != self._poll._events:
-            self._poll._events = mask
-            self._poll.stop()
+        dispatcher.count -= 1
+        if dispatcher.count > 0:
+            return
+        del loop._poll_handles[dispatcher.fd]
+        dispatcher.close()
 
     def ref(self):
         raise NotImplementedError
@@ -111,19 +279,508 @@ class SharedPoll(object):
     def __del__(self):
         self.close()
 
-    @staticmethod
-    def _poll_callback(handle, events, errorno):
-        if errorno is not None:
-            # Signal both readability and writability so that the error can be detected
-            for callback in handle._readers:
-                callback()
-            for callback in handle._writers:
-                callback()
+
+class TimerWheel(object):
+    """A hierarchical timing wheel.
+
+    Any number of SharedTimer pseudo-handles are multiplexed onto a single
+    pyuv.Timer. Starting and stopping a timer is O(1), timers expire with
+    the configured resolution (in seconds) and never earlier than requested.
+    """
+
+    BITS = 8
+    SIZE = 1 << BITS
+    MASK = SIZE - 1
+    LEVELS = 4
+
+    def __init__(self, loop, resolution):
+        self.loop = loop
+        self._tick = max(1, int(resolution * 1000))
+        self._handle = pyuv.Timer(loop)
+        self._handle.unref()
+        self._wheels = [[set() for i in range(self.SIZE)] for j in range(self.LEVELS)]
+        self._counts = [0] * self.LEVELS
+        self._count = 0
+        self._refs = 0
+        self._seq = 0
+        self._current = loop.now() // self._tick
+        self._next = None
+
+    def _expiry(self, timeout):
+        # Round up, a timer must never fire before its timeout
+        return -(-(self.loop.now() + int(timeout * 1000)) // self._tick)
+
+    def add(self, timer, timeout):
+        if not self._count:
+            self._current = max(self._current, self.loop.now() // self._tick)
+        self._seq += 1
+        timer._seq = self._seq
+        timer._expires = self._expiry(timeout)
+        self._link(timer, self._current + 1)
+        if self._next is None or timer._expires < self._next:
+            self._schedule(max(timer._expires, self._current + 1))
+
+    def remove(self, timer):
+        self._unlink(timer)
+        if not self._count:
+            self._handle.stop()
+            self._next = None
+
+    def incref(self):
+        self._refs += 1
+        if self._refs == 1:
+            self._handle.ref()
+
+    def decref(self):
+        self._refs -= 1
+        if not self._refs:
+            self._handle.unref()
+
+    def _link(self, timer, base):
+        expires = max(timer._expires, base)
+        delta = expires - base
+        level = 0
+        while delta >= self.SIZE:
+            if level == self.LEVELS - 1:
+                # Too far in the future, it will be re-linked when this slot expires
+                expires = base + (1 << (self.BITS * self.LEVELS)) - 1
+                break
+            delta >>= self.BITS
+            level += 1
+        slot = self._wheels[level][(expires >> (self.BITS * level)) & self.MASK]
+        slot.add(timer)
+        timer._slot = slot
+        timer._level = level
+        self._counts[level] += 1
+        self._count += 1
+        if timer._ref:
+            self.incref()
+
+    def _unlink(self, timer):
+        timer._slot.discard(timer)
+        timer._slot = None
+        self._counts[timer._level] -= 1
+        self._count -= 1
+        if timer._ref:
+            self.decref()
+
+    def _schedule(self, tick):
+        self._next = tick
+        delay = max(0, tick * self._tick - self.loop.now())
+        self._handle.start(self._on_tick, delay / 1000.0, 0.0)
+
+    def _on_tick(self, handle):
+        # Timers started from callbacks must not reschedule the handle, it's done below
+        self._next = 0
+        now = self.loop.now() // self._tick
+        while self._current < now and self._count:
+            if not self._counts[0]:
+                # Nothing can expire before the next cascade, skip ahead
+                boundary = ((self._current >> self.BITS) + 1) << self.BITS
+                if boundary > now:
+                    self._current = now
+                    break
+                self._current = boundary - 1
+            self._current += 1
+            tick = self._current
+            index = tick & self.MASK
+            if not index:
+                self._cascade(tick)
+            slot = self._wheels[0][index]
+            if slot:
+                self._expire(slot, tick)
+        if self._count:
+            self._schedule(self._next_expiry())
+        else:
+            self._handle.stop()
+            self._next = None
+
+    def _cascade(self, tick):
+        for level in range(1, self.LEVELS):
+            index = (tick >> (self.BITS * level)) & self.MASK
+            slot = self._wheels[level][index]
+            if slot:
+                timers = list(slot)
+                for timer in timers:
+                    self._unlink(timer)
+                for timer in timers:
+                    self._link(timer, tick)
+            if index:
+                break
+
+    def _expire(self, slot, tick):
+        timers = sorted(slot, key=_seq_getter) if len(slot) > 1 else list(slot)
+        for timer in timers:
+            if timer._slot is not slot:
+                # Stopped or restarted by a previous callback
+                continue
+            self._unlink(timer)
+            if timer._expires > tick:
+                self._link(timer, tick + 1)
+                continue
+            if timer.repeat:
+                timer._expires = self._expiry(timer.repeat)
+                self._link(timer, tick + 1)
+            try:
+                timer._callback(timer)
+            except Exception:
+                excepthook = self.loop.excepthook
+                if excepthook is not None:
+                    excepthook(*sys.exc_info())
+                else:
+                    traceback.print_exc()
+
+    def _next_expiry(self):
+        base = self._current + 1
+        boundary = ((self._current >> self.BITS) + 1) << self.BITS
+        if self._counts[0]:
+            wheel = self._wheels[0]
+            for tick in range(base, boundary):
+                if wheel[tick & self.MASK]:
+                    return tick
+        return boundary
+
+
+_seq_getter = operator.attrgetter('_seq')
+
+
+class SharedTimer(object):
+    """A timer pseudo-handle.
+
+    This is like pyuv.Timer, but all instances for a given loop are driven
+    by the loop's TimerWheel, so no libuv handle is created per timer.
+    """
+    __slots__ = ('loop', 'repeat', 'watcher', '_wheel', '_callback', '_expires', '_seq', '_slot', '_level', '_ref', '_closed')
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.repeat = 0.0
+        # Set by the uvent watcher which uses the timer, as on pyuv handles
+        self.watcher = None
+        self._wheel = loop._timer_wheel
+        self._callback = None
+        self._expires = 0
+        self._seq = 0
+        self._slot = None
+        self._level = 0
+        self._ref = True
+        self._closed = False
+
+    @property
+    def active(self):
+        return self._slot is not None
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def start(self, callback, timeout, repeat):
+        if self._closed:
+            raise _HandleClosedError('Handle is closing/closed')
+        if self._slot is not None:
+            self._wheel.remove(self)
+        self._callback = callback
+        self.repeat = repeat
+        self._wheel.add(self, timeout)
+
+    def stop(self):
+        if self._slot is not None:
+            self._wheel.remove(self)
+
+    def again(self):
+        if self._callback is None:
+            raise RuntimeError('timer not started')
+        if self.repeat:
+            self.stop()
+            self._wheel.add(self, self.repeat)
+
+    def close(self):
+        if self._closed:
             return
-        if events & pyuv.UV_READABLE:
-            for callback in handle._readers:
-                callback()
-        if events & pyuv.UV_WRITABLE:
-            for callback in handle._writers:
-                callback()
+        self.stop()
+        self._callback = None
+        self._closed = True
+
+    def ref(self):
+        if not self._ref:
+            self._ref = True
+            if self._slot is not None:
+                self._wheel.incref()
+
+    def unref(self):
+        if self._ref:
+            self._ref = False
+            if self._slot is not None:
+                self._wheel.decref()
+
+
+class _StatEntry(object):
+    """A watched path, its last known attributes and the SharedStat instances watching it."""
+    __slots__ = ('path', 'name', 'directory', 'attr', 'error', 'shared', 'dirty', 'known', 'pending')
+
+    def __init__(self, path, name, directory):
+        self.path = path
+        self.name = name
+        self.directory = directory
+        self.attr = None
+        self.error = None
+        self.shared = set()
+        self.dirty = False
+        # Whether the first stat completed, and whether a stat is in progress
+        self.known = False
+        self.pending = False
+
+
+class _StatDirectory(object):
+    """A FSEvent handle on a directory, shared by the entries of the watched paths in it."""
+    __slots__ = ('path', 'handle', 'entries', 'refs')
+
+    def __init__(self, path):
+        self.path = path
+        self.handle = None
+        self.entries = {}
+        self.refs = 0
+
+
+class _StatDispatcher(object):
+    """Per loop registry of SharedStat instances.
+
+    Directories are watched rather than the paths themselves, so a single FSEvent
+    (inotify) handle serves all the watched paths in a directory, and files which
+    are replaced by a rename or created later are noticed as well. Events only
+    mark the entry of the path they are about, a Check handle stats each marked
+    entry once after the loop polled for i/o, and the callbacks run if the
+    attributes actually changed. Paths are stat'ed asynchronously, in libuv's
+    thread pool, so a slow file system doesn't block the loop.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.events = 0
+        self.stats = 0
+        self._directories = {}
+        self._dirty = set()
+        self._abandoned = False
+        self._orphans = None
+        self._check = pyuv.Check(loop)
+        self._check.start(self._flush)
+        self._check.unref()
+
+    def _stat(self, entry):
+        self.stats += 1
+        if not pool_usable():
+            # Forked child of a process which used the thread pool, stat synchronously
+            try:
+                attr, error = pyuv.fs.stat(self.loop, entry.path), None
+            except pyuv.error.FSError as e:
+                attr, error = None, e.args[0]
+            self._on_stat(entry, attr, error)
+            return
+        entry.pending = True
+        try:
+            pyuv.fs.stat(self.loop, entry.path, lambda loop, path, attr, error: self._on_stat(entry, attr, error))
+        except pyuv.error.FSError as e:
+            self._on_stat(entry, None, e.args[0])
+        else:
+            pool_used()
+
+    def add(self, shared):
+        dirname, name = os.path.split(shared.path)
+        directory = self._directories.get(dirname)
+        if directory is None:
+            directory = _StatDirectory(dirname)
+            # Raises FSEventError if the directory can't be watched
+            directory.handle = pyuv.fs.FSEvent(self.loop, dirname, lambda handle, filename, events, error: self._on_event(directory, filename, error), 0)
+            directory.handle.unref()
+            self._directories[dirname] = directory
+        entry = directory.entries.get(name)
+        if entry is None:
+            entry = directory.entries[name] = _StatEntry(shared.path, name, directory)
+            entry.shared.add(shared)
+            self._stat(entry)
+        else:
+            entry.shared.add(shared)
+        if shared._ref:
+            self.ref(directory)
+        return entry
+
+    def remove(self, shared):
+        entry = shared._entry
+        entry.shared.discard(shared)
+        directory = entry.directory
+        if shared._ref:
+            self.unref(directory)
+        if not entry.shared:
+            entry.dirty = False
+            self._dirty.discard(entry)
+            del directory.entries[entry.name]
+            if not directory.entries and self._directories.get(directory.path) is directory:
+                del self._directories[directory.path]
+                self._close(directory)
+
+    def ref(self, directory):
+        directory.refs += 1
+        if directory.refs == 1 and directory.handle is not None:
+            directory.handle.ref()
+
+    def unref(self, directory):
+        directory.refs -= 1
+        if not directory.refs and directory.handle is not None:
+            directory.handle.unref()
+
+    def _close(self, directory):
+        handle, directory.handle = directory.handle, None
+        # After fork the inotify descriptor is shared with the parent, closing the handle would remove its watch
+        if handle is not None and not self._abandoned:
+            handle.close()
+
+    def abandon(self):
+        # Called by UVLoop.reinit, the loop is not used anymore. The handles are kept alive,
+        # deallocating them would close them too
+        self._abandoned = True
+        self._orphans = [directory.handle for directory in self._directories.values() if directory.handle is not None]
+        self._dirty.clear()
 
+    def _on_event(self, directory, filename, error):
+        self.events += 1
+        if error is not None:
+            self._fall_back(directory)
+            return
+        entry = directory.entries.get(filename)
+        if entry is not None and not entry.dirty:
+            entry.dirty = True
+            self._dirty.add(entry)
+
+    def _fall_back(self, directory):
+        # The directory is gone (or can't be watched anymore), its paths are polled from now on
+        if self._directories.get(directory.path) is directory:
+            del self._directories[directory.path]
+        self._close(directory)
+        for entry in directory.entries.values():
+            self._dirty.discard(entry)
+            for shared in list(entry.shared):
+                shared._fall_back()
+        directory.entries.clear()
+
+    def _flush(self, handle):
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, set()
+        for entry in dirty:
+            if not entry.dirty:
+                continue
+            if entry.pending:
+                # Stat'ed again once the current stat completes
+                self._dirty.add(entry)
+                continue
+            entry.dirty = False
+            self._stat(entry)
+
+    def _on_stat(self, entry, attr, error):
+        entry.pending = False
+        if self._abandoned or not entry.shared:
+            # Stopped (or forked) in the meantime
+            return
+        if not entry.known:
+            entry.known = True
+            if not entry.dirty:
+                entry.attr, entry.error = attr, error
+            # Otherwise the path changed while it was stat'ed, the result may or may not
+            # include the change: leave the attributes unknown so the next stat reports it
+            return
+        if attr == entry.attr and error == entry.error:
+            return
+        prev = entry.attr
+        entry.attr, entry.error = attr, error
+        # Callbacks may start or stop other instances, iterate over a copy
+        for shared in list(entry.shared):
+            if shared._entry is entry:
+                shared._callback(shared, prev, attr, error)
+        if error is not None and not os.path.isdir(entry.directory.path):
+            self._fall_back(entry.directory)
+
+
+class SharedStat(object):
+    """A stat pseudo-handle.
+
+    This is like pyuv.fs.FSPoll, but changes are noticed through the loop's
+    FSEvent handles (see _StatDispatcher) instead of calling stat periodically.
+    If the directory of the path can't be watched an actual FSPoll handle is
+    used, polling every `interval` seconds.
+    """
+    __slots__ = ('loop', 'path', 'interval', '_callback', '_entry', '_poll', '_ref', '_closed')
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.path = None
+        self.interval = 0
+        self._callback = None
+        self._entry = None
+        self._poll = None
+        self._ref = True
+        self._closed = False
+
+    @property
+    def active(self):
+        return self._entry is not None or (self._poll is not None and self._poll.active)
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def start(self, path, callback, interval):
+        if self._closed:
+            raise _HandleClosedError('Handle is closing/closed')
+        self.stop()
+        self.path = os.path.abspath(path)
+        self.interval = interval
+        self._callback = callback
+        dispatcher = self.loop._stat_dispatcher
+        if dispatcher is None:
+            dispatcher = self.loop._stat_dispatcher = _StatDispatcher(self.loop)
+        try:
+            self._entry = dispatcher.add(self)
+        except pyuv.error.FSEventError:
+            # The directory doesn't exist, or there are no inotify watches left
+            self._fall_back()
+
+    def _fall_back(self):
+        self._entry = None
+        if self._poll is None:
+            self._poll = pyuv.fs.FSPoll(self.loop)
+        self._poll.start(self.path, self._callback, self.interval)
+        if not self._ref:
+            self._poll.unref()
+
+    def stop(self):
+        if self._entry is not None:
+            self.loop._stat_dispatcher.remove(self)
+            self._entry = None
+        elif self._poll is not None and self._poll.active:
+            self._poll.stop()
+
+    def close(self):
+        if self._closed:
+            return
+        self.stop()
+        if self._poll is not None:
+            self._poll.close()
+            self._poll = None
+        self._callback = None
+        self._closed = True
+
+    def ref(self):
+        if not self._ref:
+            self._ref = True
+            if self._entry is not None:
+                self.loop._stat_dispatcher.ref(self._entry.directory)
+            elif self._poll is not None:
+                self._poll.ref()
+
+    def unref(self):
+        if self._ref:
+            self._ref = False
+            if self._entry is not None:
+                self.loop._stat_dispatcher.unref(self._entry.directory)
+            elif self._poll is not None:
+                self._poll.unref()
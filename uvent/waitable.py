@@ -0,0 +1,75 @@
+# coding=utf8
+
+# Copyright (C) 2012 Saúl Ibarra Corretgé <saghul@gmail.com>
+#
+
+"""Waiting for pyuv callbacks from greenlets.
+
+Kept apart from uvent.util, which the loop imports, so that the loop
+doesn't depend on the gevent hub.
+"""
+
+from __future__ import absolute_import
+
+__all__ = ['Waitable', 'timeout_error', 'cancel_wait_error']
+
+import errno
+
+from gevent.hub import ConcurrentObjectUseError, Waiter, get_hub
+from gevent.socket import error, timeout
+from gevent.timeout import Timeout
+
+timeout_error = timeout('timed out')
+cancel_wait_error = error(errno.EBADF, 'File descriptor was closed in another greenlet')
+
+
+class Waitable(object):
+    """Mixin for objects greenlets wait on until a pyuv callback wakes them up.
+
+    Each kind of wait has an attribute which holds the Waiter of the greenlet
+    blocked on it, or None. Only one greenlet can wait on each.
+    """
+
+    __slots__ = ()
+
+    # Used in the error raised when a second greenlet tries to wait
+    _waitable_kind = 'object'
+
+    # The run_callback callback scheduled by _wake_soon, if any
+    _wakeup = None
+
+    def _wait(self, attr, seconds):
+        if getattr(self, attr) is not None:
+            raise ConcurrentObjectUseError('This %s is already used by another greenlet' % self._waitable_kind)
+        waiter = Waiter()
+        setattr(self, attr, waiter)
+        timer = Timeout.start_new(seconds, timeout_error, ref=False) if seconds is not None else None
+        try:
+            waiter.get()
+        finally:
+            setattr(self, attr, None)
+            if timer is not None:
+                timer.cancel()
+
+    def _wake(self, attr):
+        # Must be called from the hub, i.e. from a pyuv callback
+        waiter = getattr(self, attr)
+        if waiter is not None:
+            setattr(self, attr, None)
+            waiter.switch(None)
+
+    def _wake_later(self, attr, method, *args):
+        waiter = getattr(self, attr)
+        if waiter is not None:
+            setattr(self, attr, None)
+            get_hub().loop.run_callback(getattr(waiter, method), *args)
+
+    def _wake_soon(self, attr):
+        # Wake up the waiter from a run_callback callback, so that libuv gets to deliver everything which
+        # is available in this loop iteration first
+        if getattr(self, attr) is not None and self._wakeup is None:
+            self._wakeup = get_hub().loop.run_callback(self._wake_now, attr)
+
+    def _wake_now(self, attr):
+        self._wakeup = None
+        self._wake(attr)
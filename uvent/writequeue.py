@@ -0,0 +1,167 @@
+# coding=utf8
+
+# Copyright (C) 2012 Saúl Ibarra Corretgé <saghul@gmail.com>
+#
+
+"""Vectored, buffered writes to stream sockets with watermark based backpressure.
+
+A response made of several buffers (headers, body chunks, trailers) is
+written with a single writev instead of being joined or sent piece by
+piece. Buffers are handed to a pyuv stream handle with writelines, libuv
+writes as much as the socket takes right away and the rest when it
+becomes writable, without copying them (strings, bytearrays and
+memoryviews are referenced until written). Writers don't wait for their
+data to be sent, unless more than `high_watermark` bytes are queued: then
+they block until the queue drains below `low_watermark`.
+
+Example::
+
+    from uvent.writequeue import WriteQueue
+
+    queue = WriteQueue(sock)
+    queue.writelines([headers, memoryview(body)[:4096], trailers])
+    queue.drain()
+
+Python 2 has neither socket.sendmsg nor os.writev, the writev is done by
+libuv. The queue works with gevent and uvent sockets; for the latter it
+uses the socket's own handle, so writes made through the socket and the
+queue stay in order. For gevent sockets don't mix both, the queue has a
+handle of its own.
+"""
+
+from __future__ import absolute_import
+
+__all__ = ['WriteQueue']
+
+import errno
+import os
+import pyuv
+
+from collections import deque
+
+from gevent.hub import get_hub
+from gevent.socket import AF_UNIX, error
+
+from .util import uv_error
+from .waitable import Waitable, cancel_wait_error
+
+
+class WriteQueue(Waitable):
+    """Queue writes to a connected stream socket.
+
+    The socket timeout applies to waiting for the queue to drain. If the
+    socket is non-blocking (timeout 0.0) writes are refused with EWOULDBLOCK
+    while more than `high_watermark` bytes are queued, and so is drain while
+    anything is. Errors are raised by the write, writelines or drain call
+    after they happen.
+    """
+
+    # Writers block once this many bytes are queued...
+    high_watermark = 256 * 1024
+    # ...until no more than this many are left
+    low_watermark = 64 * 1024
+
+    _waitable_kind = 'queue'
+
+    def __init__(self, sock, high_watermark=None, low_watermark=None):
+        if high_watermark is not None:
+            self.high_watermark = high_watermark
+        if low_watermark is not None:
+            self.low_watermark = low_watermark
+        if self.low_watermark > self.high_watermark:
+            raise ValueError('low_watermark must not be greater than high_watermark')
+        self.sock = sock
+        self.loop = get_hub().loop
+        self._error = None
+        self._waiter = None
+        self._threshold = 0
+        # Bytes of each writelines call libuv hasn't completed yet; a uvent socket may write to the handle too,
+        # so its write_queue_size isn't only ours
+        self._sizes = deque()
+        self._queued = 0
+        self.closed = False
+        get_transport = getattr(sock, '_get_transport', None)
+        transport = get_transport() if get_transport is not None else None
+        if transport is not None and hasattr(transport, 'shutdown_read'):
+            # A uvent socket, share its stream handle
+            self._handle = transport.handle
+            self._own_handle = False
+        else:
+            handle = pyuv.Pipe(self.loop._loop) if sock.family == AF_UNIX else pyuv.TCP(self.loop._loop)
+            fd = os.dup(sock.fileno())
+            try:
+                handle.open(fd)
+            except Exception:
+                os.close(fd)
+                raise
+            self._handle = handle
+            self._own_handle = True
+
+    def __repr__(self):
+        return '<%s at 0x%x buffered=%d>' % (self.__class__.__name__, id(self), self.buffered)
+
+    @property
+    def buffered(self):
+        """Number of bytes queued and not written to the socket yet."""
+        return self._queued if not self.closed else 0
+
+    def _check(self):
+        if self.closed:
+            raise error(9, 'Bad file descriptor')
+        if self._error is not None:
+            raise self._error
+
+    def _on_write(self, handle, errorno):
+        self._queued -= self._sizes.popleft()
+        if errorno is not None and self._error is None:
+            self._error = uv_error(errorno, error)
+        if self._error is not None or self._queued <= self._threshold:
+            self._wake('_waiter')
+
+    def _wait_queued(self, threshold):
+        # Block until no more than threshold bytes are queued
+        while self._queued > threshold and self._error is None:
+            seconds = self.sock.timeout
+            if seconds == 0.0:
+                raise error(errno.EWOULDBLOCK, os.strerror(errno.EWOULDBLOCK))
+            self._threshold = threshold
+            self._wait('_waiter', seconds)
+        self._check()
+
+    def writelines(self, buffers):
+        """Queue a sequence of buffers, which are written with as few writev calls as possible."""
+        self._check()
+        buffers = [buf for buf in buffers if len(buf)]
+        if not buffers:
+            return
+        nonblocking = self.sock.timeout == 0.0
+        if nonblocking and self._queued > self.high_watermark:
+            # Refused before queueing them, the caller can't tell buffers which were queued from those which weren't
+            raise error(errno.EWOULDBLOCK, os.strerror(errno.EWOULDBLOCK))
+        try:
+            self._handle.writelines(buffers, self._on_write)
+        except pyuv.error.StreamError as e:
+            raise uv_error(e.args[0], error)
+        size = sum(len(buf) for buf in buffers)
+        self._sizes.append(size)
+        self._queued += size
+        if self._queued > self.high_watermark and not nonblocking:
+            self._wait_queued(self.low_watermark)
+
+    def write(self, data):
+        """Queue a single buffer."""
+        self.writelines((data, ))
+
+    def drain(self):
+        """Block until everything queued has been written."""
+        self._check()
+        self._wait_queued(0)
+
+    def close(self):
+        """Drop the queue, data which is still queued may not be written."""
+        if self.closed:
+            return
+        self.closed = True
+        if self._own_handle:
+            self._handle.close()
+        self._wake_later('_waiter', 'throw', cancel_wait_error)